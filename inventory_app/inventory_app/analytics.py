@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""Consumption analytics: usage rates, days of cover and reorder points from the issue history.
+
+NumPy is needed here; the app only imports this module when the reorder
+suggestions are asked for.
+"""
+import math
+import threading
+from collections import namedtuple
+from datetime import date, timedelta
+
+import numpy as np
+
+ANALYSIS_DAYS = 90          # days of issues the rates are measured over, today included
+LEAD_TIME_DAYS = 14         # days between placing an order and receiving it
+ORDER_CYCLE_DAYS = 30       # days of use a suggested order should cover
+SERVICE_Z = 1.65            # safety stock in standard deviations (about 95% of lead times covered)
+
+# Issues inside the window, each with its day number counted from :start
+ISSUES_SQL = '''
+SELECT id, item_id, CAST(julianday(substr(transaction_date, 1, 10)) - julianday(:start) AS INTEGER), quantity
+FROM transactions
+WHERE transaction_type = 'ISSUE' AND transaction_date >= :start AND id > :after AND opening_year IS NULL
+'''
+
+ISSUE_COUNT_SQL = '''
+SELECT COUNT(*) FROM transactions
+WHERE transaction_type = 'ISSUE' AND transaction_date >= :start AND transaction_date < :end AND opening_year IS NULL
+'''
+
+
+class ReorderSuggestion(namedtuple('ReorderSuggestion',
+                                   'item_id name quantity rate deviation days_of_cover reorder_point order_quantity')):
+    """One item at or below its reorder point; rates are per day."""
+    __slots__ = ()
+
+
+class ConsumptionModel:
+    """Daily issued quantities per item over the last ANALYSIS_DAYS, kept in memory.
+
+    The first refresh loads the window's issues in one query into an
+    items x days matrix. Later refreshes only read issues with a higher id
+    than any seen, and slide the window when the date changes. If the number
+    of issues in the window no longer matches the database (movements were
+    deleted or back-dated), the window is loaded again from scratch.
+    """
+
+    def __init__(self, days=ANALYSIS_DAYS):
+        self.days = days
+        self._lock = threading.Lock()
+        self._reset(None)
+
+    def _reset(self, start):
+        self.start = start
+        self.last_id = 0
+        self.ids = np.zeros(0, dtype=np.int64)              # item ids, sorted; one matrix row each
+        self.daily = np.zeros((0, self.days))
+        self.counts = np.zeros(self.days, dtype=np.int64)   # issues per day, for the consistency check
+
+    def refresh(self, db, today=None):
+        """Brings the matrix up to date and returns the reorder suggestions."""
+        with self._lock:
+            today = today or date.today()
+            start = today - timedelta(days=self.days - 1)
+            if self.start is None or not 0 <= (start - self.start).days < self.days:
+                self._reset(start)
+            elif start != self.start:
+                self._slide(start)
+            self._load(db)
+            expected = db.scalar(ISSUE_COUNT_SQL, {'start': start.isoformat(),
+                                                   'end': (today + timedelta(days=1)).isoformat()})
+            if expected != self.counts.sum():
+                self._reset(start)
+                self._load(db)
+            return self.suggestions(db)
+
+    def _slide(self, start):
+        shift = (start - self.start).days
+        self.daily = np.hstack([self.daily[:, shift:], np.zeros((len(self.ids), shift))])
+        self.counts = np.concatenate([self.counts[shift:], np.zeros(shift, dtype=np.int64)])
+        self.start = start
+
+    def _load(self, db):
+        rows = db.query(ISSUES_SQL, {'start': self.start.isoformat(), 'after': self.last_id})
+        if not rows:
+            return
+        data = np.array(rows, dtype=np.int64)
+        self.last_id = max(self.last_id, int(data[:, 0].max()))
+        data = data[data[:, 2] < self.days]         # dated after today
+
+        new_ids = np.setdiff1d(data[:, 1], self.ids)
+        if len(new_ids):
+            ids = np.union1d(self.ids, new_ids)
+            daily = np.zeros((len(ids), self.days))
+            daily[np.searchsorted(ids, self.ids)] = self.daily
+            self.ids, self.daily = ids, daily
+
+        item_rows = np.searchsorted(self.ids, data[:, 1])
+        cells = item_rows * self.days + data[:, 2]
+        self.daily += np.bincount(cells, weights=data[:, 3], minlength=self.daily.size).reshape(self.daily.shape)
+        self.counts += np.bincount(data[:, 2], minlength=self.days)
+
+    def suggestions(self, db):
+        """Rates, days of cover and reorder points for every item, in one pass.
+
+        Returns the items at or below their reorder point, fewest days of
+        cover first.
+        """
+        items = db.query("SELECT id, name, quantity FROM items ORDER BY id")
+        if not items:
+            return []
+        ids = np.array([row[0] for row in items], dtype=np.int64)
+        quantity = np.array([row[2] for row in items], dtype=float)
+
+        daily = np.zeros((len(ids), self.days))
+        if len(self.ids):
+            rows = np.minimum(np.searchsorted(self.ids, ids), len(self.ids) - 1)
+            known = self.ids[rows] == ids
+            daily[known] = self.daily[rows[known]]
+
+        rate = daily.mean(axis=1)
+        deviation = daily.std(axis=1, ddof=1)
+        cover = np.divide(quantity, rate, out=np.full(len(ids), np.inf), where=rate > 0)
+        reorder_point = rate * LEAD_TIME_DAYS + SERVICE_Z * deviation * math.sqrt(LEAD_TIME_DAYS)
+        order = np.ceil(np.maximum(reorder_point + rate * ORDER_CYCLE_DAYS - quantity, 0))
+
+        due = np.flatnonzero((rate > 0) & (quantity <= reorder_point))
+        due = due[np.argsort(cover[due], kind='stable')]
+        return [ReorderSuggestion(int(ids[i]), items[i][1], items[i][2], float(rate[i]), float(deviation[i]),
+                                  float(cover[i]), float(reorder_point[i]), int(order[i]))
+                for i in due]
+
+
+if __name__ == "__main__":
+    # python analytics.py [database]: prints the reorder suggestions and how long they took
+    import sys
+    import time
+    from database import DB_NAME, Database
+
+    db = Database(sys.argv[1] if len(sys.argv) > 1 else DB_NAME, readonly=True)
+    model = ConsumptionModel()
+    try:
+        started = time.perf_counter()
+        suggestions = model.refresh(db)
+        loaded = time.perf_counter()
+        model.refresh(db)
+        again = time.perf_counter()
+    finally:
+        db.close()
+    for s in suggestions:
+        print(f"{s.item_id}\t{s.name}\ton hand {s.quantity}\t{s.rate:.2f}/day\t"
+              f"cover {s.days_of_cover:.1f} d\treorder at {s.reorder_point:.0f}\torder {s.order_quantity}")
+    print(f"{len(suggestions)} suggestions; first load {(loaded - started) * 1000:.0f} ms, "
+          f"incremental refresh {(again - loaded) * 1000:.1f} ms")
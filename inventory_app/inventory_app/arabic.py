@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""Search keys for Arabic names: spelling variants folded so that typing finds them."""
+import re
+
+# Letters folded to one form: the alef and hamza seats, taa marbuta and alef maqsura
+_FOLD = str.maketrans({
+    'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا',
+    'ؤ': 'و', 'ئ': 'ي',
+    'ة': 'ه', 'ى': 'ي',
+})
+# Tashkeel, the superscript alef and tatweel carry no meaning for a search
+_MARKS = re.compile('[\u064b-\u065f\u0670\u0640]')
+_SPACES = re.compile(r'\s+')
+# The definite article, and the particles that fuse with it. A fused form is
+# only taken for one when at least three letters follow, or words like
+# والدة and بالون would be cut into nonsense.
+_ARTICLE = re.compile(r'^(?:(?:وال|بال|كال|فال|لل)(?=\w{3})|ال(?=\w\w))')
+
+# Tashkeel are made part of words for FTS5, which would otherwise split a
+# word at each mark; word positions then match between the stored text and
+# the indexed text, so highlight() marks the right words.
+FTS_TOKENIZE = ("unicode61 remove_diacritics 2 tokenchars '"
+                + ''.join(chr(c) for c in range(0x064B, 0x0660)) + "ٰ'")
+
+
+def search_key(text):
+    """The normalized form of `text` that names are indexed and searched by."""
+    if not text:
+        return ''
+    text = _MARKS.sub('', text).translate(_FOLD).casefold()
+    return _SPACES.sub(' ', text).strip()
+
+
+def without_article(word):
+    """`word` with a leading article cut, or None when it has none."""
+    stem = _ARTICLE.sub('', word, count=1)
+    return stem if stem != word else None
+
+
+def index_text(text):
+    """search_key() for full-text search: each word without its article,
+    then the words that had one again as written.
+
+    The words keep their places, so highlights still fall on the stored
+    text; the word as written is kept too, so a wrong cut loses nothing.
+    """
+    words = search_key(text).split()
+    stems = [without_article(word) for word in words]
+    return ' '.join([stem or word for stem, word in zip(stems, words)]
+                    + [word for stem, word in zip(stems, words) if stem])
+
+
+if __name__ == "__main__":
+    # Self-check of the article cut
+    for text, expected in [
+        ('الكتاب', 'كتاب الكتاب'),
+        ('والكتاب', 'كتاب والكتاب'),
+        ('للكتاب', 'كتاب للكتاب'),
+        ('والدة', 'والده'),
+        ('بالون', 'بالون'),
+        ('كالسيوم', 'سيوم كالسيوم'),
+        ('الى', 'الي'),
+        ('والدة بالون للاعب', 'والده بالون اعب للاعب'),
+    ]:
+        assert index_text(text) == expected, (text, index_text(text), expected)
+    print("ok")
@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+"""Archival of closed fiscal years into files of their own, and the history read across them.
+
+archive_closed_years() moves every movement of a closed fiscal year out of
+the live transactions table into <database>-archive-<year>.db next to the
+database, and leaves one opening-balance row per item in its place: a
+receipt of the item's closing balance, dated the first moment of the next
+year and marked with opening_year. connect() attaches every archive, so
+the history tab, reports and stock as of a date read across them; the
+dashboard, recent activity and postings only ever touch the live table.
+
+The job changes the file under the feet of open windows: run it while they
+are closed, or restart them afterwards.
+"""
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+from database import (
+    ARCHIVE_SCHEMA, HISTORY_FIRST_PAGE_SQL, HISTORY_NEWER_PAGE_SQL, HISTORY_OLDER_PAGE_SQL, HISTORY_ROW_SQL,
+    HISTORY_ROWS_SQL, in_source, transaction_sources,
+)
+
+FISCAL_YEAR_START_MONTH = 1     # fiscal year N runs from this month of year N
+# A year is archived only once it has been over this long: late corrections
+# can still be posted into it, and the 90-day consumption window of the
+# reorder suggestions never reaches into an archive
+ARCHIVE_GRACE_DAYS = 92
+# Opening balances need an employee; they get this one, made when first needed
+OPENING_EMPLOYEE = ("رصيد مرحّل", "قيد آلي عند الأرشفة")
+
+COLUMNS = 'id, item_id, quantity, transaction_type, transaction_date, employee_id, supplier_id, notes, voucher_no, opening_year'
+
+ARCHIVE_SCHEMA_SQL = (
+    '''
+    CREATE TABLE IF NOT EXISTS {schema}.transactions (
+        id INTEGER PRIMARY KEY,
+        item_id INTEGER NOT NULL,
+        quantity INTEGER NOT NULL,
+        transaction_type TEXT NOT NULL,
+        transaction_date TEXT NOT NULL,
+        employee_id INTEGER NOT NULL,
+        supplier_id INTEGER,
+        notes TEXT,
+        voucher_no INTEGER,
+        opening_year INTEGER
+    )
+    ''',
+    "CREATE INDEX IF NOT EXISTS {schema}.idx_transactions_date ON transactions (transaction_date)",
+    "CREATE INDEX IF NOT EXISTS {schema}.idx_transactions_item_date ON transactions (item_id, transaction_date)",
+    "CREATE INDEX IF NOT EXISTS {schema}.idx_transactions_voucher ON transactions (voucher_no) WHERE voucher_no IS NOT NULL",
+)
+
+# Each item's stock at :end, worked back from today's by the movements since
+CLOSING_BALANCES_SQL = '''
+SELECT i.id, i.quantity - COALESCE(SUM(CASE t.transaction_type WHEN 'RECEIVE' THEN t.quantity ELSE -t.quantity END), 0)
+FROM items i
+LEFT JOIN main.transactions t
+    ON t.item_id = i.id AND t.transaction_date >= :end AND t.opening_year IS NULL
+GROUP BY i.id
+'''
+
+# The summaries already hold the archived movements and must not count the
+# opening balances: these triggers are dropped while a year is moved
+SUSPENDED_TRIGGERS = ('trg_transactions_insert_stats', 'trg_transactions_delete_stats',
+                      'trg_snapshots_tx_insert', 'trg_snapshots_tx_delete')
+
+
+def fiscal_year(day):
+    """The fiscal year a date falls in, named by the calendar year it starts in."""
+    return day.year if day.month >= FISCAL_YEAR_START_MONTH else day.year - 1
+
+
+def fiscal_year_bounds(year):
+    """(first day, the day after the last) of fiscal year `year`."""
+    return date(year, FISCAL_YEAR_START_MONTH, 1), date(year + 1, FISCAL_YEAR_START_MONTH, 1)
+
+
+def closed_years(db, today=None):
+    """The fiscal years still in the live table that are old enough to archive, oldest first."""
+    today = today or date.today()
+    first = db.scalar("SELECT MIN(transaction_date) FROM main.transactions")
+    if first is None:
+        return []
+    last = fiscal_year(today - timedelta(days=ARCHIVE_GRACE_DAYS)) - 1
+    return list(range(fiscal_year(date.fromisoformat(first[:10])), last + 1))
+
+
+def archive_closed_years(db, today=None, progress=None):
+    """Archives every closed fiscal year, oldest first; returns [(year, movements moved)].
+
+    `progress` is called with each pair as its year is done. Must not be
+    called inside a transaction, since archives are attached as they are
+    made.
+    """
+    moved = []
+    for year in closed_years(db, today):
+        count = archive_year(db, year)
+        if count is not None:
+            moved.append((year, count))
+            if progress is not None:
+                progress(year, count)
+    return moved
+
+
+def archive_year(db, year):
+    """Moves fiscal year `year`, and anything older left live, into its archive file.
+
+    The rows are copied into the archive and committed first, then removed
+    from the live table in a second transaction that also writes the
+    opening balances and registers the archive. If the job stops between
+    the two, running it again copies nothing twice. Returns the number of
+    movements moved, opening balances not counted, or None when nothing
+    was left to move.
+    """
+    first_day, end_day = (day.isoformat() for day in fiscal_year_bounds(year))
+    if not db.scalar("SELECT 1 FROM main.transactions WHERE transaction_date < ? LIMIT 1", (end_day,)):
+        return None
+    count = db.scalar("SELECT COUNT(*) FROM main.transactions WHERE transaction_date < ? AND opening_year IS NULL",
+                      (end_day,))
+    schema = ARCHIVE_SCHEMA.format(year)
+    file = f"{Path(db.path).stem}-archive-{year}.db"
+    attached = {row[1] for row in db.query("PRAGMA database_list")}
+    if schema not in attached:
+        db.execute(f"ATTACH DATABASE ? AS {schema}", (str(Path(db.path).resolve().parent / file),))
+
+    with db.transaction(immediate=True):
+        for sql in ARCHIVE_SCHEMA_SQL:
+            db.execute(sql.format(schema=schema))
+        db.execute(f'''
+            INSERT OR IGNORE INTO {schema}.transactions ({COLUMNS})
+            SELECT {COLUMNS} FROM main.transactions WHERE transaction_date < ?
+        ''', (end_day,))
+
+    with db.transaction(immediate=True):
+        balances = db.query(CLOSING_BALANCES_SQL, {'end': end_day})
+        employee_id = _opening_employee(db)
+        triggers = db.query(f'''
+            SELECT sql FROM main.sqlite_master
+            WHERE type = 'trigger' AND name IN ({', '.join('?' * len(SUSPENDED_TRIGGERS))})
+        ''', SUSPENDED_TRIGGERS)
+        for name in SUSPENDED_TRIGGERS:
+            db.execute(f"DROP TRIGGER IF EXISTS main.{name}")
+        db.execute("DELETE FROM main.transactions WHERE transaction_date < ?", (end_day,))
+        db.executemany(f'''
+            INSERT INTO main.transactions (item_id, quantity, transaction_type, transaction_date, employee_id,
+                                           opening_year)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', [(item_id, abs(balance), 'RECEIVE' if balance > 0 else 'ISSUE', f"{end_day} 00:00:00", employee_id,
+               year + 1) for item_id, balance in balances if balance])
+        for sql, in triggers:
+            db.execute(sql)
+        db.execute('''
+            INSERT OR REPLACE INTO archives (fiscal_year, file, first_day, end_day, movements, archived_at)
+            VALUES (?, ?, ?, ?, (SELECT COUNT(*) FROM {}.transactions WHERE opening_year IS NULL), ?)
+        '''.format(schema), (year, file, first_day, end_day, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+    db.execute(f"ANALYZE {schema}")
+    return count
+
+
+def _opening_employee(db):
+    name, position = OPENING_EMPLOYEE
+    db.execute("INSERT OR IGNORE INTO employees (name, position) VALUES (?, ?)", (name, position))
+    return db.scalar("SELECT id FROM employees WHERE name = ?", (name,))
+
+
+def missing_archives(db):
+    """Registered archives whose file is not next to the database, as (year, file)."""
+    folder = Path(db.path).resolve().parent
+    return [(year, file) for year, file in db.query("SELECT fiscal_year, file FROM archives ORDER BY fiscal_year")
+            if not (folder / file).exists()]
+
+
+# --- History across the archives ---
+# Each source holds one stretch of time, so a page is filled from the newest
+# source that has rows past the key, then from the older ones in turn.
+
+def history_first_page(db, limit):
+    return _older_rows(db, HISTORY_FIRST_PAGE_SQL, (), limit, transaction_sources(db))
+
+
+def history_older_page(db, key, limit):
+    return _older_rows(db, HISTORY_OLDER_PAGE_SQL, key, limit, transaction_sources(db, end=key[0]))
+
+
+def history_newer_page(db, key, limit):
+    rows = []
+    for schema in transaction_sources(db, start=key[0]):
+        rows += db.query(in_source(HISTORY_NEWER_PAGE_SQL, schema), (*key, limit - len(rows)))
+        if len(rows) == limit:
+            break
+    return rows
+
+
+def history_row(db, transaction_id):
+    """One movement's history row, from whichever source holds it, or None."""
+    for schema in reversed(transaction_sources(db)):
+        row = db.query_one(in_source(HISTORY_ROW_SQL, schema), (transaction_id,))
+        if row is not None:
+            return row
+    return None
+
+
+def history_rows(db, ids):
+    """The history rows of the movements `ids`, from every source, in no particular order."""
+    ids = list(ids)
+    if not ids:
+        return []
+    sql = HISTORY_ROWS_SQL.format(ids=', '.join('?' * len(ids)))
+    return [row for schema in transaction_sources(db) for row in db.query(in_source(sql, schema), ids)]
+
+
+def _older_rows(db, sql, key, limit, sources):
+    rows = []
+    for schema in reversed(sources):
+        rows += db.query(in_source(sql, schema), (*key, limit - len(rows)))
+        if len(rows) == limit:
+            break
+    return rows
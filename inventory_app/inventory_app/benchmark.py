@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+"""Times the window's hot paths one by one against a database, with or without a display.
+
+    python benchmark.py --db big.db --json results.json
+    python benchmark.py --generate medium --json results.json --baseline last.json
+
+Every path is timed from the call until the window is idle again: the
+reads it started have been delivered and the views it invalidated have
+been refreshed. Startup is timed from constructing the window to the
+first idle with the dashboard filled. The database is copied first, so
+postings made by the run do not change it.
+
+With --tk auto the real Tk is used when a display can be opened (for
+example under xvfb-run) and headless.py otherwise. Reads run on the Tk
+thread by default (--readers 0), so the figures are the work itself and
+not the executor's polling interval. --diagnostics adds the session's
+slowest statements and refreshes to the output (and slows every path).
+
+The JSON output holds the database's row counts and the versions used,
+then for every path its samples and their min, median, p95 and max in
+milliseconds. With --baseline the exit status is 1 when any path's
+median got slower than the baseline's by more than --tolerance.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import diagnostics
+import synthetic
+
+PATHS = ('startup', 'refresh_items_tree', 'refresh_transactions_tree', 'update_overview_chart',
+         'update_recent_activity', 'refresh_comboboxes', 'record_transaction')
+REPEAT = 5
+TOLERANCE = 0.25        # allowed median slowdown against the baseline
+SETTLE_TIMEOUT = 120.0  # seconds a path may take before the run is abandoned
+COUNTED_TABLES = ('items', 'categories', 'units', 'suppliers', 'employees', 'transactions')
+
+
+def choose_tk(mode):
+    """Returns 'real' or 'mock'; in mock mode headless.py is installed in place of tkinter."""
+    if mode in ('auto', 'real'):
+        try:
+            import tkinter
+            tkinter.Tk().destroy()
+            return 'real'
+        except Exception:
+            if mode == 'real':
+                raise
+    import headless
+    headless.install()
+    return 'mock'
+
+
+class Bench:
+    """One window over a copy of the database, driven the way a user would."""
+
+    def __init__(self, path, readers):
+        self.path = path
+        self.readers = readers
+        self.app = None
+        self.rng = random.Random(1)
+
+    def settle(self):
+        """Runs the event loop until no read is pending and no view is waiting to refresh."""
+        deadline = time.perf_counter() + SETTLE_TIMEOUT
+        app = self.app
+        app.update()
+        while app.executor.is_pending() or app.bus.is_pending():
+            if time.perf_counter() > deadline:
+                raise RuntimeError("the window did not settle")
+            time.sleep(0.0005)
+            app.update()
+
+    def start(self):
+        """Opens the window; returns the seconds until its first idle with the dashboard filled."""
+        from inventory_app import InventoryApp, StartupTimer
+        from database import Database
+        startup = StartupTimer()
+        self.app = InventoryApp(db=Database(self.path), startup=startup, readers=self.readers)
+        deadline = time.perf_counter() + SETTLE_TIMEOUT
+        while not {'first idle', 'dashboard data'} <= {phase for phase, _ in startup.phases}:
+            if time.perf_counter() > deadline:
+                raise RuntimeError("the window did not finish starting")
+            self.app.update()
+        self.settle()
+        return time.perf_counter() - startup.started
+
+    def build_tabs(self):
+        for frame in list(self.app.tab_builders):
+            self.app.build_tab(frame)
+        self.settle()
+
+    def close(self):
+        self.app.on_close()
+        self.app = None
+
+    def time_path(self, name):
+        """Seconds for one run of the hot path `name`, settled."""
+        app = self.app
+        prepare = getattr(self, f'prepare_{name}', None)
+        if prepare is not None:
+            prepare()
+        started = time.perf_counter()
+        if name == 'update_overview_chart':
+            app.update_overview_chart()     # re-reads the categories itself
+        else:
+            getattr(app, name)()
+        self.settle()
+        return time.perf_counter() - started
+
+    def prepare_record_transaction(self):
+        # A receipt of one unit for a random item, as a user would type it
+        app, db = self.app, self.app.db
+        item = db.scalar("SELECT name FROM items WHERE id >= ? ORDER BY id LIMIT 1",
+                         (self.rng.randint(1, db.scalar("SELECT MAX(id) FROM items")),))
+        app.transaction_type_var.set('RECEIVE')
+        app.trans_item_combobox.set(item)
+        for entry, text in ((app.trans_qty_entry, '1'), (app.trans_notes_entry, '')):
+            entry.delete(0, 'end')
+            entry.insert(0, text)
+        app.trans_employee_combobox.set(db.scalar("SELECT name FROM employees ORDER BY id LIMIT 1"))
+        app.trans_supplier_combobox.set(db.scalar("SELECT name FROM suppliers ORDER BY id LIMIT 1"))
+
+
+def summarize(samples):
+    ordered = sorted(samples)
+    return {
+        'samples_ms': [round(s * 1000, 3) for s in samples],
+        'min_ms': round(ordered[0] * 1000, 3),
+        'median_ms': round(statistics.median(ordered) * 1000, 3),
+        'p95_ms': round(ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))] * 1000, 3),
+        'max_ms': round(ordered[-1] * 1000, 3),
+    }
+
+
+def describe(path):
+    db = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    try:
+        return {table: db.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] for table in COUNTED_TABLES}
+    finally:
+        db.close()
+
+
+def run(path, repeat=REPEAT, tk_mode='auto', readers=0, paths=PATHS, diagnose=False, progress=print):
+    """Times `paths` on a copy of the database at `path`; returns the results as a dict."""
+    tk_used = choose_tk(tk_mode)
+    import headless
+    import inventory_app
+    if diagnose:
+        inventory_app.enable_diagnostics(log_path=None)
+    # Boxes never block a run; a refused posting shows up in headless.messages
+    inventory_app.messagebox = headless.silent_messagebox()
+    results = {
+        'meta': {
+            'database': os.path.abspath(path), 'rows': describe(path), 'tk': tk_used, 'readers': readers,
+            'repeat': repeat, 'python': platform.python_version(), 'sqlite': sqlite3.sqlite_version,
+            'machine': platform.machine(), 'date': datetime.now().isoformat(timespec='seconds'),
+        },
+        'paths': {},
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        copy = os.path.join(directory, os.path.basename(path))
+        shutil.copyfile(path, copy)
+        bench = Bench(copy, readers)
+        if 'startup' in paths:
+            samples = []
+            for _ in range(repeat):
+                samples.append(bench.start())
+                bench.close()
+            results['paths']['startup'] = summarize(samples)
+            progress(f"startup: {results['paths']['startup']['median_ms']} ms")
+        bench.start()
+        try:
+            bench.build_tabs()
+            for name in paths:
+                if name == 'startup':
+                    continue
+                del headless.messages[:]
+                samples = [bench.time_path(name) for _ in range(repeat)]
+                errors = [text for kind, text in headless.messages if kind == 'error']
+                if errors:
+                    raise RuntimeError(f"{name}: {errors[0]}")
+                results['paths'][name] = summarize(samples)
+                progress(f"{name}: {results['paths'][name]['median_ms']} ms")
+        finally:
+            bench.close()
+    if diagnose:
+        results['operations'] = diagnostics.recorder.top()
+    return results
+
+
+def regressions(results, baseline, tolerance=TOLERANCE):
+    """The paths whose median is slower than the baseline's by more than `tolerance`."""
+    slower = []
+    for name, figures in results['paths'].items():
+        before = baseline.get('paths', {}).get(name)
+        if before and figures['median_ms'] > before['median_ms'] * (1 + tolerance):
+            slower.append((name, before['median_ms'], figures['median_ms']))
+    return slower
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time the window's hot paths")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--db', help="database to time (it is copied, not changed)")
+    source.add_argument('--generate', choices=sorted(synthetic.SIZES), help="time a freshly generated database")
+    parser.add_argument('--repeat', type=int, default=REPEAT)
+    parser.add_argument('--tk', choices=('auto', 'real', 'mock'), default='auto')
+    parser.add_argument('--readers', type=int, default=0, help="reader threads; 0 runs reads on the Tk thread")
+    parser.add_argument('--path', action='append', choices=PATHS, help="time only this path (repeatable)")
+    parser.add_argument('--diagnostics', action='store_true', help="also list the slowest statements and refreshes")
+    parser.add_argument('--json', help="write the results to this file")
+    parser.add_argument('--baseline', help="results of an earlier run to compare medians against")
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE)
+    args = parser.parse_args(argv)
+
+    log = lambda text: print(text, file=sys.stderr)
+    with tempfile.TemporaryDirectory() as directory:
+        path = args.db
+        if args.generate:
+            path = os.path.join(directory, f'{args.generate}.db')
+            synthetic.generate(path, **synthetic.SIZES[args.generate], progress=log)
+        results = run(path, args.repeat, args.tk, args.readers, args.path or PATHS, args.diagnostics, progress=log)
+    if args.generate:
+        results['meta']['database'] = f'generated:{args.generate}'
+
+    text = json.dumps(results, ensure_ascii=False, indent=2)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            f.write(text)
+    else:
+        print(text)
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            slower = regressions(results, json.load(f), args.tolerance)
+        for name, before, after in slower:
+            log(f"REGRESSION {name}: median {before} ms -> {after} ms")
+        return 1 if slower else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""Charts: a native tk.Canvas pie for the dashboard, matplotlib only for detailed reports."""
+import math
+import tkinter as tk
+from tkinter import messagebox
+
+# matplotlib's default colour cycle, so the native chart looks like the old one
+PALETTE = ('#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd',
+           '#8c564b', '#e377c2', '#7f7f7f', '#bcbd22', '#17becf')
+
+
+class PieChart:
+    """Draws a labelled pie chart on a tk.Canvas and redraws it on resize."""
+
+    def __init__(self, master, font=('Arial', 10), title_font=('Arial', 12, 'bold'), **kw):
+        self.canvas = tk.Canvas(master, background='white', highlightthickness=0, **kw)
+        self.font = font
+        self.title_font = title_font
+        self._data = None
+        self.canvas.bind('<Configure>', lambda event: self.redraw())
+
+    def pack(self, **kw):
+        self.canvas.pack(**kw)
+
+    def show(self, title, labels, sizes):
+        """Shows one slice per label, sized by `sizes`, counter-clockwise from 12 o'clock."""
+        self._data = ('pie', title, list(labels), list(sizes))
+        self.redraw()
+
+    def show_message(self, text):
+        self._data = ('message', text)
+        self.redraw()
+
+    def redraw(self):
+        canvas = self.canvas
+        canvas.delete('all')
+        if self._data is None:
+            return
+        width, height = max(canvas.winfo_width(), 1), max(canvas.winfo_height(), 1)
+        if self._data[0] == 'message':
+            canvas.create_text(width / 2, height / 2, text=self._data[1], font=self.font)
+            return
+
+        _, title, labels, sizes = self._data
+        canvas.create_text(width / 2, 14, text=title, font=self.title_font)
+        cx, cy = width / 2, (height + 28) / 2
+        radius = max(min(width * 0.6, height - 28) / 2 - 24, 10)
+        total = float(sum(sizes))
+        start = 90.0
+        for index, (label, size) in enumerate(zip(labels, sizes)):
+            if size <= 0:
+                continue
+            extent = 360.0 * size / total
+            colour = PALETTE[index % len(PALETTE)]
+            box = (cx - radius, cy - radius, cx + radius, cy + radius)
+            if extent >= 359.99:
+                canvas.create_oval(*box, fill=colour, outline='white')
+            else:
+                canvas.create_arc(*box, start=start, extent=extent, fill=colour, outline='white', width=2)
+
+            middle = math.radians(start + extent / 2)
+            dx, dy = math.cos(middle), -math.sin(middle)
+            canvas.create_text(cx + dx * radius * 0.6, cy + dy * radius * 0.6,
+                               text=f"{100.0 * size / total:.1f}%", font=self.font)
+            canvas.create_text(cx + dx * (radius + 8), cy + dy * (radius + 8), text=label, font=self.font,
+                               anchor='w' if dx >= 0 else 'e')
+            start += extent
+
+
+def show_detailed_chart(parent, categories):
+    """Opens a window with a matplotlib breakdown of stock per category.
+
+    matplotlib is optional and only imported here, the first time a
+    detailed report is asked for.
+    """
+    try:
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+    except ImportError:
+        messagebox.showerror("خطأ", "التقارير التفصيلية تتطلب تثبيت مكتبة matplotlib.")
+        return None
+
+    window = tk.Toplevel(parent)
+    window.title("تقرير المخزون حسب الفئة")
+    figure = Figure(figsize=(9, 4.5), dpi=90)
+    pie_ax, bar_ax = figure.subplots(1, 2)
+    categories = [c for c in categories if c.total > 0]
+    if categories and any(c.ok for c in categories):
+        pie_ax.pie([c.ok for c in categories], labels=[c.name for c in categories],
+                   autopct='%1.1f%%', startangle=90)
+        pie_ax.axis('equal')
+    pie_ax.set_title('نسبة الأصناف ذات المخزون الكافي حسب الفئة')
+
+    names = [c.name for c in categories]
+    bar_ax.barh(names, [c.ok for c in categories], label='كاف')
+    bar_ax.barh(names, [c.low for c in categories], left=[c.ok for c in categories], label='منخفض')
+    bar_ax.set_title('عدد الأصناف حسب الفئة')
+    bar_ax.legend()
+    figure.tight_layout()
+
+    canvas = FigureCanvasTkAgg(figure, master=window)
+    canvas.get_tk_widget().pack(fill='both', expand=True)
+    canvas.draw()
+    return window
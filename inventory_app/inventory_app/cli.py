@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+"""Command line for the inventory: imports, postings, reports and maintenance without a display.
+
+    python cli.py [--db path] <command> ...
+
+Run `python cli.py <command> --help` for the options of each command. A
+batch file of postings is a CSV or XLSX file with the columns type, item,
+quantity, employee and, optionally, supplier and notes (English or Arabic
+headers); every row is posted on its own, and the rows that were refused
+are listed at the end. The exit status is non-zero if anything failed.
+"""
+import argparse
+import sys
+import time
+
+from archive import closed_years, fiscal_year_bounds
+from database import DB_NAME, Database, setup_database
+from exporter import FORMATS, REPORTS
+from importer import RowSource
+from service import InventoryService, ServiceError
+from snapshots import first_movement_day
+
+# Batch file headers and movement types, in either language
+BATCH_COLUMNS = {
+    'النوع': 'type', 'المادة': 'item', 'الصنف': 'item', 'الكمية': 'quantity',
+    'الموظف': 'employee', 'المورد': 'supplier', 'ملاحظات': 'notes',
+}
+TYPE_NAMES = {'RECEIVE': 'RECEIVE', 'ISSUE': 'ISSUE', 'استلام': 'RECEIVE', 'تسليم': 'ISSUE'}
+PROGRESS_EVERY = 1000       # batch rows between progress lines
+
+
+def run_import(service, args):
+    result = service.import_file(args.kind, args.file)
+    for number, message in result.errors:
+        print(f"row {number}: {message}")
+    print(f"{result.created} created, {result.updated} updated, {len(result.errors)} errors, "
+          f"{result.new_categories} new categories, {result.new_units} new units")
+    return 1 if result.errors else 0
+
+
+def run_post(service, args):
+    transaction_id = service.record_movement(TYPE_NAMES.get(args.type, args.type), args.item, args.quantity,
+                                             args.employee, args.supplier, args.notes)
+    print(f"posted movement {transaction_id}")
+    return 0
+
+
+def run_batch(service, args):
+    source = RowSource(args.file)
+    posted, refused = 0, []
+    started = time.perf_counter()
+    try:
+        for number, row in source:
+            row = {BATCH_COLUMNS.get(str(column).strip(), str(column).strip()): value for column, value in row.items()}
+            kind = str(row.get('type') or '').strip()
+            try:
+                service.record_movement(TYPE_NAMES.get(kind, kind), row.get('item'), row.get('quantity'),
+                                        row.get('employee'), row.get('supplier'), row.get('notes') or None)
+            except ServiceError as e:
+                refused.append((number, str(e)))
+            else:
+                posted += 1
+            if (posted + len(refused)) % PROGRESS_EVERY == 0:
+                print(f"{posted + len(refused)} rows, {source.fraction():.0%} of the file", file=sys.stderr)
+    finally:
+        source.close()
+    for number, message in refused:
+        print(f"row {number}: {message}")
+    print(f"{posted} posted, {len(refused)} refused in {time.perf_counter() - started:.2f} s")
+    return 1 if refused else 0
+
+
+def run_report(service, args):
+    started = time.perf_counter()
+    count = service.export(args.report, args.output, args.format, vars(args))
+    print(f"{count} rows written to {args.output} in {time.perf_counter() - started:.2f} s")
+    return 0
+
+
+def run_stock(service, args):
+    if args.low:
+        for item_id, name, quantity, reorder_level in service.low_stock():
+            print(f"{item_id}\t{name}\t{quantity}\t{reorder_level}")
+        return 0
+    if args.as_of:
+        rows, base = service.stock_as_of(args.as_of)
+        for item_id, name, category, unit, quantity in rows:
+            print(f"{item_id}\t{name}\t{category or '-'}\t{unit or '-'}\t{quantity}")
+        print(f"{len(rows)} items, worked out from {base or 'current stock'}", file=sys.stderr)
+        return 0
+    for row in service.items():
+        print('\t'.join('' if value is None else str(value) for value in row))
+    return 0
+
+
+def run_search(service, args):
+    for hit in service.search(' '.join(args.words)):
+        print(f"{hit.kind}\t{hit.id}\t{hit.title}\t{hit.snippet}")
+    return 0
+
+
+def run_snapshots(service, args):
+    since = first_movement_day(service.db) if args.backfill else None
+    written = service.close_periods('daily' if args.daily else 'monthly', since=since)
+    print(f"{written} periods written")
+    return 0
+
+
+def run_archive(service, args):
+    if args.dry_run:
+        for year in closed_years(service.db):
+            start, end = fiscal_year_bounds(year)
+            count = service.db.scalar("SELECT COUNT(*) FROM transactions WHERE transaction_date >= ? AND transaction_date < ?",
+                                      (start.isoformat(), end.isoformat()))
+            print(f"{year}\t{count}")
+        return 0
+    started = time.perf_counter()
+    moved = service.archive_years(progress=lambda year, count: print(f"{year}: {count} movements archived",
+                                                                     file=sys.stderr))
+    print(f"{len(moved)} years archived in {time.perf_counter() - started:.2f} s")
+    return 0
+
+
+def run_reindex(service, args):
+    service.rebuild_search_index()
+    print("search indexes rebuilt")
+    return 0
+
+
+def run_optimize(service, args):
+    service.optimize()
+    print("statistics refreshed, write-ahead log checkpointed")
+    return 0
+
+
+def run_check(service, args):
+    problems = service.check()
+    for problem in problems:
+        print(problem)
+    print(f"{len(problems)} problems")
+    return 1 if problems else 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Inventory jobs without the window")
+    parser.add_argument('--db', default=DB_NAME)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    command = commands.add_parser('import', help="import items, suppliers or employees from CSV/XLSX")
+    command.add_argument('kind', choices=('items', 'suppliers', 'employees'))
+    command.add_argument('file')
+    command.set_defaults(run=run_import)
+
+    command = commands.add_parser('post', help="post one receipt or issue")
+    command.add_argument('type', choices=sorted(TYPE_NAMES))
+    command.add_argument('item')
+    command.add_argument('quantity')
+    command.add_argument('employee')
+    command.add_argument('--supplier')
+    command.add_argument('--notes')
+    command.set_defaults(run=run_post)
+
+    command = commands.add_parser('batch', help="post every movement in a CSV/XLSX file")
+    command.add_argument('file')
+    command.set_defaults(run=run_batch)
+
+    command = commands.add_parser('report', help="export a report")
+    command.add_argument('report', choices=sorted(REPORTS))
+    command.add_argument('format', choices=FORMATS)
+    command.add_argument('output')
+    command.add_argument('--from', dest='date_from', help="YYYY-MM-DD")
+    command.add_argument('--to', dest='date_to', help="YYYY-MM-DD")
+    command.add_argument('--item')
+    command.add_argument('--type', choices=('RECEIVE', 'ISSUE'))
+    command.set_defaults(run=run_report)
+
+    command = commands.add_parser('stock', help="list the items and their stock")
+    command.add_argument('--low', action='store_true', help="only items below their reorder level")
+    command.add_argument('--as-of', help="the stock at the end of this day, YYYY-MM-DD")
+    command.set_defaults(run=run_stock)
+
+    command = commands.add_parser('search', help="search items and movement notes")
+    command.add_argument('words', nargs='+')
+    command.set_defaults(run=run_search)
+
+    command = commands.add_parser('snapshots', help="write the closed periods' stock snapshots")
+    command.add_argument('--daily', action='store_true', help="snapshot every day instead of every month")
+    command.add_argument('--backfill', action='store_true', help="cover the whole ledger, not just new periods")
+    command.set_defaults(run=run_snapshots)
+
+    command = commands.add_parser('archive', help="move the closed fiscal years into their archive files")
+    command.add_argument('--dry-run', action='store_true', help="only list the years and their movements")
+    command.set_defaults(run=run_archive)
+
+    commands.add_parser('reindex', help="rebuild the full-text search indexes").set_defaults(run=run_reindex)
+    commands.add_parser('optimize', help="refresh statistics and checkpoint the log").set_defaults(run=run_optimize)
+    commands.add_parser('check', help="integrity and query-plan check").set_defaults(run=run_check)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    setup_database(args.db)
+    db = Database(args.db)
+    try:
+        return args.run(InventoryService(db), args)
+    except ServiceError as e:
+        print(e, file=sys.stderr)
+        return 1
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+"""Client side of server.py: stand-ins for Database and InventoryService that talk to the server."""
+import http.client
+import json
+import os
+import uuid
+from datetime import date, datetime
+from urllib.parse import urlsplit
+
+from importer import CHUNK_SIZE, ImportResult
+from service import ServiceError
+
+UNREACHABLE = "تعذر الاتصال بخادم المخزن."
+TIMEOUT = 60.0          # seconds to wait for an answer
+# The server's shared token is sent in this header; by default it is read from this variable
+TOKEN_HEADER = 'X-Inventory-Token'
+TOKEN_ENV = 'INVENTORY_TOKEN'
+
+
+class RemoteError(Exception):
+    """The server could not run a request; the message is the server's."""
+
+
+def _jsonable(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return list(value)      # tuples, dict views and other iterables
+
+
+class _Http:
+    """One keep-alive HTTP connection to the server; not shared between threads."""
+
+    def __init__(self, url, token=None):
+        parts = urlsplit(url)
+        self.url = url
+        self.token = token or os.environ.get(TOKEN_ENV, '')
+        self.conn = http.client.HTTPConnection(parts.hostname, parts.port, timeout=TIMEOUT)
+
+    def request(self, method, path, body=None, retry=True):
+        """Returns (status, decoded JSON answer). A read is re-sent once on a dropped connection."""
+        payload = None if body is None else json.dumps(body, ensure_ascii=False, default=_jsonable).encode('utf-8')
+        headers = {TOKEN_HEADER: self.token}
+        if payload is not None:
+            headers['Content-Type'] = 'application/json'
+        try:
+            self.conn.request(method, path, payload, headers)
+            response = self.conn.getresponse()
+            return response.status, json.loads(response.read())
+        except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+            self.conn.close()
+            if not retry:
+                raise
+            return self.request(method, path, body, retry=False)
+
+    def close(self):
+        self.conn.close()
+
+
+class _Rows:
+    """The part of a cursor that readers use, over rows already fetched."""
+
+    def __init__(self, rows):
+        self._rows = rows
+        self._next = 0
+
+    def fetchone(self):
+        rows = self.fetchmany(1)
+        return rows[0] if rows else None
+
+    def fetchmany(self, size=1):
+        rows = self._rows[self._next:self._next + size]
+        self._next += len(rows)
+        return rows
+
+    def fetchall(self):
+        return self.fetchmany(len(self._rows))
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    def close(self):
+        self._rows = []
+
+
+class RemoteDatabase:
+    """A read-only Database whose queries run on the server's reader pool.
+
+    It takes the place of the app's Database and of the background readers
+    in client mode; writes go through RemoteService instead.
+    """
+
+    readonly = True
+
+    def __init__(self, url, token=None):
+        self.path = url
+        self._http = _Http(url, token)
+        self._seen = None       # the server version this client knows all of
+        self._reported = None   # what data_version() answered for it
+
+    def execute(self, sql, params=()):
+        return _Rows(self.query(sql, params))
+
+    def query(self, sql, params=()):
+        status, answer = self._http.request('POST', '/query', {'sql': sql, 'params': params})
+        if status != 200:
+            raise RemoteError(answer.get('error'))
+        return [tuple(row) for row in answer['rows']]
+
+    def query_one(self, sql, params=()):
+        rows = self.query(sql, params)
+        return rows[0] if rows else None
+
+    def scalar(self, sql, params=(), default=None):
+        row = self.query_one(sql, params)
+        return row[0] if row is not None else default
+
+    def transaction(self, immediate=False):
+        raise RemoteError("writes go through the server's service calls")
+
+    def data_version(self):
+        """The server's commit counter, which plays the part of PRAGMA data_version.
+
+        Like the pragma, it stays put for this client's own writes, once
+        RemoteService has passed their versions to saw_version().
+        """
+        status, answer = self._http.request('GET', '/version')
+        if status != 200:
+            raise RemoteError(answer.get('error'))
+        if answer['version'] != self._seen:
+            self._seen = self._reported = answer['version']
+        return self._reported
+
+    def saw_version(self, version):
+        """Takes note of a write's version: if it follows the last one seen,
+        nobody else has written in between."""
+        if self._seen is not None and version == self._seen + 1:
+            self._seen = version
+
+    def interrupt(self):
+        pass        # a query already sent runs to the end; its answer is dropped
+
+    def close(self):
+        self._http.close()
+
+
+class RemoteService:
+    """InventoryService's writes, sent to the server and committed there.
+
+    Refusals come back as ServiceError with the server's message. The tables
+    a write changed are passed to `publish`, as the local service does, and
+    its version to `database`, whose data_version() then does not count it.
+    """
+
+    CALLS = {
+        'add_master', 'rename_master', 'delete_master', 'add_category', 'add_unit', 'add_supplier', 'add_employee',
+        'add_item', 'update_item', 'delete_item', 'record_movement', 'post_voucher', 'close_periods',
+    }
+
+    def __init__(self, url, publish=None, database=None, token=None):
+        self._http = _Http(url, token)
+        self.publish = publish
+        self.database = database
+
+    def __getattr__(self, name):
+        if name not in self.CALLS:
+            raise AttributeError(name)
+        return lambda *args, **kwargs: self._call(name, *args, **kwargs)
+
+    def _call(self, method, *args, **kwargs):
+        try:
+            status, answer = self._http.request('POST', '/call', {'method': method, 'args': args, 'kwargs': kwargs},
+                                                retry=False)
+        except OSError:
+            raise ServiceError(UNREACHABLE) from None
+        if self.database is not None and 'version' in answer:
+            self.database.saw_version(answer['version'])
+        if status == 409:
+            raise ServiceError(answer['error'])
+        if status != 200:
+            raise RemoteError(answer.get('error'))
+        if self.publish is not None:
+            for table, ids in answer['changes']:
+                self.publish(table, ids=ids)
+        return answer['result']
+
+    def import_rows(self, kind, rows):
+        """Same as InventoryService.import_rows, sending one chunk per step."""
+        result = ImportResult()
+        return result, self._import_chunks(kind, rows, result)
+
+    def _import_chunks(self, kind, rows, result):
+        # The server keeps the import's state under this token between chunks;
+        # a full chunk is held back until the next row shows it is not the last
+        session = uuid.uuid4().hex
+        chunk = []
+        for number, row in rows:
+            if len(chunk) == CHUNK_SIZE:
+                self._add_chunk(kind, chunk, result, session, last=False)
+                chunk = []
+                yield result
+            chunk.append((number, {column: _cell(value) for column, value in row.items()}))
+        self._add_chunk(kind, chunk, result, session, last=True)
+        yield result
+
+    def _add_chunk(self, kind, chunk, result, session, last):
+        answer = self._call('import_chunk', kind, chunk, session, last)
+        for counter in ('created', 'updated', 'new_categories', 'new_units'):
+            setattr(result, counter, answer[counter])
+        result.errors.extend(tuple(error) for error in answer['errors'])
+
+    def close(self):
+        self._http.close()
+
+
+def _cell(value):
+    # Spreadsheet cells can hold dates and times, which JSON has no type for
+    return value.isoformat() if isinstance(value, (date, datetime)) else value
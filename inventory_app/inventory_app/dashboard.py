@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""Dashboard figures shared by the summary cards and the overview chart."""
+from collections import namedtuple
+from datetime import datetime
+
+from database import DASHBOARD_SQL
+
+
+class CategoryStock(namedtuple('CategoryStock', 'name total low')):
+    __slots__ = ()
+
+    @property
+    def ok(self):
+        return self.total - self.low
+
+
+class DashboardStats:
+    """Everything the dashboard shows, loaded together."""
+
+    def __init__(self, total_items=0, low_stock=0, received_today=0, issued_today=0, categories=()):
+        self.total_items = total_items
+        self.low_stock = low_stock
+        self.received_today = received_today
+        self.issued_today = issued_today
+        self.categories = list(categories)
+
+    def __eq__(self, other):
+        return isinstance(other, DashboardStats) and vars(self) == vars(other)
+
+    def __repr__(self):
+        return f"DashboardStats({vars(self)!r})"
+
+
+def load_dashboard_stats(db, day=None):
+    """Reads every dashboard figure with one query over the summary tables."""
+    day = day or datetime.now().strftime('%Y-%m-%d')
+    stats = DashboardStats()
+    for kind, name, count, low in db.query(DASHBOARD_SQL, {'day': day}):
+        if kind == 'category':
+            stats.categories.append(CategoryStock(name, count, low))
+        elif kind == 'items':
+            stats.total_items = count
+            stats.low_stock = low
+        elif name == 'RECEIVE':
+            stats.received_today = count
+        elif name == 'ISSUE':
+            stats.issued_today = count
+    stats.categories.sort()
+    return stats
@@ -0,0 +1,827 @@
+# -*- coding: utf-8 -*-
+"""Data-access layer: one long-lived, tuned SQLite connection for the whole app."""
+import re
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import diagnostics
+from arabic import FTS_TOKENIZE, index_text, search_key
+
+DB_NAME = 'college_inventory.db'
+
+# --- Connection Settings ---
+# WAL lets readers and the writer work side by side. Switch to 'DELETE' if the
+# database file lives on a network share, where WAL is not supported.
+JOURNAL_MODE = 'WAL'
+SYNCHRONOUS = 'NORMAL'
+CACHE_SIZE_KIB = 32 * 1024      # page cache per connection
+STATEMENT_CACHE_SIZE = 256      # prepared statements kept per connection
+BUSY_TIMEOUT = 5.0              # seconds to wait on a locked database
+
+DEFAULT_REORDER_LEVEL = 10      # an item below its reorder level is low on stock
+
+# Each archived fiscal year is attached to every connection under this name
+ARCHIVE_SCHEMA = 'archive_{}'
+
+
+def connect(path=DB_NAME, journal_mode=JOURNAL_MODE, readonly=False):
+    """Opens a connection with the app's pragmas applied.
+
+    The connection runs in autocommit mode; multi-statement writes must be
+    wrapped in Database.transaction(). A readonly connection is refused any
+    write and keeps the journal mode the file already has.
+
+    search_key() and index_text() are registered as the SQL functions
+    arabic_key() and arabic_text(), which the items and transactions
+    triggers call; the schema needs them on every writing connection.
+
+    The archives of closed fiscal years (see archive.py) are attached as
+    archive_<year>, read-only on a readonly connection.
+    """
+    if readonly:
+        conn = sqlite3.connect(Path(path).resolve().as_uri() + '?mode=ro', uri=True, timeout=BUSY_TIMEOUT,
+                               isolation_level=None, cached_statements=STATEMENT_CACHE_SIZE,
+                               factory=diagnostics.Connection)
+    else:
+        conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT, isolation_level=None,
+                               cached_statements=STATEMENT_CACHE_SIZE, factory=diagnostics.Connection)
+        conn.execute(f"PRAGMA journal_mode={journal_mode}")
+    conn.execute(f"PRAGMA synchronous={SYNCHRONOUS}")
+    conn.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KIB}")
+    conn.execute("PRAGMA foreign_keys=ON")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.create_function('arabic_key', 1, search_key, deterministic=True)
+    conn.create_function('arabic_text', 1, index_text, deterministic=True)
+    _attach_archives(conn, path, readonly)
+    return conn
+
+
+def _attach_archives(conn, path, readonly):
+    try:
+        archives = conn.execute("SELECT fiscal_year, file FROM archives ORDER BY fiscal_year DESC").fetchall()
+    except sqlite3.OperationalError:
+        return      # schema not migrated yet
+    folder = Path(path).resolve().parent
+    # Newest first: past SQLite's limit on attached files, the oldest years are left out
+    for year, file in archives:
+        archive = folder / file
+        if not archive.exists():
+            continue    # reported by InventoryService.check()
+        try:
+            conn.execute(f"ATTACH DATABASE ? AS {ARCHIVE_SCHEMA.format(year)}",
+                         (archive.as_uri() + '?mode=ro' if readonly else str(archive),))
+        except sqlite3.OperationalError:
+            break
+
+
+# --- Schema Migrations ---
+# Each migration runs once, in order, inside its own transaction. The schema
+# version is kept in PRAGMA user_version.
+
+def _create_base_schema(cursor):
+    # Suppliers Table
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS suppliers (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL UNIQUE,
+        contact_info TEXT
+    )
+    ''')
+
+    # Employees Table
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS employees (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL UNIQUE,
+        position TEXT
+    )
+    ''')
+
+    # Categories Table
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS categories (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL UNIQUE
+    )
+    ''')
+
+    # Units Table
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS units (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL UNIQUE
+    )
+    ''')
+
+    # Items Table
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS items (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL UNIQUE,
+        description TEXT,
+        quantity INTEGER NOT NULL DEFAULT 0,
+        category_id INTEGER,
+        unit_id INTEGER,
+        FOREIGN KEY (category_id) REFERENCES categories(id),
+        FOREIGN KEY (unit_id) REFERENCES units(id)
+    )
+    ''')
+
+    # Transactions Table
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS transactions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        item_id INTEGER NOT NULL,
+        quantity INTEGER NOT NULL,
+        transaction_type TEXT NOT NULL, -- 'RECEIVE' or 'ISSUE'
+        transaction_date TEXT NOT NULL,
+        employee_id INTEGER NOT NULL,
+        supplier_id INTEGER, -- Only for RECEIVE transactions
+        notes TEXT,
+        FOREIGN KEY (item_id) REFERENCES items(id),
+        FOREIGN KEY (employee_id) REFERENCES employees(id),
+        FOREIGN KEY (supplier_id) REFERENCES suppliers(id)
+    )
+    ''')
+
+
+def _add_query_indexes(cursor):
+    # History, recent activity and "today" ranges; the rowid makes it (date, id)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_transactions_date ON transactions(transaction_date)")
+    # Today's receive/issue counts, answered from the index alone
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_transactions_type_date ON transactions(transaction_type, transaction_date)")
+    # Per-item history and deleting an item's movements
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_transactions_item_date ON transactions(item_id, transaction_date)")
+    # Per-category totals and low-stock counts for the dashboard
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_items_category_quantity ON items(category_id, quantity)")
+    # Low-stock count
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_items_quantity ON items(quantity)")
+    # Foreign-key check when a unit is deleted
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_items_unit ON items(unit_id)")
+    cursor.execute("ANALYZE")
+
+
+def _add_dashboard_summaries(cursor):
+    # Single-row totals for the dashboard cards
+    cursor.execute('''
+    CREATE TABLE dashboard_stats (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        total_items INTEGER NOT NULL DEFAULT 0,
+        low_stock INTEGER NOT NULL DEFAULT 0,
+        low_stock_threshold INTEGER NOT NULL DEFAULT 10
+    )
+    ''')
+    # Item count and low-stock count per category, for the overview chart
+    cursor.execute('''
+    CREATE TABLE category_stock (
+        category_id INTEGER PRIMARY KEY REFERENCES categories(id) ON DELETE CASCADE,
+        total INTEGER NOT NULL DEFAULT 0,
+        low INTEGER NOT NULL DEFAULT 0
+    )
+    ''')
+    # Movements per day and type
+    cursor.execute('''
+    CREATE TABLE daily_movements (
+        day TEXT NOT NULL,
+        transaction_type TEXT NOT NULL,
+        movements INTEGER NOT NULL DEFAULT 0,
+        quantity INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, transaction_type)
+    ) WITHOUT ROWID
+    ''')
+
+    cursor.execute("INSERT INTO dashboard_stats (id) VALUES (1)")
+    cursor.execute('''
+    UPDATE dashboard_stats SET
+        total_items = (SELECT COUNT(*) FROM items),
+        low_stock = (SELECT COUNT(*) FROM items WHERE quantity < low_stock_threshold)
+    ''')
+    cursor.execute('''
+    INSERT INTO category_stock (category_id, total, low)
+    SELECT category_id, COUNT(*), SUM(quantity < (SELECT low_stock_threshold FROM dashboard_stats))
+    FROM items WHERE category_id IS NOT NULL GROUP BY category_id
+    ''')
+    cursor.execute('''
+    INSERT INTO daily_movements (day, transaction_type, movements, quantity)
+    SELECT substr(transaction_date, 1, 10), transaction_type, COUNT(*), SUM(quantity)
+    FROM transactions GROUP BY 1, 2
+    ''')
+
+    # Triggers keep the summaries current on every write
+    cursor.execute('''
+    CREATE TRIGGER trg_items_insert_stats AFTER INSERT ON items
+    BEGIN
+        UPDATE dashboard_stats SET
+            total_items = total_items + 1,
+            low_stock = low_stock + (NEW.quantity < low_stock_threshold);
+        INSERT INTO category_stock (category_id, total, low)
+        SELECT NEW.category_id, 1, NEW.quantity < low_stock_threshold FROM dashboard_stats
+        WHERE NEW.category_id IS NOT NULL
+        ON CONFLICT (category_id) DO UPDATE SET total = total + 1, low = low + excluded.low;
+    END;
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER trg_items_delete_stats AFTER DELETE ON items
+    BEGIN
+        UPDATE dashboard_stats SET
+            total_items = total_items - 1,
+            low_stock = low_stock - (OLD.quantity < low_stock_threshold);
+        UPDATE category_stock SET
+            total = total - 1,
+            low = low - (OLD.quantity < (SELECT low_stock_threshold FROM dashboard_stats))
+        WHERE category_id = OLD.category_id;
+    END;
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER trg_items_update_stats AFTER UPDATE OF quantity, category_id ON items
+    BEGIN
+        UPDATE dashboard_stats SET
+            low_stock = low_stock - (OLD.quantity < low_stock_threshold) + (NEW.quantity < low_stock_threshold);
+        UPDATE category_stock SET
+            total = total - 1,
+            low = low - (OLD.quantity < (SELECT low_stock_threshold FROM dashboard_stats))
+        WHERE category_id = OLD.category_id;
+        INSERT INTO category_stock (category_id, total, low)
+        SELECT NEW.category_id, 1, NEW.quantity < low_stock_threshold FROM dashboard_stats
+        WHERE NEW.category_id IS NOT NULL
+        ON CONFLICT (category_id) DO UPDATE SET total = total + 1, low = low + excluded.low;
+    END;
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER trg_transactions_insert_stats AFTER INSERT ON transactions
+    BEGIN
+        INSERT INTO daily_movements (day, transaction_type, movements, quantity)
+        VALUES (substr(NEW.transaction_date, 1, 10), NEW.transaction_type, 1, NEW.quantity)
+        ON CONFLICT (day, transaction_type) DO UPDATE SET
+            movements = movements + 1, quantity = quantity + excluded.quantity;
+    END;
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER trg_transactions_delete_stats AFTER DELETE ON transactions
+    BEGIN
+        UPDATE daily_movements SET movements = movements - 1, quantity = quantity - OLD.quantity
+        WHERE day = substr(OLD.transaction_date, 1, 10) AND transaction_type = OLD.transaction_type;
+    END;
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER trg_transactions_update_stats
+    AFTER UPDATE OF quantity, transaction_type, transaction_date ON transactions
+    BEGIN
+        UPDATE daily_movements SET movements = movements - 1, quantity = quantity - OLD.quantity
+        WHERE day = substr(OLD.transaction_date, 1, 10) AND transaction_type = OLD.transaction_type;
+        INSERT INTO daily_movements (day, transaction_type, movements, quantity)
+        VALUES (substr(NEW.transaction_date, 1, 10), NEW.transaction_type, 1, NEW.quantity)
+        ON CONFLICT (day, transaction_type) DO UPDATE SET
+            movements = movements + 1, quantity = quantity + excluded.quantity;
+    END;
+    ''')
+
+
+def _add_voucher_numbers(cursor):
+    # Lines posted together from one voucher share its number; single postings have none
+    cursor.execute("ALTER TABLE transactions ADD COLUMN voucher_no INTEGER")
+    cursor.execute('''
+    CREATE INDEX idx_transactions_voucher ON transactions (voucher_no)
+    WHERE voucher_no IS NOT NULL
+    ''')
+
+
+def _add_item_search_keys(cursor):
+    # The normalized name the type-ahead picker searches by, kept in step by triggers
+    cursor.execute("ALTER TABLE items ADD COLUMN name_key TEXT")
+    cursor.execute("UPDATE items SET name_key = arabic_key(name)")
+    cursor.execute("CREATE INDEX idx_items_name_key ON items (name_key)")
+    cursor.execute('''
+    CREATE TRIGGER trg_items_name_key_insert AFTER INSERT ON items
+    BEGIN
+        UPDATE items SET name_key = arabic_key(NEW.name) WHERE id = NEW.id;
+    END;
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER trg_items_name_key_update AFTER UPDATE OF name ON items
+    BEGIN
+        UPDATE items SET name_key = arabic_key(NEW.name) WHERE id = NEW.id;
+    END;
+    ''')
+
+
+def _add_full_text_search(cursor):
+    # FTS5 indexes over item names/descriptions and movement notes. They hold
+    # no copy of the text (content= points back at the table) and index it in
+    # arabic_text() form; movements without notes are left out of the index.
+    cursor.execute(f'''
+    CREATE VIRTUAL TABLE items_fts USING fts5(
+        name, description, content='items', content_rowid='id',
+        tokenize="{FTS_TOKENIZE}", prefix='2 3'
+    )
+    ''')
+    cursor.execute(f'''
+    CREATE VIRTUAL TABLE transactions_fts USING fts5(
+        notes, content='transactions', content_rowid='id',
+        tokenize="{FTS_TOKENIZE}", prefix='2 3'
+    )
+    ''')
+    cursor.execute('''
+    INSERT INTO items_fts (rowid, name, description)
+    SELECT id, arabic_text(name), arabic_text(description) FROM items
+    ''')
+    cursor.execute('''
+    INSERT INTO transactions_fts (rowid, notes)
+    SELECT id, arabic_text(notes) FROM transactions WHERE notes <> ''
+    ''')
+
+    cursor.execute('''
+    CREATE TRIGGER trg_items_fts_insert AFTER INSERT ON items
+    BEGIN
+        INSERT INTO items_fts (rowid, name, description)
+        VALUES (NEW.id, arabic_text(NEW.name), arabic_text(NEW.description));
+    END;
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER trg_items_fts_delete AFTER DELETE ON items
+    BEGIN
+        INSERT INTO items_fts (items_fts, rowid, name, description)
+        VALUES ('delete', OLD.id, arabic_text(OLD.name), arabic_text(OLD.description));
+    END;
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER trg_items_fts_update AFTER UPDATE OF name, description ON items
+    BEGIN
+        INSERT INTO items_fts (items_fts, rowid, name, description)
+        VALUES ('delete', OLD.id, arabic_text(OLD.name), arabic_text(OLD.description));
+        INSERT INTO items_fts (rowid, name, description)
+        VALUES (NEW.id, arabic_text(NEW.name), arabic_text(NEW.description));
+    END;
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER trg_transactions_fts_insert AFTER INSERT ON transactions
+    WHEN NEW.notes <> ''
+    BEGIN
+        INSERT INTO transactions_fts (rowid, notes) VALUES (NEW.id, arabic_text(NEW.notes));
+    END;
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER trg_transactions_fts_delete AFTER DELETE ON transactions
+    WHEN OLD.notes <> ''
+    BEGIN
+        INSERT INTO transactions_fts (transactions_fts, rowid, notes)
+        VALUES ('delete', OLD.id, arabic_text(OLD.notes));
+    END;
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER trg_transactions_fts_update AFTER UPDATE OF notes ON transactions
+    BEGIN
+        INSERT INTO transactions_fts (transactions_fts, rowid, notes)
+        SELECT 'delete', OLD.id, arabic_text(OLD.notes) WHERE OLD.notes <> '';
+        INSERT INTO transactions_fts (rowid, notes)
+        SELECT NEW.id, arabic_text(NEW.notes) WHERE NEW.notes <> '';
+    END;
+    ''')
+
+
+def _add_stock_snapshots(cursor):
+    # Closing balance of every item at the end of a period's last day
+    cursor.execute('''
+    CREATE TABLE stock_snapshots (
+        period_end TEXT NOT NULL,
+        item_id INTEGER NOT NULL REFERENCES items(id) ON DELETE CASCADE,
+        quantity INTEGER NOT NULL,
+        PRIMARY KEY (period_end, item_id)
+    ) WITHOUT ROWID
+    ''')
+    cursor.execute("CREATE INDEX idx_stock_snapshots_item ON stock_snapshots (item_id, period_end)")
+
+    # A movement dated inside a closed period moves every later closing
+    # balance of its item. Movements posted today touch no snapshot rows.
+    cursor.execute('''
+    CREATE TRIGGER trg_snapshots_tx_insert AFTER INSERT ON transactions
+    BEGIN
+        UPDATE stock_snapshots
+        SET quantity = quantity + CASE NEW.transaction_type WHEN 'RECEIVE' THEN NEW.quantity ELSE -NEW.quantity END
+        WHERE item_id = NEW.item_id AND period_end >= substr(NEW.transaction_date, 1, 10);
+    END;
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER trg_snapshots_tx_delete AFTER DELETE ON transactions
+    BEGIN
+        UPDATE stock_snapshots
+        SET quantity = quantity - CASE OLD.transaction_type WHEN 'RECEIVE' THEN OLD.quantity ELSE -OLD.quantity END
+        WHERE item_id = OLD.item_id AND period_end >= substr(OLD.transaction_date, 1, 10);
+    END;
+    ''')
+
+
+def _add_reorder_levels(cursor):
+    # Low stock is judged per item against its own level instead of one global threshold
+    cursor.execute(f"ALTER TABLE items ADD COLUMN reorder_level INTEGER NOT NULL DEFAULT {DEFAULT_REORDER_LEVEL}")
+    cursor.execute("ALTER TABLE items ADD COLUMN max_level INTEGER")
+    cursor.execute("UPDATE items SET reorder_level = (SELECT low_stock_threshold FROM dashboard_stats)")
+    # Holds only the items below their level, so the alerts list stays small and cheap
+    cursor.execute("CREATE INDEX idx_items_low_stock ON items (name, quantity, reorder_level) WHERE quantity < reorder_level")
+
+    for trigger in ('trg_items_insert_stats', 'trg_items_delete_stats', 'trg_items_update_stats'):
+        cursor.execute(f"DROP TRIGGER {trigger}")
+    cursor.execute('''
+    CREATE TRIGGER trg_items_insert_stats AFTER INSERT ON items
+    BEGIN
+        UPDATE dashboard_stats SET
+            total_items = total_items + 1,
+            low_stock = low_stock + (NEW.quantity < NEW.reorder_level);
+        INSERT INTO category_stock (category_id, total, low)
+        SELECT NEW.category_id, 1, NEW.quantity < NEW.reorder_level
+        WHERE NEW.category_id IS NOT NULL
+        ON CONFLICT (category_id) DO UPDATE SET total = total + 1, low = low + excluded.low;
+    END;
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER trg_items_delete_stats AFTER DELETE ON items
+    BEGIN
+        UPDATE dashboard_stats SET
+            total_items = total_items - 1,
+            low_stock = low_stock - (OLD.quantity < OLD.reorder_level);
+        UPDATE category_stock SET
+            total = total - 1,
+            low = low - (OLD.quantity < OLD.reorder_level)
+        WHERE category_id = OLD.category_id;
+    END;
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER trg_items_update_stats AFTER UPDATE OF quantity, category_id, reorder_level ON items
+    BEGIN
+        UPDATE dashboard_stats SET
+            low_stock = low_stock - (OLD.quantity < OLD.reorder_level) + (NEW.quantity < NEW.reorder_level);
+        UPDATE category_stock SET
+            total = total - 1,
+            low = low - (OLD.quantity < OLD.reorder_level)
+        WHERE category_id = OLD.category_id;
+        INSERT INTO category_stock (category_id, total, low)
+        SELECT NEW.category_id, 1, NEW.quantity < NEW.reorder_level
+        WHERE NEW.category_id IS NOT NULL
+        ON CONFLICT (category_id) DO UPDATE SET total = total + 1, low = low + excluded.low;
+    END;
+    ''')
+    cursor.execute("UPDATE dashboard_stats SET low_stock = (SELECT COUNT(*) FROM items WHERE quantity < reorder_level)")
+    cursor.execute('''
+    UPDATE category_stock SET low = (
+        SELECT COUNT(*) FROM items
+        WHERE items.category_id = category_stock.category_id AND quantity < reorder_level
+    )
+    ''')
+
+
+def _add_archives(cursor):
+    # Closed fiscal years moved out to files of their own by archive.py
+    cursor.execute('''
+    CREATE TABLE archives (
+        fiscal_year INTEGER PRIMARY KEY,
+        file TEXT NOT NULL,             -- next to the database file
+        first_day TEXT NOT NULL,
+        end_day TEXT NOT NULL,          -- the day after the year's last day
+        movements INTEGER NOT NULL,
+        archived_at TEXT NOT NULL
+    )
+    ''')
+    # Set on the opening-balance rows that stand in for the archived years
+    # before the fiscal year they open; they carry a balance, not a movement
+    cursor.execute("ALTER TABLE transactions ADD COLUMN opening_year INTEGER")
+
+
+def _reindex_full_text_search(cursor):
+    # arabic_text() now cuts a fused article only before three letters and
+    # adds the words it cut as written; old entries could not be deleted
+    cursor.execute("INSERT INTO items_fts (items_fts) VALUES ('delete-all')")
+    cursor.execute("INSERT INTO transactions_fts (transactions_fts) VALUES ('delete-all')")
+    cursor.execute('''
+    INSERT INTO items_fts (rowid, name, description)
+    SELECT id, arabic_text(name), arabic_text(description) FROM items
+    ''')
+    cursor.execute('''
+    INSERT INTO transactions_fts (rowid, notes)
+    SELECT id, arabic_text(notes) FROM transactions WHERE notes <> ''
+    ''')
+
+
+MIGRATIONS = [
+    (1, _create_base_schema),
+    (2, _add_query_indexes),
+    (3, _add_dashboard_summaries),
+    (4, _add_voucher_numbers),
+    (5, _add_item_search_keys),
+    (6, _add_full_text_search),
+    (7, _add_stock_snapshots),
+    (8, _add_reorder_levels),
+    (9, _add_archives),
+    (10, _reindex_full_text_search),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def migrate(conn):
+    """Brings the schema up to SCHEMA_VERSION and returns the version found."""
+    current = conn.execute("PRAGMA user_version").fetchone()[0]
+    for version, step in MIGRATIONS:
+        if version <= current:
+            continue
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            step(cursor)
+            cursor.execute(f"PRAGMA user_version={version}")
+        except BaseException:
+            cursor.execute("ROLLBACK")
+            raise
+        cursor.execute("COMMIT")
+    return current
+
+
+def setup_database(path=DB_NAME):
+    """Creates the database and upgrades its schema to the current version."""
+    conn = connect(path)
+    migrate(conn)
+    conn.close()
+
+
+# --- Hot Queries ---
+# Shared by the tabs and by check_query_plans(), so the plan check always
+# covers the SQL the app actually runs.
+# Every dashboard figure in one round trip, read from the trigger-maintained
+# summaries: a row per category, the item totals, and a row per movement type
+# posted on :day. The cost does not depend on the size of items/transactions.
+DASHBOARD_SQL = '''
+SELECT 'category', c.name, COALESCE(s.total, 0), COALESCE(s.low, 0)
+FROM categories c
+LEFT JOIN category_stock s ON s.category_id = c.id
+UNION ALL
+SELECT 'items', NULL, total_items, low_stock
+FROM dashboard_stats WHERE id = 1
+UNION ALL
+SELECT 'today', transaction_type, movements, 0
+FROM daily_movements WHERE day = :day
+'''
+
+RECENT_ACTIVITY_SQL = '''
+SELECT 
+    t.id, t.transaction_date, t.transaction_type, 
+    i.name AS item_name, t.quantity,
+    e.name AS employee_name
+FROM transactions t
+JOIN items i ON t.item_id = i.id
+JOIN employees e ON t.employee_id = e.id
+WHERE t.opening_year IS NULL
+ORDER BY t.transaction_date DESC, t.id DESC
+LIMIT 20
+'''
+
+_ITEMS_SELECT = '''
+SELECT 
+    i.id, i.name, i.description, i.quantity, 
+    c.name AS category_name, u.name AS unit_name,
+    i.reorder_level, i.max_level
+FROM items i
+LEFT JOIN categories c ON i.category_id = c.id
+LEFT JOIN units u ON i.unit_id = u.id
+'''
+
+ITEMS_LIST_SQL = _ITEMS_SELECT + '''ORDER BY i.name
+'''
+
+ITEM_ROW_SQL = _ITEMS_SELECT + '''WHERE i.id = ?
+'''
+
+# Items below their reorder level, read from the partial index alone
+LOW_STOCK_SQL = '''
+SELECT id, name, quantity, reorder_level FROM items
+WHERE quantity < reorder_level
+ORDER BY name
+'''
+
+LOW_STOCK_ROW_SQL = '''
+SELECT id, name, quantity, reorder_level FROM items
+WHERE id = ? AND quantity < reorder_level
+'''
+
+# Items whose normalized name starts with :key, in key order
+ITEM_PREFIX_SQL = '''
+SELECT name FROM items
+WHERE name_key >= :key AND name_key < :key || char(1114111)
+ORDER BY name_key
+LIMIT :limit
+'''
+
+_HISTORY_SELECT = '''
+SELECT 
+    t.id, t.transaction_date, t.transaction_type, 
+    i.name AS item_name, t.quantity,
+    e.name AS employee_name,
+    s.name AS supplier_name,
+    t.notes, t.voucher_no, t.opening_year
+FROM transactions t
+JOIN items i ON t.item_id = i.id
+JOIN employees e ON t.employee_id = e.id
+LEFT JOIN suppliers s ON t.supplier_id = s.id
+'''
+
+# Keyset pages of the history, newest first, keyed on (transaction_date, id).
+# Older pages continue below the last row shown; newer pages come back in
+# ascending order from just above the first row shown.
+HISTORY_FIRST_PAGE_SQL = _HISTORY_SELECT + '''ORDER BY t.transaction_date DESC, t.id DESC
+LIMIT ?
+'''
+
+HISTORY_OLDER_PAGE_SQL = _HISTORY_SELECT + '''WHERE (t.transaction_date, t.id) < (?, ?)
+ORDER BY t.transaction_date DESC, t.id DESC
+LIMIT ?
+'''
+
+HISTORY_NEWER_PAGE_SQL = _HISTORY_SELECT + '''WHERE (t.transaction_date, t.id) > (?, ?)
+ORDER BY t.transaction_date, t.id
+LIMIT ?
+'''
+
+HISTORY_ROW_SQL = _HISTORY_SELECT + "WHERE t.id = ?\n"
+
+# The rows already shown, re-read when a name on them changes; {ids} is a list of ?
+HISTORY_ROWS_SQL = _HISTORY_SELECT + "WHERE t.id IN ({ids})\n"
+
+# name -> (sql, sample parameters)
+HOT_QUERIES = {
+    'dashboard': (DASHBOARD_SQL, {'day': '2024-01-01'}),
+    'recent_activity': (RECENT_ACTIVITY_SQL, ()),
+    'items_list': (ITEMS_LIST_SQL, ()),
+    'item_prefix': (ITEM_PREFIX_SQL, {'key': 'ق', 'limit': 20}),
+    'low_stock': (LOW_STOCK_SQL, ()),
+    'history_first_page': (HISTORY_FIRST_PAGE_SQL, (100,)),
+    'history_older_page': (HISTORY_OLDER_PAGE_SQL, ('2024-01-01 00:00:00', 1, 100)),
+    'history_newer_page': (HISTORY_NEWER_PAGE_SQL, ('2024-01-01 00:00:00', 1, 100)),
+    'history_row': (HISTORY_ROW_SQL, (1,)),
+}
+
+# Queries that walk a large table in index order on purpose (a LIMITed
+# newest-first page, a full list sorted by name, or a partial index that only
+# holds the rows wanted). A scan through an index is accepted for these; a
+# bare table scan never is.
+INDEX_WALK_QUERIES = {'recent_activity', 'items_list', 'history_first_page', 'low_stock'}
+
+# Lookup tables stay small; scanning them is fine.
+SMALL_TABLES = {'categories', 'units', 'suppliers', 'employees'}
+
+
+# --- Archived Years ---
+# The live transactions table holds the open fiscal years only; the closed
+# ones are in attached archive files with the same columns. Readers that
+# span years run their SQL once per source, through in_source().
+
+def transaction_sources(db, start=None, end=None):
+    """The schemas whose movements may fall in [start, end), oldest first.
+
+    Archived years come first, then 'main'. Bounds are transaction_date
+    text; None leaves that side open. Archives that are not attached to this
+    connection are left out.
+    """
+    years = db.query('''
+        SELECT fiscal_year FROM archives
+        WHERE (:start IS NULL OR end_day > :start) AND (:end IS NULL OR first_day < :end)
+          AND 'archive_' || fiscal_year IN (SELECT name FROM pragma_database_list)
+        ORDER BY fiscal_year
+    ''', {'start': start, 'end': end})
+    return [ARCHIVE_SCHEMA.format(year) for year, in years] + ['main']
+
+
+def in_source(sql, schema):
+    """`sql` with its transactions table read from `schema` instead of the live one."""
+    return sql if schema == 'main' else re.sub(r'\bFROM transactions\b', f'FROM {schema}.transactions', sql)
+
+
+def live_start(db):
+    """The first day still in the live table, or None when nothing is archived."""
+    return db.scalar("SELECT MAX(end_day) FROM archives")
+
+
+def day_range(day):
+    """Returns the [start, end) bounds of a 'YYYY-MM-DD' day as timestamp text.
+
+    Comparing transaction_date against these bounds keeps the predicate
+    sargable, unlike DATE(transaction_date) = ?.
+    """
+    start = datetime.strptime(day, '%Y-%m-%d')
+    return start.strftime('%Y-%m-%d'), (start + timedelta(days=1)).strftime('%Y-%m-%d')
+
+
+def check_query_plans(conn, queries=None):
+    """Runs EXPLAIN QUERY PLAN on the hot queries.
+
+    Returns a list of (query name, plan detail) for every scan of a large
+    table that is not an intended index walk, and every sort that could not
+    use an index.
+    """
+    queries = HOT_QUERIES if queries is None else queries
+    problems = []
+    for name, (sql, params) in queries.items():
+        aliases = _table_aliases(sql)
+        for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params):
+            detail = row[3]
+            scan = re.match(r'SCAN (?:TABLE )?(\w+)(?: AS (\w+))?( USING .*)?$', detail)
+            if scan:
+                table = aliases.get(scan.group(2) or scan.group(1), scan.group(1))
+                walk = scan.group(3) and name in INDEX_WALK_QUERIES
+                if table not in SMALL_TABLES and not walk:
+                    problems.append((name, detail))
+            elif detail.startswith('USE TEMP B-TREE FOR ORDER BY'):
+                problems.append((name, detail))
+    return problems
+
+
+def _table_aliases(sql):
+    aliases = {}
+    for table, alias in re.findall(r'(?:FROM|JOIN)\s+(\w+)(?:\s+(?!ON\b|WHERE\b|JOIN\b|LEFT\b|GROUP\b|ORDER\b)(\w+))?', sql, re.I):
+        aliases[alias or table] = table
+    return aliases
+
+
+class Database:
+    """Owns one SQLite connection: the app's writer, or a background reader.
+
+    Statements go through the connection's prepared-statement cache, so the
+    same SQL text is only compiled once per session.
+    """
+
+    def __init__(self, path=DB_NAME, readonly=False):
+        self.path = path
+        self.readonly = readonly
+        self.conn = connect(path, readonly=readonly)
+        self._tx_depth = 0
+
+    def execute(self, sql, params=()):
+        return self.conn.execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self.conn.executemany(sql, seq_of_params)
+
+    def query(self, sql, params=()):
+        return self.conn.execute(sql, params).fetchall()
+
+    def query_one(self, sql, params=()):
+        return self.conn.execute(sql, params).fetchone()
+
+    def scalar(self, sql, params=(), default=None):
+        row = self.conn.execute(sql, params).fetchone()
+        return row[0] if row is not None else default
+
+    @contextmanager
+    def transaction(self, immediate=False):
+        """Runs the enclosed statements as one transaction.
+
+        Nested blocks run as savepoints inside the outermost transaction,
+        which alone commits. An exception leaving a nested block undoes that
+        block's statements; unless it is caught on the way out, it then rolls
+        the whole transaction back. An immediate transaction takes the write
+        lock up front, so no other connection can write between its reads
+        and its writes.
+        """
+        outermost = self._tx_depth == 0
+        savepoint = f"sp{self._tx_depth}"
+        self.conn.execute(("BEGIN IMMEDIATE" if immediate else "BEGIN") if outermost else f"SAVEPOINT {savepoint}")
+        self._tx_depth += 1
+        try:
+            yield self.conn
+        except BaseException:
+            self._tx_depth -= 1
+            if outermost:
+                self.conn.execute("ROLLBACK")
+            else:
+                self.conn.execute(f"ROLLBACK TO {savepoint}")
+                self.conn.execute(f"RELEASE {savepoint}")
+            raise
+        self._tx_depth -= 1
+        self.conn.execute("COMMIT" if outermost else f"RELEASE {savepoint}")
+
+    def data_version(self):
+        """Changes whenever another connection commits; see PRAGMA data_version."""
+        return self.scalar("PRAGMA data_version")
+
+    def interrupt(self):
+        """Stops the statement running on this connection, from any thread."""
+        self.conn.interrupt()
+
+    def close(self):
+        try:
+            if not self.readonly:
+                self.conn.execute("PRAGMA optimize")
+        except sqlite3.OperationalError:
+            pass    # only a hint; skip it while another workstation holds the write lock
+        finally:
+            self.conn.close()
+
+
+if __name__ == "__main__":
+    # Schema and query-plan check: exits non-zero if a hot query scans a large table.
+    setup_database()
+    conn = connect()
+    problems = check_query_plans(conn)
+    conn.close()
+    for name, detail in problems:
+        print(f"{name}: {detail}")
+    raise SystemExit(1 if problems else 0)
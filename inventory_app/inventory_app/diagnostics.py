@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+"""Session timings of SQL statements and window refreshes, and a log of the slow ones.
+
+Nothing is timed until enable() is called (the window's --diagnostics
+flag): connect() then opens TimedConnection instead of a plain
+connection, and instrument() wraps the window's refresh_* and update_*
+methods. Disabled, connections are plain sqlite3 ones and methods are
+not wrapped, so there is no cost beyond one attribute check per delivered
+read.
+
+Statements are grouped by their normalized text, with literals replaced by
+? and IN lists folded, so the same query with different values counts as
+one. Each group keeps its count, rows and total time, and its most recent
+samples for the percentiles. Anything slower than SLOW_MS is also written
+to a rotating log file.
+"""
+import functools
+import logging
+import logging.handlers
+import re
+import sqlite3
+import threading
+from collections import deque
+from time import perf_counter
+
+SLOW_LOG = 'slow_operations.log'
+SLOW_MS = {'sql': 100, 'ui': 100}   # per kind: operations at least this slow are logged
+LOG_BYTES = 1024 * 1024             # one log file's size before it is rotated
+LOG_BACKUPS = 3
+SAMPLES = 1000                      # recent durations kept per operation for the percentiles
+TOP = 50
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|(?<![\w.])\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACES = re.compile(r"\s+")
+
+recorder = None                     # the session's Recorder while enabled
+Connection = sqlite3.Connection     # what connect() opens; TimedConnection while enabled
+
+
+@functools.lru_cache(maxsize=2048)
+def normalize(sql):
+    """The statement's text with its literal values taken out: one key per query shape."""
+    sql = _LITERALS.sub('?', sql)
+    sql = _IN_LIST.sub('(?, ...)', sql)
+    return _SPACES.sub(' ', sql).strip()
+
+
+class Operation:
+    """Running totals for one statement shape or one method."""
+
+    __slots__ = ('kind', 'name', 'count', 'rows', 'total', 'worst', 'samples')
+
+    def __init__(self, kind, name):
+        self.kind = kind
+        self.name = name
+        self.count = 0
+        self.rows = 0
+        self.total = 0.0
+        self.worst = 0.0
+        self.samples = deque(maxlen=SAMPLES)
+
+    def percentile(self, fraction):
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0.0
+
+
+class Recorder:
+    """Collects timings from every thread and logs the slow ones."""
+
+    def __init__(self, log_path=SLOW_LOG):
+        self.log_path = log_path
+        self.started = perf_counter()
+        self._operations = {}       # (kind, name) -> Operation
+        self._lock = threading.Lock()
+        self._log = logging.getLogger('inventory.slow')
+        self._log.propagate = False
+        if log_path and not self._log.handlers:
+            handler = logging.handlers.RotatingFileHandler(log_path, maxBytes=LOG_BYTES, backupCount=LOG_BACKUPS,
+                                                           encoding='utf-8')
+            handler.setFormatter(logging.Formatter('%(asctime)s %(threadName)s %(message)s'))
+            self._log.addHandler(handler)
+            self._log.setLevel(logging.INFO)
+
+    def record(self, kind, name, seconds, rows=0):
+        with self._lock:
+            operation = self._operations.get((kind, name))
+            if operation is None:
+                operation = self._operations[kind, name] = Operation(kind, name)
+            operation.count += 1
+            operation.rows += rows
+            operation.total += seconds
+            operation.worst = max(operation.worst, seconds)
+            operation.samples.append(seconds)
+        if seconds * 1000 >= SLOW_MS[kind]:
+            self._log.info("%s %.1f ms rows=%d %s", kind, seconds * 1000, rows, name)
+
+    def top(self, limit=TOP):
+        """The operations that took the most time in total, as dicts in milliseconds."""
+        with self._lock:
+            operations = sorted(self._operations.values(), key=lambda o: o.total, reverse=True)[:limit]
+            return [{
+                'kind': o.kind, 'name': o.name, 'count': o.count, 'rows': o.rows,
+                'p50_ms': round(o.percentile(0.5) * 1000, 3), 'p95_ms': round(o.percentile(0.95) * 1000, 3),
+                'max_ms': round(o.worst * 1000, 3), 'total_ms': round(o.total * 1000, 3),
+            } for o in operations]
+
+    def reset(self):
+        with self._lock:
+            self._operations.clear()
+            self.started = perf_counter()
+
+
+class TimedCursor(sqlite3.Cursor):
+    """A cursor that times each statement from execute() until its last row is fetched.
+
+    A statement's time and rows are recorded when it is exhausted, closed,
+    replaced by the next execute() or dropped; for a write, at once.
+    """
+
+    _statement = None       # [sql, seconds so far, rows so far]
+
+    def execute(self, sql, parameters=()):
+        self._finish()
+        started = perf_counter()
+        try:
+            super().execute(sql, parameters)
+        except BaseException:
+            self._statement = [sql, perf_counter() - started, 0]
+            self._finish()
+            raise
+        self._statement = [sql, perf_counter() - started, 0]
+        if self.description is None:
+            self._statement[2] = max(self.rowcount, 0)
+            self._finish()
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self._finish()
+        started = perf_counter()
+        try:
+            super().executemany(sql, seq_of_parameters)
+        finally:
+            self._statement = [sql, perf_counter() - started, max(self.rowcount, 0)]
+            self._finish()
+        return self
+
+    def fetchone(self):
+        started = perf_counter()
+        row = super().fetchone()
+        self._fetched(started, row is not None, row is None)
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        started = perf_counter()
+        rows = super().fetchmany(size)
+        self._fetched(started, len(rows), len(rows) < size)
+        return rows
+
+    def fetchall(self):
+        started = perf_counter()
+        rows = super().fetchall()
+        self._fetched(started, len(rows), True)
+        return rows
+
+    def __next__(self):
+        started = perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._fetched(started, 0, True)
+            raise
+        self._fetched(started, 1, False)
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        self._finish()
+
+    def _fetched(self, started, rows, done):
+        statement = self._statement
+        if statement is not None:
+            statement[1] += perf_counter() - started
+            statement[2] += rows
+            if done:
+                self._finish()
+
+    def _finish(self):
+        statement, self._statement = self._statement, None
+        if statement is not None and recorder is not None:
+            recorder.record('sql', normalize(statement[0]), statement[1], statement[2])
+
+
+class TimedConnection(sqlite3.Connection):
+    """A connection whose statements all run on TimedCursor."""
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def enable(log_path=SLOW_LOG):
+    """Starts timing; connections opened from now on are timed. Returns the Recorder."""
+    global recorder, Connection
+    if recorder is None:
+        recorder = Recorder(log_path)
+        Connection = TimedConnection
+    return recorder
+
+
+def timed(kind, name, fn):
+    """Wraps `fn` so each call is recorded as `name`, while enabled."""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if recorder is None:
+            return fn(*args, **kwargs)
+        started = perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            recorder.record(kind, name, perf_counter() - started)
+    return wrapper
+
+
+def instrument(cls, prefixes=('refresh_', 'update_'), skip=()):
+    """Times every method of `cls` whose name starts with one of `prefixes`.
+
+    Must run before instances are made, since subscriptions keep the
+    bound methods they were given.
+    """
+    for name, value in list(vars(cls).items()):
+        if callable(value) and name.startswith(prefixes) and name not in skip:
+            setattr(cls, name, timed('ui', name, value))
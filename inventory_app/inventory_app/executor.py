@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""Background reads: queries run on worker threads, results come back on the Tk thread."""
+import queue
+import sys
+import threading
+
+import diagnostics
+from database import DB_NAME, Database
+
+READ_WORKERS = 2        # reader threads, each with its own read-only connection
+POLL_MS = 15            # how often the Tk thread collects finished results
+
+
+class _Request:
+    __slots__ = ('key', 'fn', 'args', 'callback', 'errback', 'busy', 'cancelled', 'db')
+
+    def __init__(self, key, fn, args, callback, errback, busy):
+        self.key = key
+        self.fn = fn
+        self.args = args
+        self.callback = callback
+        self.errback = errback
+        self.busy = busy
+        self.cancelled = False
+        self.db = None          # the reader running it, while it runs
+
+
+class QueryExecutor:
+    """Runs read queries away from the Tk mainloop.
+
+    submit(key, fn, callback, *args) runs fn(db, *args) on a worker thread,
+    where `db` is that worker's read-only Database, then calls
+    callback(result) on the Tk thread. A view submits under its own key; a
+    newer request for the same key cancels the older one, interrupting its
+    query if it is already running, so a view only ever sees its latest
+    result. While a request is pending its `busy` widget shows a watch cursor.
+
+    Readers cannot write: every write still goes through the app's one
+    Database connection, so writes stay serialized. `opener` makes a
+    worker's reader; by default a read-only Database on `path`.
+
+    With workers=0 requests run on the Tk thread from after_idle instead;
+    this keeps the same call order for headless runs.
+    """
+
+    def __init__(self, widget, path=DB_NAME, workers=READ_WORKERS, opener=None):
+        self.widget = widget
+        self.path = path
+        self.open = opener or (lambda: Database(path, readonly=True))
+        self._pending = {}          # key -> _Request
+        self._busy = {}             # widget -> pending requests using it
+        self._lock = threading.Lock()
+        self._requests = queue.Queue()
+        self._results = queue.Queue()
+        self._poll = None
+        self._threads = [threading.Thread(target=self._work, name=f'reader-{n}', daemon=True)
+                         for n in range(workers)]
+        for thread in self._threads:
+            thread.start()
+        self._inline_db = None if workers else self.open()
+
+    def submit(self, key, fn, callback, *args, busy=None, errback=None):
+        self.cancel(key)
+        request = _Request(key, fn, args, callback, errback, busy)
+        self._pending[key] = request
+        if busy is not None:
+            if not self._busy.get(busy):
+                busy.configure(cursor='watch')
+            self._busy[busy] = self._busy.get(busy, 0) + 1
+        if self._threads:
+            self._requests.put(request)
+            if self._poll is None:
+                self._poll = self.widget.after(POLL_MS, self._collect)
+        else:
+            self.widget.after_idle(self._run_inline, request)
+        return request
+
+    def cancel(self, key):
+        """Drops the pending request for `key`, interrupting it if it is running."""
+        request = self._pending.pop(key, None)
+        if request is None:
+            return
+        with self._lock:
+            request.cancelled = True
+            if request.db is not None:
+                request.db.interrupt()
+        self._release(request)
+
+    def is_pending(self, key=None):
+        """Whether the request for `key`, or with no key any request, is still to be delivered."""
+        return bool(self._pending) if key is None else key in self._pending
+
+    def close(self):
+        for key in list(self._pending):
+            self.cancel(key)
+        if self._poll is not None:
+            self.widget.after_cancel(self._poll)
+            self._poll = None
+        for _ in self._threads:
+            self._requests.put(None)
+        for thread in self._threads:
+            thread.join(timeout=1.0)
+        if self._inline_db is not None:
+            self._inline_db.close()
+
+    # --- Worker side ---
+    def _work(self):
+        db = self.open()
+        try:
+            while True:
+                request = self._requests.get()
+                if request is None:
+                    break
+                with self._lock:
+                    if request.cancelled:
+                        continue
+                    request.db = db
+                try:
+                    outcome = (True, request.fn(db, *request.args))
+                except Exception:
+                    outcome = (False, sys.exc_info())
+                with self._lock:
+                    request.db = None
+                self._results.put((request, outcome))
+        finally:
+            db.close()
+
+    # --- Tk side ---
+    def _collect(self):
+        self._poll = None
+        while True:
+            try:
+                request, outcome = self._results.get_nowait()
+            except queue.Empty:
+                break
+            self._deliver(request, outcome)
+        if self._pending:
+            self._poll = self.widget.after(POLL_MS, self._collect)
+
+    def _run_inline(self, request):
+        if request.cancelled:
+            return
+        try:
+            outcome = (True, request.fn(self._inline_db, *request.args))
+        except Exception:
+            outcome = (False, sys.exc_info())
+        self._deliver(request, outcome)
+
+    def _deliver(self, request, outcome):
+        if request.cancelled or self._pending.get(request.key) is not request:
+            return
+        del self._pending[request.key]
+        self._release(request)
+        ok, value = outcome
+        try:
+            if ok and diagnostics.recorder is not None:
+                # A view's refresh finishes here, after its read
+                view = request.key if isinstance(request.key, str) else type(request.key).__name__
+                diagnostics.timed('ui', f"{view}: show", request.callback)(value)
+            elif ok:
+                request.callback(value)
+            elif request.errback is not None:
+                request.errback(value[1])
+            else:
+                self.widget.report_callback_exception(*value)
+        except Exception:
+            self.widget.report_callback_exception(*sys.exc_info())
+
+    def _release(self, request):
+        busy = request.busy
+        if busy is None:
+            return
+        self._busy[busy] -= 1
+        if not self._busy[busy]:
+            del self._busy[busy]
+            busy.configure(cursor='')
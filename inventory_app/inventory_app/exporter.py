@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+"""Streaming export of the ledger and stock lists to CSV, XLSX or JSON Lines."""
+import csv
+import json
+import os
+
+from database import ITEMS_LIST_SQL, day_range, in_source, transaction_sources
+
+EXPORT_BATCH = 1000     # rows fetched from the cursor at a time
+
+_LEDGER_SELECT = '''
+SELECT
+    t.id, t.voucher_no, t.transaction_date, CASE WHEN t.opening_year IS NULL THEN t.transaction_type ELSE 'OPENING' END,
+    i.name, t.quantity, e.name, s.name, t.notes
+FROM transactions t
+JOIN items i ON t.item_id = i.id
+JOIN employees e ON t.employee_id = e.id
+LEFT JOIN suppliers s ON t.supplier_id = s.id
+'''
+
+# On-hand quantity per item next to everything received and issued for it.
+# The schema keeps no unit costs, so the position is in quantities.
+# {movements} is one MOVEMENT_TOTALS_SQL per transactions source.
+STOCK_POSITION_SQL = '''
+SELECT
+    i.id, i.name, c.name, u.name, i.quantity,
+    COALESCE(m.received, 0), COALESCE(m.issued, 0), m.last_movement
+FROM items i
+LEFT JOIN categories c ON i.category_id = c.id
+LEFT JOIN units u ON i.unit_id = u.id
+LEFT JOIN (
+    SELECT item_id, SUM(received) AS received, SUM(issued) AS issued, MAX(last_movement) AS last_movement
+    FROM ({movements})
+    GROUP BY item_id
+) m ON m.item_id = i.id
+ORDER BY i.name
+'''
+
+MOVEMENT_TOTALS_SQL = '''
+    SELECT item_id,
+        SUM(CASE WHEN transaction_type = 'RECEIVE' THEN quantity ELSE 0 END) AS received,
+        SUM(CASE WHEN transaction_type = 'ISSUE' THEN quantity ELSE 0 END) AS issued,
+        MAX(transaction_date) AS last_movement
+    FROM transactions
+    WHERE opening_year IS NULL
+    GROUP BY item_id
+'''
+
+
+def _ledger_queries(db, filters):
+    # Each filter narrows the walk over one of the transactions indexes
+    where, params = [], {}
+    if filters.get('date_from'):
+        where.append("t.transaction_date >= :start")
+        params['start'] = day_range(filters['date_from'])[0]
+    if filters.get('date_to'):
+        where.append("t.transaction_date < :end")
+        params['end'] = day_range(filters['date_to'])[1]
+    if filters.get('item'):
+        where.append("t.item_id = (SELECT id FROM items WHERE name = :item)")
+        params['item'] = filters['item']
+    if filters.get('type'):
+        where.append("t.transaction_type = :type AND t.opening_year IS NULL")
+        params['type'] = filters['type']
+    # One query per source, oldest first. The opening balances a later source
+    # starts with repeat what the earlier ones hold, so only the first's are kept.
+    queries = []
+    for schema in transaction_sources(db, params.get('start'), params.get('end')):
+        conditions = where + ["t.opening_year IS NULL"] if queries else where
+        sql = _LEDGER_SELECT + (f"WHERE {' AND '.join(conditions)}\n" if conditions else '')
+        queries.append((in_source(sql + "ORDER BY t.transaction_date, t.id\n", schema), params))
+    return queries
+
+
+def _stock_queries(db, filters):
+    movements = '\n    UNION ALL'.join(in_source(MOVEMENT_TOTALS_SQL, schema) for schema in transaction_sources(db))
+    return [(STOCK_POSITION_SQL.format(movements=movements), ())]
+
+
+# name -> (column headers, JSON keys, builder of the queries whose rows are written in turn)
+REPORTS = {
+    'transactions': (
+        ('الرقم', 'رقم السند', 'التاريخ', 'النوع', 'المادة', 'الكمية', 'الموظف', 'المورد', 'ملاحظات'),
+        ('id', 'voucher_no', 'date', 'type', 'item', 'quantity', 'employee', 'supplier', 'notes'),
+        _ledger_queries,
+    ),
+    'items': (
+        ('الرقم', 'اسم الصنف', 'الوصف', 'الكمية', 'الفئة', 'الوحدة', 'حد إعادة الطلب', 'الحد الأعلى'),
+        ('id', 'name', 'description', 'quantity', 'category', 'unit', 'reorder_level', 'max_level'),
+        lambda db, filters: [(ITEMS_LIST_SQL, ())],
+    ),
+    'stock': (
+        ('الرقم', 'اسم الصنف', 'الفئة', 'الوحدة', 'الرصيد', 'إجمالي المستلم', 'إجمالي المسلم', 'آخر حركة'),
+        ('id', 'name', 'category', 'unit', 'on_hand', 'received', 'issued', 'last_movement'),
+        _stock_queries,
+    ),
+}
+
+FORMATS = ('csv', 'xlsx', 'jsonl')
+
+
+class ExportCancelled(Exception):
+    pass
+
+
+class _CsvWriter:
+    def __init__(self, path, headers, keys):
+        # The BOM lets Excel open Arabic text correctly
+        self.file = open(path, 'w', encoding='utf-8-sig', newline='')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(headers)
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.file.close()
+
+
+class _XlsxWriter:
+    def __init__(self, path, headers, keys):
+        try:
+            from openpyxl import Workbook
+        except ImportError:
+            raise ImportError("openpyxl is needed to write .xlsx files") from None
+        self.path = path
+        # Write-only workbooks stream rows to disk instead of keeping them
+        self.workbook = Workbook(write_only=True)
+        self.sheet = self.workbook.create_sheet()
+        self.sheet.append(headers)
+
+    def write(self, rows):
+        for row in rows:
+            self.sheet.append(row)
+
+    def close(self):
+        self.workbook.save(self.path)
+
+
+class _JsonLinesWriter:
+    def __init__(self, path, headers, keys):
+        self.file = open(path, 'w', encoding='utf-8')
+        self.keys = keys
+
+    def write(self, rows):
+        self.file.writelines(json.dumps(dict(zip(self.keys, row)), ensure_ascii=False) + '\n' for row in rows)
+
+    def close(self):
+        self.file.close()
+
+
+WRITERS = {'csv': _CsvWriter, 'xlsx': _XlsxWriter, 'jsonl': _JsonLinesWriter}
+
+
+def export(db, report, path, fmt, filters=None, progress=None, cancel=None):
+    """Writes one report to `path` and returns the number of rows written.
+
+    Rows are pulled from the cursor EXPORT_BATCH at a time and written
+    straight out, so memory use does not grow with the ledger. `progress`
+    is called with the running row count after each batch; `cancel` is a
+    threading.Event checked between batches. A cancelled or failed export
+    removes its partial file.
+    """
+    headers, keys, build_queries = REPORTS[report]
+    queries = build_queries(db, filters or {})
+    writer = WRITERS[fmt](path, headers, keys)
+    written = 0
+    try:
+        for sql, params in queries:
+            cursor = db.execute(sql, params)
+            while True:
+                if cancel is not None and cancel.is_set():
+                    raise ExportCancelled()
+                rows = cursor.fetchmany(EXPORT_BATCH)
+                if not rows:
+                    break
+                writer.write(rows)
+                written += len(rows)
+                if progress is not None:
+                    progress(written)
+            cursor.close()
+        writer.close()
+    except BaseException:
+        try:
+            writer.close()
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
+        raise
+    return written
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+    from database import DB_NAME, Database
+
+    parser = argparse.ArgumentParser(description="Export inventory data")
+    parser.add_argument('report', choices=sorted(REPORTS))
+    parser.add_argument('format', choices=FORMATS)
+    parser.add_argument('output')
+    parser.add_argument('--db', default=DB_NAME)
+    parser.add_argument('--from', dest='date_from', help="YYYY-MM-DD")
+    parser.add_argument('--to', dest='date_to', help="YYYY-MM-DD")
+    parser.add_argument('--item')
+    parser.add_argument('--type', choices=('RECEIVE', 'ISSUE'))
+    args = parser.parse_args()
+
+    db = Database(args.db, readonly=True)
+    started = time.perf_counter()
+    try:
+        count = export(db, args.report, args.output, args.format, vars(args))
+    finally:
+        db.close()
+    print(f"{count} rows written to {args.output} in {time.perf_counter() - started:.2f} s")
@@ -0,0 +1,384 @@
+# -*- coding: utf-8 -*-
+"""A stand-in for tkinter with no display, so the app can be driven and timed on a server.
+
+install() puts it in place of tkinter; it must run before inventory_app is
+imported. Widgets keep the state the app reads back (entry text, combobox
+values, Treeview rows, notebook tabs) and ignore layout and styling.
+after() and after_idle() callbacks run from Tk.update(), timers once they
+are due, so the app's own scheduling is kept. Message boxes never block:
+they are logged in `messages` and every question is answered yes.
+"""
+import heapq
+import itertools
+import sys
+import time
+import types
+
+END = 'end'
+messages = []           # (kind, text) of every message box shown
+
+_idle = []              # (id, callback, args)
+_timers = []            # heap of (due, sequence, id, callback, args)
+_cancelled = set()
+_sequence = itertools.count(1)
+
+# Layout, styling and window-manager calls, which have nothing to do without a display
+NO_OPS = {
+    'pack', 'grid', 'place', 'pack_forget', 'grid_forget', 'grid_columnconfigure', 'grid_rowconfigure', 'heading', 'column',
+    'tag_configure', 'theme_use', 'protocol', 'title', 'geometry', 'state', 'attributes', 'resizable', 'transient',
+    'grab_set', 'grab_release', 'focus_set', 'icursor', 'lift', 'see', 'destroy', 'start', 'stop', 'step', 'set', 'map',
+}
+
+
+class TclError(Exception):
+    pass
+
+
+def _schedule(delay_ms, callback, args):
+    number = next(_sequence)
+    if delay_ms is None:
+        _idle.append((f'idle#{number}', callback, args))
+        return f'idle#{number}'
+    heapq.heappush(_timers, (time.perf_counter() + delay_ms / 1000, number, f'after#{number}', callback, args))
+    return f'after#{number}'
+
+
+def process_events():
+    """Runs the idle callbacks and the timers that are due; returns how many ran."""
+    ran = 0
+    while True:
+        while _idle:
+            id_, callback, args = _idle.pop(0)
+            if id_ not in _cancelled:
+                callback(*args)
+                ran += 1
+        if not _timers or _timers[0][0] > time.perf_counter():
+            return ran
+        _, _, id_, callback, args = heapq.heappop(_timers)
+        if id_ in _cancelled:
+            _cancelled.discard(id_)
+            continue
+        callback(*args)
+        ran += 1
+
+
+class Variable:
+    _default = ''
+
+    def __init__(self, master=None, value=None, name=None):
+        self._value = self._default if value is None else value
+        self._traces = []
+
+    def get(self):
+        return self._value
+
+    def set(self, value):
+        self._value = value
+        for callback in self._traces:
+            callback('', '', 'write')
+
+    def trace_add(self, mode, callback):
+        self._traces.append(callback)
+        return str(len(self._traces))
+
+
+class StringVar(Variable):
+    pass
+
+
+class IntVar(Variable):
+    _default = 0
+
+
+class BooleanVar(Variable):
+    _default = False
+
+
+class Misc:
+    """Any widget: remembers its options and bindings; layout calls do nothing."""
+
+    def __init__(self, master=None, **options):
+        self.master = master
+        self._options = dict(options)
+        self._bindings = {}
+
+    def __getattr__(self, name):
+        if name not in NO_OPS:
+            raise AttributeError(name)
+        return lambda *args, **kwargs: None
+
+    def configure(self, cnf=None, **options):
+        self._options.update(cnf or {}, **options)
+
+    config = configure
+
+    def cget(self, option):
+        return self._options.get(option, '')
+
+    __getitem__ = cget
+
+    def __setitem__(self, option, value):
+        self._options[option] = value
+
+    def bind(self, sequence, callback=None, add=None):
+        self._bindings.setdefault(sequence, []).append(callback)
+
+    def event_generate(self, sequence, **kwargs):
+        event = types.SimpleNamespace(widget=self, **kwargs)
+        for callback in self._bindings.get(sequence, ()):
+            callback(event)
+
+    def after(self, delay_ms, callback=None, *args):
+        return _schedule(delay_ms, callback, args)
+
+    def after_idle(self, callback, *args):
+        return _schedule(None, callback, args)
+
+    def after_cancel(self, id_):
+        _cancelled.add(id_)
+
+    def update(self):
+        process_events()
+
+    update_idletasks = update
+
+    def winfo_exists(self):
+        return 1
+
+    def winfo_width(self):
+        return 800
+
+    def winfo_height(self):
+        return 600
+
+
+class Style(Misc):
+    def configure(self, style=None, **options):
+        pass
+
+
+class Tk(Misc):
+    def __init__(self, *args, **kwargs):
+        super().__init__(None)
+
+    def mainloop(self):
+        while True:
+            if not process_events():
+                time.sleep(0.001)
+
+    def report_callback_exception(self, exc_type, exc, tb):
+        raise exc
+
+
+class Entry(Misc):
+    def __init__(self, master=None, **options):
+        super().__init__(master, **options)
+        self._variable = options.get('textvariable')
+        self._text = ''
+
+    def get(self):
+        return self._variable.get() if self._variable is not None else self._text
+
+    def set(self, text):
+        if self._variable is not None:
+            self._variable.set(text)
+        else:
+            self._text = text
+
+    def delete(self, first, last=None):
+        self.set('')
+
+    def insert(self, index, text):
+        self.set(str(self.get()) + str(text))
+
+
+class Combobox(Entry):
+    pass
+
+
+class Text(Misc):
+    def __init__(self, master=None, **options):
+        super().__init__(master, **options)
+        self._text = ''
+
+    def insert(self, index, text, *tags):
+        self._text += text
+
+    def delete(self, *args):
+        self._text = ''
+
+    def get(self, *args):
+        return self._text
+
+
+class Canvas(Misc):
+    def __init__(self, master=None, **options):
+        super().__init__(master, **options)
+        self.items = 0
+
+    def _create(self, *args, **options):
+        self.items += 1
+        return self.items
+
+    create_arc = create_text = create_rectangle = create_line = create_oval = create_polygon = _create
+
+    def delete(self, *args):
+        self.items = 0
+
+
+class Notebook(Misc):
+    def __init__(self, master=None, **options):
+        super().__init__(master, **options)
+        self._tabs = []
+        self._current = None
+
+    def add(self, child, **options):
+        self._tabs.append(child)
+        if self._current is None:
+            self._current = child
+
+    def select(self, tab=None):
+        if tab is None:
+            return str(self._current) if self._current is not None else ''
+        if isinstance(tab, int):
+            tab = self._tabs[tab]
+        elif isinstance(tab, str):
+            tab = next(child for child in self._tabs if str(child) == tab)
+        self._current = tab
+        self.event_generate('<<NotebookTabChanged>>')
+
+    def tabs(self):
+        return [str(child) for child in self._tabs]
+
+    def index(self, tab):
+        if tab == 'current':
+            return self._tabs.index(self._current)
+        return len(self._tabs) if tab == 'end' else self._tabs.index(tab)
+
+    def nametowidget(self, name):
+        return next(child for child in self._tabs if str(child) == name)
+
+
+class Treeview(Misc):
+    """Rows in order with their values; enough for TreeSync and PagedTreeview."""
+
+    def __init__(self, master=None, **options):
+        super().__init__(master, **options)
+        self._rows = {}         # iid -> {'values', 'text', 'tags'}
+        self._order = []
+        self._focus = ''
+        self._selection = ()
+        self._next_iid = itertools.count(1)
+
+    def insert(self, parent, index, iid=None, **options):
+        iid = str(iid) if iid is not None else f'I{next(self._next_iid):03X}'
+        if iid in self._rows:
+            raise TclError(f"Item {iid} already exists")
+        self._rows[iid] = {'values': list(options.get('values', ())), 'text': options.get('text', ''),
+                           'tags': options.get('tags', ())}
+        if index == END:
+            self._order.append(iid)
+        else:
+            self._order.insert(int(index), iid)
+        return iid
+
+    def delete(self, *iids):
+        for iid in iids:
+            del self._rows[str(iid)]
+        removed = {str(iid) for iid in iids}
+        self._order = [iid for iid in self._order if iid not in removed]
+
+    detach = delete
+
+    def move(self, iid, parent, index):
+        self._order.remove(iid)
+        if index == END:
+            self._order.append(iid)
+        else:
+            self._order.insert(int(index), iid)
+
+    def get_children(self, item=''):
+        return tuple(self._order)
+
+    def exists(self, iid):
+        return str(iid) in self._rows
+
+    def index(self, iid):
+        return self._order.index(iid)
+
+    def item(self, iid, option=None, **options):
+        row = self._rows[str(iid)]
+        if options:
+            row.update((key, list(value) if key == 'values' else value) for key, value in options.items())
+            return None
+        # Tk hands back integer-looking values as ints
+        values = [_tcl_value(value) for value in row['values']]
+        result = {'values': values, 'text': row['text'], 'tags': row['tags']}
+        return result[option] if option else result
+
+    def focus(self, iid=None):
+        if iid is None:
+            return self._focus
+        self._focus = str(iid)
+
+    def selection(self):
+        return self._selection
+
+    def selection_set(self, *iids):
+        self._selection = tuple(str(iid) for iid in iids)
+
+    def yview(self, *args):
+        return (0.0, 1.0)
+
+    def yview_moveto(self, fraction):
+        pass
+
+
+def _tcl_value(value):
+    if isinstance(value, str):
+        try:
+            return int(value)
+        except ValueError:
+            return value
+    return value
+
+
+def _message(kind):
+    def show(title=None, message=None, **options):
+        messages.append((kind, message))
+        return True if kind == 'ask' else 'ok'
+    return show
+
+
+def silent_messagebox():
+    """A tkinter.messagebox whose boxes are only logged in `messages`; also usable with the real Tk."""
+    messagebox = types.ModuleType('tkinter.messagebox')
+    for name, kind in (('showinfo', 'info'), ('showwarning', 'warning'), ('showerror', 'error'),
+                       ('askyesno', 'ask'), ('askokcancel', 'ask')):
+        setattr(messagebox, name, _message(kind))
+    return messagebox
+
+
+def install():
+    """Replaces tkinter and its submodules in sys.modules with this stand-in."""
+    tkinter = types.ModuleType('tkinter')
+    tkinter.__dict__.update(
+        END=END, TclError=TclError, Tk=Tk, Toplevel=Misc, Frame=Misc, Label=Misc, Button=Misc, Scrollbar=Misc,
+        Entry=Entry, Text=Text, Canvas=Canvas, Listbox=Misc,
+        Variable=Variable, StringVar=StringVar, IntVar=IntVar, BooleanVar=BooleanVar,
+    )
+    ttk = types.ModuleType('tkinter.ttk')
+    ttk.__dict__.update(
+        Style=Style, Frame=Misc, Label=Misc, LabelFrame=Misc, Button=Misc, Radiobutton=Misc, Checkbutton=Misc,
+        Scrollbar=Misc, Progressbar=Misc, Separator=Misc, Entry=Entry, Combobox=Combobox, Notebook=Notebook,
+        Treeview=Treeview,
+    )
+    messagebox = silent_messagebox()
+    filedialog = types.ModuleType('tkinter.filedialog')
+    filedialog.askopenfilename = filedialog.asksaveasfilename = lambda **options: ''
+    simpledialog = types.ModuleType('tkinter.simpledialog')
+    simpledialog.askstring = lambda *args, **options: None
+    for module in (ttk, messagebox, filedialog, simpledialog):
+        setattr(tkinter, module.__name__.split('.')[1], module)
+        sys.modules[module.__name__] = module
+    sys.modules['tkinter'] = tkinter
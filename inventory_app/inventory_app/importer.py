@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+"""Bulk import of items, suppliers and employees from CSV or XLSX files."""
+import csv
+import io
+import os
+
+from movements import post_opening_stock
+
+CHUNK_SIZE = 2000       # rows per transaction
+
+# Accepted column headers, English or as labelled in the app's forms
+HEADER_ALIASES = {
+    'name': 'name', 'اسم الصنف': 'name', 'اسم المورد': 'name', 'اسم الموظف': 'name', 'الاسم': 'name',
+    'description': 'description', 'الوصف': 'description',
+    'quantity': 'quantity', 'الكمية': 'quantity',
+    'category': 'category', 'الفئة': 'category',
+    'unit': 'unit', 'الوحدة': 'unit',
+    'contact_info': 'contact_info', 'contact': 'contact_info', 'معلومات الاتصال': 'contact_info',
+    'position': 'position', 'المنصب': 'position',
+}
+
+# Existing rows are matched on their unique name and updated in place. An
+# item's quantity is only used when the item is new, and is then received as
+# its opening stock: stock on hand changes through movements, never through
+# a re-import.
+UPSERT_SQL = {
+    'items': '''
+        INSERT INTO items (name, description, quantity, category_id, unit_id)
+        VALUES (:name, :description, 0, :category_id, :unit_id)
+        ON CONFLICT (name) DO UPDATE SET
+            description = excluded.description,
+            category_id = excluded.category_id,
+            unit_id = excluded.unit_id
+    ''',
+    'suppliers': '''
+        INSERT INTO suppliers (name, contact_info) VALUES (:name, :contact_info)
+        ON CONFLICT (name) DO UPDATE SET contact_info = excluded.contact_info
+    ''',
+    'employees': '''
+        INSERT INTO employees (name, position) VALUES (:name, :position)
+        ON CONFLICT (name) DO UPDATE SET position = excluded.position
+    ''',
+}
+
+# Tables an import of each kind writes to, for the invalidation bus
+TOUCHED_TABLES = {
+    'items': ('items', 'categories', 'units', 'transactions', 'employees'),
+    'suppliers': ('suppliers',),
+    'employees': ('employees',),
+}
+
+
+class RowSource:
+    """Streams the rows of a CSV or XLSX file as (row number, {column: value}).
+
+    Only one row is held at a time. fraction() tells how much of the file
+    has been read so far, for a progress bar.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._done = 0.0
+        self._workbook = None
+        if path.lower().endswith('.xlsx'):
+            try:
+                from openpyxl import load_workbook
+            except ImportError:
+                raise ImportError("openpyxl is needed to read .xlsx files") from None
+            self._workbook = load_workbook(path, read_only=True, data_only=True)
+            self._file = None
+        else:
+            self._file = open(path, 'rb')
+            self._size = os.path.getsize(path) or 1
+
+    def __iter__(self):
+        if self._workbook is not None:
+            sheet = self._workbook.active
+            total = max(sheet.max_row or 1, 1)
+            rows = sheet.iter_rows(values_only=True)
+            header = [str(cell or '').strip() for cell in next(rows, ())]
+            for number, values in enumerate(rows, 2):
+                self._done = number / total
+                yield number, {column: value for column, value in zip(header, values)}
+        else:
+            text = io.TextIOWrapper(self._file, encoding='utf-8-sig', newline='')
+            reader = csv.reader(text)
+            header = [column.strip() for column in next(reader, ())]
+            for number, values in enumerate(reader, 2):
+                self._done = self._file.tell() / self._size
+                yield number, dict(zip(header, values))
+        self._done = 1.0
+
+    def fraction(self):
+        return min(self._done, 1.0)
+
+    def close(self):
+        if self._workbook is not None:
+            self._workbook.close()
+        if self._file is not None:
+            self._file.close()
+
+
+class ImportResult:
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.errors = []        # (row number, message)
+        self.new_categories = 0
+        self.new_units = 0
+        self.cancelled = False
+
+    def __repr__(self):
+        return (f"ImportResult(created={self.created}, updated={self.updated}, errors={len(self.errors)}, "
+                f"new_categories={self.new_categories}, new_units={self.new_units}, cancelled={self.cancelled})")
+
+
+class Importer:
+    """Upserts rows of one kind ('items', 'suppliers' or 'employees') in chunks.
+
+    Names are resolved to ids through maps loaded once per import; a
+    category or unit that does not exist yet is created. Each chunk is
+    validated in memory, written with executemany and committed on its own,
+    so a bad row is reported and skipped without losing the rest of the file.
+    """
+
+    def __init__(self, db, kind, chunk_size=CHUNK_SIZE):
+        if kind not in UPSERT_SQL:
+            raise ValueError(f"unknown import kind: {kind}")
+        self.db = db
+        self.kind = kind
+        self.chunk_size = chunk_size
+        self.result = ImportResult()
+        self.known = {name for (name,) in db.query(f"SELECT name FROM {kind}")}
+        if kind == 'items':
+            self.category_ids = dict(db.query("SELECT name, id FROM categories"))
+            self.unit_ids = dict(db.query("SELECT name, id FROM units"))
+
+    def run(self, rows):
+        """Imports every row; returns the ImportResult."""
+        for _ in self.chunks(rows):
+            pass
+        return self.result
+
+    def chunks(self, rows):
+        """Imports `rows` chunk by chunk, yielding after each committed chunk."""
+        chunk = []
+        for number, row in rows:
+            chunk.append((number, row))
+            if len(chunk) == self.chunk_size:
+                self._write(chunk)
+                chunk = []
+                yield self.result
+        if chunk:
+            self._write(chunk)
+        yield self.result
+
+    def _write(self, chunk):
+        with self.db.transaction(immediate=True):
+            params = []
+            for number, row in chunk:
+                try:
+                    params.append(self._prepare(row))
+                except ValueError as e:
+                    self.result.errors.append((number, str(e)))
+            self.db.executemany(UPSERT_SQL[self.kind], params)
+            created = {}
+            for values in params:
+                if values['name'] not in self.known and values['name'] not in created:
+                    created[values['name']] = values.get('quantity')
+            if self.kind == 'items':
+                self._open_stock(created)
+        self.known.update(created)
+        self.result.created += len(created)
+        self.result.updated += len(params) - len(created)
+
+    def _open_stock(self, created):
+        # The new items were inserted with no stock; their quantities are received into them
+        opening = [(name, qty) for name, qty in created.items() if qty]
+        ids = {}
+        for start in range(0, len(opening), 500):
+            names = [name for name, _ in opening[start:start + 500]]
+            ids.update(self.db.query(f"SELECT name, id FROM items WHERE name IN ({', '.join('?' * len(names))})",
+                                     names))
+        post_opening_stock(self.db, [(ids[name], qty) for name, qty in opening])
+
+    def _prepare(self, row):
+        row = {HEADER_ALIASES.get(str(column).strip(), column): value for column, value in row.items()}
+        name = _text(row.get('name'))
+        if not name:
+            raise ValueError("الاسم مطلوب")
+        if self.kind == 'suppliers':
+            return {'name': name, 'contact_info': _text(row.get('contact_info'))}
+        if self.kind == 'employees':
+            return {'name': name, 'position': _text(row.get('position'))}
+
+        quantity = row.get('quantity')
+        try:
+            quantity = int(float(quantity)) if _text(quantity) else 0
+        except (TypeError, ValueError, OverflowError):
+            # 'inf', a date cell and the like are refused with the row, not the whole import
+            raise ValueError(f"كمية غير صحيحة: {quantity}") from None
+        if quantity < 0:
+            raise ValueError(f"كمية غير صحيحة: {quantity}")
+        return {
+            'name': name,
+            'description': _text(row.get('description')),
+            'quantity': quantity,
+            'category_id': self._lookup('categories', self.category_ids, _text(row.get('category'))),
+            'unit_id': self._lookup('units', self.unit_ids, _text(row.get('unit'))),
+        }
+
+    def _lookup(self, table, ids, name):
+        if not name:
+            return None
+        if name not in ids:
+            # Runs inside the chunk's transaction, so it is undone with it
+            ids[name] = self.db.execute(f"INSERT INTO {table} (name) VALUES (?)", (name,)).lastrowid
+            if table == 'categories':
+                self.result.new_categories += 1
+            else:
+                self.result.new_units += 1
+        return ids[name]
+
+
+def _text(value):
+    return '' if value is None else str(value).strip()
+
+
+if __name__ == "__main__":
+    # python importer.py <items|suppliers|employees> <file.csv|file.xlsx> [database]
+    import sys
+    import time
+    from database import DB_NAME, Database, setup_database
+
+    kind, path = sys.argv[1], sys.argv[2]
+    db_path = sys.argv[3] if len(sys.argv) > 3 else DB_NAME
+    setup_database(db_path)
+    db = Database(db_path)
+    source = RowSource(path)
+    started = time.perf_counter()
+    try:
+        result = Importer(db, kind).run(source)
+    finally:
+        source.close()
+        db.close()
+    print(f"{result} in {time.perf_counter() - started:.2f} s")
+    for number, message in result.errors:
+        print(f"row {number}: {message}")
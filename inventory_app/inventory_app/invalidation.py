@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""Invalidation bus: mutations say which tables changed, views refresh once per idle cycle."""
+import sys
+
+
+class InvalidationBus:
+    """Collects "table changed" notices and runs each affected view once.
+
+    Views subscribe to the tables they read. Publishing only marks those
+    views dirty; the refreshes run together from Tk's after_idle, so any
+    number of notices raised while handling one user action costs at most
+    one refresh per view.
+
+    A plain subscriber is called with no arguments. An incremental
+    subscriber is called with {table: set of row ids, or None when the
+    whole table must be re-read}.
+
+    Caches register with watch() instead: they are told at once, with
+    (table, ids), so they are already fresh when the views refresh.
+    """
+
+    def __init__(self, widget):
+        self.widget = widget
+        self._subscribers = {}      # table -> [subscription]
+        self._watchers = {}         # table -> [callback]
+        self._dirty = {}            # subscription -> {table: ids or None}
+        self._scheduled = None
+
+    def subscribe(self, tables, callback, incremental=False):
+        subscription = (callback, incremental)
+        for table in tables:
+            self._subscribers.setdefault(table, []).append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        for subscriptions in self._subscribers.values():
+            if subscription in subscriptions:
+                subscriptions.remove(subscription)
+        self._dirty.pop(subscription, None)
+
+    def watch(self, tables, callback):
+        for table in tables:
+            self._watchers.setdefault(table, []).append(callback)
+
+    def publish(self, table, ids=None):
+        """Marks `table` changed, either wholly or only for the rows in `ids`."""
+        for callback in self._watchers.get(table, ()):
+            callback(table, ids)
+        for subscription in self._subscribers.get(table, ()):
+            changes = self._dirty.setdefault(subscription, {})
+            if ids is None or (table in changes and changes[table] is None):
+                changes[table] = None
+            else:
+                changes.setdefault(table, set()).update(ids)
+        if self._dirty and self._scheduled is None:
+            self._scheduled = self.widget.after_idle(self.flush)
+
+    def is_pending(self):
+        """Whether some view is waiting for the next flush."""
+        return bool(self._dirty)
+
+    def flush(self):
+        """Runs every pending refresh now."""
+        if self._scheduled is not None:
+            self.widget.after_cancel(self._scheduled)
+            self._scheduled = None
+        dirty, self._dirty = self._dirty, {}
+        for (callback, incremental), changes in dirty.items():
+            try:
+                if incremental:
+                    callback(changes)
+                else:
+                    callback()
+            except Exception:
+                self.widget.report_callback_exception(*sys.exc_info())
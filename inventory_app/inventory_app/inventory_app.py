@@ -1,91 +1,74 @@
 # -*- coding: utf-8 -*-
 import tkinter as tk
-from tkinter import ttk, messagebox, simpledialog
-import sqlite3
+from tkinter import ttk, messagebox, simpledialog, filedialog
+import sys
+import threading
 from datetime import datetime
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-
-# --- Database Setup ---
-DB_NAME = 'college_inventory.db'
-
-def setup_database():
-    """Creates the database and tables if they don't exist."""
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-
-    # Suppliers Table
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS suppliers (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT NOT NULL UNIQUE,
-        contact_info TEXT
-    )
-    ''')
-
-    # Employees Table
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS employees (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT NOT NULL UNIQUE,
-        position TEXT
-    )
-    ''')
-    
-    # Categories Table
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS categories (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT NOT NULL UNIQUE
-    )
-    ''')
-
-    # Units Table
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS units (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT NOT NULL UNIQUE
-    )
-    ''')
-
-    # Items Table
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS items (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT NOT NULL UNIQUE,
-        description TEXT,
-        quantity INTEGER NOT NULL DEFAULT 0,
-        category_id INTEGER,
-        unit_id INTEGER,
-        FOREIGN KEY (category_id) REFERENCES categories(id),
-        FOREIGN KEY (unit_id) REFERENCES units(id)
-    )
-    ''')
-    
-    # Transactions Table
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS transactions (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        item_id INTEGER NOT NULL,
-        quantity INTEGER NOT NULL,
-        transaction_type TEXT NOT NULL, -- 'RECEIVE' or 'ISSUE'
-        transaction_date TEXT NOT NULL,
-        employee_id INTEGER NOT NULL,
-        supplier_id INTEGER, -- Only for RECEIVE transactions
-        notes TEXT,
-        FOREIGN KEY (item_id) REFERENCES items(id),
-        FOREIGN KEY (employee_id) REFERENCES employees(id),
-        FOREIGN KEY (supplier_id) REFERENCES suppliers(id)
-    )
-    ''')
-    
-    conn.commit()
-    conn.close()
+from time import perf_counter
+
+import diagnostics
+from archive import history_first_page, history_newer_page, history_older_page, history_row, history_rows
+from charts import PieChart, show_detailed_chart
+from client import RemoteDatabase, RemoteService
+from dashboard import load_dashboard_stats
+from database import (
+    Database, setup_database, RECENT_ACTIVITY_SQL, ITEMS_LIST_SQL, ITEM_ROW_SQL, LOW_STOCK_SQL, LOW_STOCK_ROW_SQL,
+)
+from executor import READ_WORKERS, QueryExecutor
+from exporter import FORMATS, ExportCancelled, export
+from importer import RowSource
+from invalidation import InvalidationBus
+from refdata import ReferenceCache
+from search import search
+from service import InventoryService, ServiceError
+from snapshots import SNAPSHOT_CATCHUP, stock_as_of
+from widgets import PagedTreeview, TreeSync, TypeAhead
+
+# How often the dashboard looks for postings made from other workstations
+DASHBOARD_POLL_MS = 2000
+
+class StartupTimer:
+    """Records when each startup phase finishes, for the --startup-report output."""
+
+    def __init__(self):
+        self.started = perf_counter()
+        self.phases = []        # (phase, seconds since start)
+
+    def mark(self, phase):
+        self.phases.append((phase, perf_counter() - self.started))
+
+    def report(self):
+        lines, previous = [], 0.0
+        for phase, at in sorted(self.phases, key=lambda p: p[1]):
+            lines.append(f"{phase:<16} {(at - previous) * 1000:8.1f} ms  (at {at * 1000:8.1f} ms)")
+            previous = at
+        return '\n'.join(lines)
+
 
 # --- Main Application Class ---
 class InventoryApp(tk.Tk):
-    def __init__(self):
+    def __init__(self, db=None, startup=None, startup_report=False, server=None, readers=READ_WORKERS):
         super().__init__()
+        self.startup = startup or StartupTimer()
+        self.startup_report = startup_report
+        # With a server URL every read and write goes to server.py instead of the file
+        self.db = RemoteDatabase(server) if server else db or Database()
+        self.startup.mark('connect')
+        # Long reads run on background readers; self.db stays the only writer.
+        # readers=0 runs them on the Tk thread instead, as benchmark.py does
+        self.executor = QueryExecutor(self, self.db.path, readers,
+                                      opener=(lambda: RemoteDatabase(server)) if server else None)
+        # Mutations publish the tables they touched; views refresh once per idle cycle
+        self.bus = InvalidationBus(self)
+        # Names and ids of the lookup tables, corrected on every publish
+        self.refdata = ReferenceCache(self.db, self.bus)
+        # Every change goes through the service; the handlers below only read
+        # the widgets and show its answer
+        if server:
+            self.service = RemoteService(server, self.bus.publish, self.db)
+        else:
+            self.service = InventoryService(self.db, self.refdata, self.bus.publish)
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
         self.title("نظام إدارة مخزن كلية العلوم والتقنية")
         
         # جعل النافذة ملء الشاشة
@@ -107,6 +90,20 @@ class InventoryApp(tk.Tk):
         self.style.configure('TButton', font=self.medium_font, padding=[10, 5])
         self.style.configure('Treeview.Heading', font=self.medium_font)
 
+        # Global search over item names, descriptions and movement notes
+        search_frame = ttk.Frame(self)
+        search_frame.pack(fill='x', padx=10, pady=(10, 0))
+        ttk.Label(search_frame, text="بحث:", font=self.medium_font).pack(side='left', padx=5)
+        self.search_entry = ttk.Entry(search_frame, width=50, font=self.medium_font)
+        self.search_entry.pack(side='left', padx=5)
+        self.search_entry.bind('<Return>', lambda event: self.run_search())
+        ttk.Button(search_frame, text="بحث", command=self.run_search).pack(side='left', padx=5)
+        self.search_window = None
+        self.consumption = None     # analytics.ConsumptionModel, made on first use
+        # Hidden panel with the session's slowest queries and refreshes
+        self.bind('<Control-D>', lambda event: self.show_diagnostics())
+        self.diagnostics_window = None
+
         # Create a notebook (tabbed interface)
         self.notebook = ttk.Notebook(self)
         self.notebook.pack(fill='both', expand=True, padx=10, pady=10)
@@ -136,21 +133,68 @@ class InventoryApp(tk.Tk):
         self.items_notebook.add(self.items_frame, text="إدارة الأصناف")
         self.items_notebook.add(self.categories_frame, text="إدارة الفئات")
         self.items_notebook.add(self.units_frame, text="إدارة الوحدات")
-
-        # Initialize each tab
-        self.create_dashboard_tab()
-        self.create_items_tab()
-        self.create_categories_tab()
-        self.create_units_tab()
-        self.create_suppliers_tab()
-        self.create_employees_tab()
-        self.create_transactions_tab()
+        self.startup.mark('window')
+
+        # Tabs are built and loaded the first time they are shown; only the
+        # dashboard is built at launch
+        self.tab_builders = {
+            str(self.dashboard_frame): self.create_dashboard_tab,
+            str(self.items_frame): self.create_items_tab,
+            str(self.categories_frame): self.create_categories_tab,
+            str(self.units_frame): self.create_units_tab,
+            str(self.suppliers_frame): self.create_suppliers_tab,
+            str(self.employees_frame): self.create_employees_tab,
+            str(self.transactions_frame): self.create_transactions_tab,
+        }
+        self.notebook.bind('<<NotebookTabChanged>>', self.on_tab_changed)
+        self.items_notebook.bind('<<NotebookTabChanged>>', self.on_tab_changed)
+        self.build_tab(self.dashboard_frame)
+        self.startup.mark('dashboard tab')
 
         # Make the dashboard the default tab
         self.notebook.select(self.dashboard_frame)
-
-    def get_connection(self):
-        return sqlite3.connect(DB_NAME)
+        self.after_idle(self.on_first_idle)
+
+    def on_tab_changed(self, event):
+        frame = self.notebook.select()
+        if frame == str(self.items_main_frame):
+            frame = self.items_notebook.select()
+        elif event.widget is self.items_notebook:
+            return      # sub-tab switched while the items tab is hidden
+        self.build_tab(frame)
+
+    def build_tab(self, frame):
+        builder = self.tab_builders.pop(str(frame), None)
+        if builder is not None:
+            builder()
+
+    def on_first_idle(self):
+        self.startup.mark('first idle')
+        self.finish_startup()
+        self.close_snapshot_periods()
+
+    def close_snapshot_periods(self):
+        # Periods that ended since the last run get their closing balances;
+        # a longer gap is left to `snapshots.py --backfill`
+        try:
+            self.service.close_periods(max_periods=SNAPSHOT_CATCHUP)
+        except ServiceError:
+            pass    # another workstation is writing; the next start will do it
+
+    def finish_startup(self):
+        # Startup ends once the window is idle and the dashboard has its data
+        phases = {phase for phase, _ in self.startup.phases}
+        if self.startup_report and {'first idle', 'dashboard data'} <= phases:
+            self.startup_report = False
+            print(self.startup.report(), file=sys.stderr)
+
+    def on_close(self):
+        self.after_cancel(self.dashboard_poll)
+        self.executor.close()
+        if isinstance(self.service, RemoteService):
+            self.service.close()
+        self.db.close()
+        self.destroy()
 
     # --- Dashboard Tab ---
     def create_dashboard_tab(self):
@@ -164,21 +208,30 @@ class InventoryApp(tk.Tk):
         self.style.configure('CardTitle.TLabel', font=self.large_font, background='#f0f0f0')
         self.style.configure('CardValue.TLabel', font=('Arial', 20, 'bold'), background='#f0f0f0')
 
-        self.create_card(cards_frame, "إجمالي الأصناف", self.get_total_items, 0)
-        self.create_card(cards_frame, "الأصناف منخفضة المخزون", self.get_low_stock_items, 1)
-        self.create_card(cards_frame, "المستلم اليوم", self.get_today_transactions, 2, transaction_type='RECEIVE')
-        self.create_card(cards_frame, "المسلم اليوم", self.get_today_transactions, 3, transaction_type='ISSUE')
+        self.card_labels = {}
+        self.create_card(cards_frame, "إجمالي الأصناف", 'total_items', 0)
+        self.create_card(cards_frame, "الأصناف منخفضة المخزون", 'low_stock', 1)
+        self.create_card(cards_frame, "المستلم اليوم", 'received_today', 2)
+        self.create_card(cards_frame, "المسلم اليوم", 'issued_today', 3)
 
         middle_frame = ttk.Frame(main_container)
         middle_frame.pack(fill='both', expand=True)
 
         chart_container = ttk.LabelFrame(middle_frame, text="نظرة عامة على المخزون", padding="10")
         chart_container.pack(side='left', fill='both', expand=True, padx=(0, 10))
-        
-        self.chart_figure, self.chart_ax = plt.subplots(figsize=(6, 4), dpi=80)
-        self.chart_canvas = FigureCanvasTkAgg(self.chart_figure, master=chart_container)
-        self.chart_canvas.get_tk_widget().pack(fill='both', expand=True)
-        self.update_overview_chart()
+
+        # Drawn natively; matplotlib is only loaded for the detailed report
+        ttk.Button(chart_container, text="تقرير مفصل", command=self.show_detailed_chart).pack(side='bottom', anchor='e')
+        ttk.Button(chart_container, text="اقتراحات إعادة الطلب",
+                   command=self.open_reorder_suggestions).pack(side='bottom', anchor='e', pady=(0, 5))
+        self.chart = PieChart(chart_container, font=self.small_font, title_font=self.medium_font, width=480, height=320)
+        self.chart.pack(fill='both', expand=True)
+        self.chart_categories = None
+        self.dashboard_loaded = False
+        self.update_dashboard()
+        self.bus.subscribe(('items', 'categories', 'transactions'), self.update_dashboard)
+        self.dashboard_version = self.get_dashboard_version()
+        self.dashboard_poll = self.after(DASHBOARD_POLL_MS, self.poll_dashboard)
 
         activity_container = ttk.LabelFrame(middle_frame, text="الأنشطة الحديثة", padding="10")
         activity_container.pack(side='right', fill='both', expand=True)
@@ -195,9 +248,25 @@ class InventoryApp(tk.Tk):
         self.activity_tree.column('Qty', width=60, anchor='center')
         
         self.activity_tree.pack(fill='both', expand=True)
+        self.activity_sync = TreeSync(self.activity_tree, format_row=self.format_activity_row)
         self.update_recent_activity()
-
-    def create_card(self, parent, title, command_func, column, **kwargs):
+        self.bus.subscribe(('transactions', 'items', 'employees'), self.update_recent_activity)
+
+        # Items below their own reorder level; a posting only re-checks the items it moved
+        alerts_container = ttk.LabelFrame(main_container, text="تنبيهات المخزون", padding="10")
+        alerts_container.pack(fill='x', pady=(20, 0))
+        self.alerts_tree = ttk.Treeview(alerts_container, columns=('Item', 'Qty', 'Level'), show='headings', height=5)
+        self.alerts_tree.heading('Item', text='المادة', font=self.medium_font)
+        self.alerts_tree.heading('Qty', text='الرصيد', font=self.medium_font)
+        self.alerts_tree.heading('Level', text='حد إعادة الطلب', font=self.medium_font)
+        self.alerts_tree.column('Qty', width=80, anchor='center')
+        self.alerts_tree.column('Level', width=120, anchor='center')
+        self.alerts_tree.pack(fill='both', expand=True)
+        self.alerts_sync = TreeSync(self.alerts_tree, format_row=lambda row: row[1:], sort_key=lambda row: row[1])
+        self.refresh_alerts()
+        self.bus.subscribe(('items',), self.on_alert_items_changed, incremental=True)
+
+    def create_card(self, parent, title, stat, column):
         card = ttk.Frame(parent, style='Card.TFrame', padding="15")
         card.grid(row=0, column=column, padx=10, pady=10, sticky="nsew")
         parent.grid_columnconfigure(column, weight=1)
@@ -205,100 +274,134 @@ class InventoryApp(tk.Tk):
         title_label = ttk.Label(card, text=title, style='CardTitle.TLabel', font=self.large_font)
         title_label.pack()
         
-        value = command_func(**kwargs)
-        value_label = ttk.Label(card, text=str(value), style='CardValue.TLabel', font=('Arial', 20, 'bold'))
+        value_label = ttk.Label(card, text="0", style='CardValue.TLabel', font=('Arial', 20, 'bold'))
         value_label.pack()
+        self.card_labels[stat] = value_label
+
+    def update_dashboard(self):
+        # One aggregated query feeds both the cards and the chart
+        self.executor.submit('dashboard', load_dashboard_stats, self.show_dashboard, busy=self.dashboard_frame)
+
+    def show_dashboard(self, stats):
+        if not self.dashboard_loaded:
+            self.dashboard_loaded = True
+            self.startup.mark('dashboard data')
+            self.after_idle(self.finish_startup)
+        for stat, label in self.card_labels.items():
+            label.configure(text=str(getattr(stats, stat)))
+        if stats.categories != self.chart_categories:
+            self.update_overview_chart(stats.categories)
+
+    def get_dashboard_version(self):
+        # data_version moves when another connection commits; the date moves at midnight
+        return self.db.data_version(), datetime.now().date()
+
+    def poll_dashboard(self):
+        version = self.get_dashboard_version()
+        if version != self.dashboard_version:
+            if version[0] != self.dashboard_version[0]:
+                # Another workstation wrote: names may have changed under the cache
+                self.refdata.clear()
+            self.dashboard_version = version
+            self.update_dashboard()
+        self.dashboard_poll = self.after(DASHBOARD_POLL_MS, self.poll_dashboard)
+
+    def update_overview_chart(self, categories=None):
+        if categories is None:
+            categories = load_dashboard_stats(self.db).categories
+        self.chart_categories = categories
+        categories = [c for c in categories if c.total > 0]
+
+        if not categories or all(c.ok == 0 for c in categories):
+            self.chart.show_message('لا توجد بيانات لعرضها')
+        else:
+            labels = [f"{c.name} (منخفض: {c.low})" for c in categories]
+            sizes = [c.ok for c in categories]
+            self.chart.show('نسبة الأصناف ذات المخزون الكافي حسب الفئة', labels, sizes)
+
+    def show_detailed_chart(self):
+        show_detailed_chart(self, self.chart_categories or [])
 
-    def get_total_items(self):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT COUNT(*) FROM items")
-        count = cursor.fetchone()[0]
-        conn.close()
-        return count
-
-    def get_low_stock_items(self, threshold=10):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT COUNT(*) FROM items WHERE quantity < ?", (threshold,))
-        count = cursor.fetchone()[0]
-        conn.close()
-        return count
-
-    def get_today_transactions(self, transaction_type=None):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        today_date = datetime.now().strftime('%Y-%m-%d')
-        if transaction_type:
-            cursor.execute("SELECT COUNT(*) FROM transactions WHERE transaction_type = ? AND DATE(transaction_date) = ?", (transaction_type, today_date))
+    def open_reorder_suggestions(self):
+        # NumPy is optional and only imported the first time suggestions are asked for
+        try:
+            from analytics import ANALYSIS_DAYS, ConsumptionModel
+        except ImportError:
+            messagebox.showerror("خطأ", "اقتراحات إعادة الطلب تتطلب تثبيت مكتبة numpy.")
+            return
+        if self.consumption is None:
+            self.consumption = ConsumptionModel()
+
+        window = tk.Toplevel(self)
+        window.title("اقتراحات إعادة الطلب")
+        window.geometry("1000x500")
+        status = ttk.Label(window, text="جارٍ التحليل...", font=self.medium_font)
+        status.pack(padx=10, pady=5, anchor='w')
+        columns = ('Name', 'Quantity', 'Rate', 'Deviation', 'Cover', 'Reorder', 'Order')
+        titles = ('اسم الصنف', 'الرصيد', 'الاستهلاك اليومي', 'التذبذب', 'أيام التغطية', 'نقطة إعادة الطلب', 'الكمية المقترحة')
+        tree_frame = ttk.Frame(window)
+        tree_frame.pack(padx=10, pady=10, fill='both', expand=True)
+        tree = ttk.Treeview(tree_frame, columns=columns, show='headings')
+        for column, title in zip(columns, titles):
+            tree.heading(column, text=title, font=self.medium_font)
+            tree.column(column, width=110, anchor='center')
+        tree.column('Name', width=250, anchor='w')
+        scrollbar = ttk.Scrollbar(tree_frame, orient="vertical", command=tree.yview)
+        tree.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side='right', fill='y')
+        tree.pack(fill='both', expand=True)
+        sync = TreeSync(tree, format_row=lambda s: (
+            s.name, s.quantity, f"{s.rate:.2f}", f"{s.deviation:.2f}", f"{s.days_of_cover:.1f}",
+            f"{s.reorder_point:.0f}", s.order_quantity))
+
+        def show(suggestions):
+            sync.sync(suggestions)
+            status.configure(text=f"{len(suggestions)} صنف بلغ نقطة إعادة الطلب (حسب استهلاك آخر {ANALYSIS_DAYS} يوماً)")
+
+        def refresh():
+            # The model only reads the movements posted since its last refresh
+            self.executor.submit('reorder', self.consumption.refresh, show, busy=tree,
+                                 errback=lambda error: status.configure(text=f"تعذر التحليل: {error}"))
+
+        subscription = self.bus.subscribe(('transactions', 'items'), refresh)
+
+        def close():
+            self.bus.unsubscribe(subscription)
+            self.executor.cancel('reorder')
+            window.destroy()
+
+        window.protocol("WM_DELETE_WINDOW", close)
+        refresh()
+
+    def refresh_alerts(self, item_ids=None):
+        """Re-reads every item below its level, or only the items in `item_ids` when given."""
+        if item_ids is None:
+            self.executor.submit('alerts', lambda db: db.query(LOW_STOCK_SQL), self.alerts_sync.sync,
+                                 busy=self.alerts_tree)
         else:
-            cursor.execute("SELECT COUNT(*) FROM transactions WHERE DATE(transaction_date) = ?", (today_date,))
-        count = cursor.fetchone()[0]
-        conn.close()
-        return count
-
-    def update_overview_chart(self):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT c.name, COUNT(i.id) FROM categories c LEFT JOIN items i ON c.id = i.category_id GROUP BY c.name")
-        categories_data = cursor.fetchall()
-        conn.close()
-
-        if not categories_data or all(count == 0 for _, count in categories_data):
-            self.chart_ax.clear()
-            self.chart_ax.text(0.5, 0.5, 'لا توجد بيانات لعرضها', horizontalalignment='center', verticalalignment='center', transform=self.chart_ax.transAxes)
+            changed, cleared = [], []
+            for item_id in item_ids:
+                row = self.db.query_one(LOW_STOCK_ROW_SQL, (item_id,))
+                if row is None:
+                    cleared.append(item_id)
+                else:
+                    changed.append(row)
+            self.alerts_sync.apply(changed=changed, deleted=cleared)
+
+    def on_alert_items_changed(self, changes):
+        if changes['items'] is None or self.executor.is_pending('alerts'):
+            self.refresh_alerts()
         else:
-            labels = []
-            low_stock_counts = []
-            ok_stock_counts = []
-            
-            threshold = 10
-            for category, total in categories_data:
-                if total > 0:
-                    conn = self.get_connection()
-                    cursor = conn.cursor()
-                    cursor.execute("SELECT COUNT(*) FROM items i JOIN categories c ON i.category_id = c.id WHERE c.name = ? AND i.quantity < ?", (category, threshold))
-                    low = cursor.fetchone()[0]
-                    conn.close()
-                    ok = total - low
-                    
-                    labels.append(f"{category} (منخفض: {low})")
-                    low_stock_counts.append(low)
-                    ok_stock_counts.append(ok)
-
-            self.chart_ax.clear()
-            sizes = ok_stock_counts
-            explode = [0.05] * len(labels)
-            
-            self.chart_ax.pie(sizes, explode=explode, labels=labels, autopct='%1.1f%%', shadow=True, startangle=90)
-            self.chart_ax.axis('equal')
-            self.chart_ax.set_title('نسبة الأصناف ذات المخزون الكافي حسب الفئة')
-
-        self.chart_canvas.draw()
+            self.refresh_alerts(item_ids=changes['items'])
 
     def update_recent_activity(self):
-        for i in self.activity_tree.get_children():
-            self.activity_tree.delete(i)
-            
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        query = '''
-        SELECT 
-            t.transaction_date, t.transaction_type, 
-            i.name AS item_name, t.quantity,
-            e.name AS employee_name
-        FROM transactions t
-        JOIN items i ON t.item_id = i.id
-        JOIN employees e ON t.employee_id = e.id
-        ORDER BY t.transaction_date DESC
-        LIMIT 20
-        '''
-        cursor.execute(query)
-        for row in cursor.fetchall():
-            formatted_date = datetime.strptime(row[0], '%Y-%m-%d %H:%M:%S').strftime('%d/%m/%Y %H:%M')
-            type_ar = "استلام" if row[1] == 'RECEIVE' else "تسليم"
-            self.activity_tree.insert('', 'end', values=(formatted_date, type_ar, row[2], row[3], row[4]))
-        conn.close()
+        self.executor.submit('activity', lambda db: db.query(RECENT_ACTIVITY_SQL), self.activity_sync.sync,
+                             busy=self.activity_tree)
+
+    def format_activity_row(self, row):
+        formatted_date = datetime.strptime(row[1], '%Y-%m-%d %H:%M:%S').strftime('%d/%m/%Y %H:%M')
+        type_ar = "استلام" if row[2] == 'RECEIVE' else "تسليم"
+        return (formatted_date, type_ar, row[3], row[4], row[5])
 
     # --- Units Tab ---
     def create_units_tab(self):
@@ -326,33 +429,26 @@ class InventoryApp(tk.Tk):
         self.units_tree.heading('Name', text='اسم الوحدة', font=self.medium_font)
         self.units_tree.column('ID', width=50, anchor='center')
         self.units_tree.pack(fill='both', expand=True)
+        self.units_sync = TreeSync(self.units_tree)
         self.units_tree.bind('<Double-1>', self.load_unit_data)
 
         ttk.Button(tree_frame, text="حذف المحدد", command=self.delete_unit).pack(pady=5)
         
         self.refresh_units_tree()
+        self.bus.subscribe(('units',), self.refresh_units_tree)
 
     def clear_unit_form(self):
         self.unit_name_entry.delete(0, tk.END)
         self.unit_id_var.set("")
 
     def add_unit(self):
-        name = self.unit_name_entry.get()
-        if not name:
-            messagebox.showerror("خطأ", "اسم الوحدة مطلوب.")
-            return
-        conn = self.get_connection()
-        cursor = conn.cursor()
         try:
-            cursor.execute("INSERT INTO units (name) VALUES (?)", (name,))
-            conn.commit()
-            messagebox.showinfo("نجاح", "تمت إضافة الوحدة بنجاح.")
-            self.clear_unit_form()
-            self.refresh_units_tree()
-        except sqlite3.IntegrityError:
-            messagebox.showerror("خطأ", "هذه الوحدة موجودة بالفعل.")
-        finally:
-            conn.close()
+            self.service.add_unit(self.unit_name_entry.get())
+        except ServiceError as e:
+            messagebox.showerror("خطأ", str(e))
+            return
+        messagebox.showinfo("نجاح", "تمت إضافة الوحدة بنجاح.")
+        self.clear_unit_form()
 
     def load_unit_data(self, event):
         selected_item = self.units_tree.focus()
@@ -368,22 +464,13 @@ class InventoryApp(tk.Tk):
         if not unit_id:
             messagebox.showerror("خطأ", "الرجاء اختيار وحدة للتعديل.")
             return
-        name = self.unit_name_entry.get()
-        if not name:
-            messagebox.showerror("خطأ", "اسم الوحدة مطلوب.")
-            return
-        conn = self.get_connection()
-        cursor = conn.cursor()
         try:
-            cursor.execute("UPDATE units SET name=? WHERE id=?", (name, unit_id))
-            conn.commit()
-            messagebox.showinfo("نجاح", "تم تعديل الوحدة بنجاح.")
-            self.clear_unit_form()
-            self.refresh_units_tree()
-        except sqlite3.IntegrityError:
-            messagebox.showerror("خطأ", "هذه الوحدة موجودة بالفعل.")
-        finally:
-            conn.close()
+            self.service.rename_master('units', unit_id, self.unit_name_entry.get())
+        except ServiceError as e:
+            messagebox.showerror("خطأ", str(e))
+            return
+        messagebox.showinfo("نجاح", "تم تعديل الوحدة بنجاح.")
+        self.clear_unit_form()
 
     def delete_unit(self):
         selected_item = self.units_tree.focus()
@@ -392,30 +479,15 @@ class InventoryApp(tk.Tk):
             return
         unit_id = self.units_tree.item(selected_item)['values'][0]
         if messagebox.askyesno("تأكيد الحذف", "هل أنت متأكد من حذف هذه الوحدة؟ لا يمكن حذف وحدة مرتبطة بصنف."):
-            conn = self.get_connection()
-            cursor = conn.cursor()
             try:
-                cursor.execute("DELETE FROM units WHERE id=?", (unit_id,))
-                conn.commit()
-                messagebox.showinfo("نجاح", "تم حذف الوحدة بنجاح.")
-                self.refresh_units_tree()
-            except sqlite3.IntegrityError:
-                 messagebox.showerror("خطأ", "لا يمكن حذف هذه الوحدة لأنها مرتبطة بأحد الأصناف.")
-            finally:
-                conn.close()
+                self.service.delete_master('units', unit_id)
+            except ServiceError as e:
+                messagebox.showerror("خطأ", str(e))
+                return
+            messagebox.showinfo("نجاح", "تم حذف الوحدة بنجاح.")
 
     def refresh_units_tree(self):
-        for i in self.units_tree.get_children():
-            self.units_tree.delete(i)
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, name FROM units ORDER BY name")
-        for row in cursor.fetchall():
-            self.units_tree.insert('', 'end', values=row)
-        conn.close()
-        # Update comboboxes in other tabs
-        if hasattr(self, 'item_unit_combobox'):
-            self.refresh_item_comboboxes()
+        self.units_sync.sync(self.db.query("SELECT id, name FROM units ORDER BY name"))
 
     # --- Categories Tab ---
     def create_categories_tab(self):
@@ -443,33 +515,26 @@ class InventoryApp(tk.Tk):
         self.categories_tree.heading('Name', text='اسم الفئة', font=self.medium_font)
         self.categories_tree.column('ID', width=50, anchor='center')
         self.categories_tree.pack(fill='both', expand=True)
+        self.categories_sync = TreeSync(self.categories_tree)
         self.categories_tree.bind('<Double-1>', self.load_category_data)
 
         ttk.Button(tree_frame, text="حذف المحدد", command=self.delete_category).pack(pady=5)
         
         self.refresh_categories_tree()
+        self.bus.subscribe(('categories',), self.refresh_categories_tree)
 
     def clear_category_form(self):
         self.category_name_entry.delete(0, tk.END)
         self.category_id_var.set("")
 
     def add_category(self):
-        name = self.category_name_entry.get()
-        if not name:
-            messagebox.showerror("خطأ", "اسم الفئة مطلوب.")
-            return
-        conn = self.get_connection()
-        cursor = conn.cursor()
         try:
-            cursor.execute("INSERT INTO categories (name) VALUES (?)", (name,))
-            conn.commit()
-            messagebox.showinfo("نجاح", "تمت إضافة الفئة بنجاح.")
-            self.clear_category_form()
-            self.refresh_categories_tree()
-        except sqlite3.IntegrityError:
-            messagebox.showerror("خطأ", "هذه الفئة موجودة بالفعل.")
-        finally:
-            conn.close()
+            self.service.add_category(self.category_name_entry.get())
+        except ServiceError as e:
+            messagebox.showerror("خطأ", str(e))
+            return
+        messagebox.showinfo("نجاح", "تمت إضافة الفئة بنجاح.")
+        self.clear_category_form()
 
     def load_category_data(self, event):
         selected_item = self.categories_tree.focus()
@@ -485,22 +550,13 @@ class InventoryApp(tk.Tk):
         if not category_id:
             messagebox.showerror("خطأ", "الرجاء اختيار فئة للتعديل.")
             return
-        name = self.category_name_entry.get()
-        if not name:
-            messagebox.showerror("خطأ", "اسم الفئة مطلوب.")
-            return
-        conn = self.get_connection()
-        cursor = conn.cursor()
         try:
-            cursor.execute("UPDATE categories SET name=? WHERE id=?", (name, category_id))
-            conn.commit()
-            messagebox.showinfo("نجاح", "تم تعديل الفئة بنجاح.")
-            self.clear_category_form()
-            self.refresh_categories_tree()
-        except sqlite3.IntegrityError:
-            messagebox.showerror("خطأ", "هذه الفئة موجودة بالفعل.")
-        finally:
-            conn.close()
+            self.service.rename_master('categories', category_id, self.category_name_entry.get())
+        except ServiceError as e:
+            messagebox.showerror("خطأ", str(e))
+            return
+        messagebox.showinfo("نجاح", "تم تعديل الفئة بنجاح.")
+        self.clear_category_form()
 
     def delete_category(self):
         selected_item = self.categories_tree.focus()
@@ -509,32 +565,15 @@ class InventoryApp(tk.Tk):
             return
         category_id = self.categories_tree.item(selected_item)['values'][0]
         if messagebox.askyesno("تأكيد الحذف", "هل أنت متأكد من حذف هذه الفئة؟ لا يمكن حذف فئة مرتبطة بصنف."):
-            conn = self.get_connection()
-            cursor = conn.cursor()
             try:
-                cursor.execute("DELETE FROM categories WHERE id=?", (category_id,))
-                conn.commit()
-                messagebox.showinfo("نجاح", "تم حذف الفئة بنجاح.")
-                self.refresh_categories_tree()
-            except sqlite3.IntegrityError:
-                 messagebox.showerror("خطأ", "لا يمكن حذف هذه الفئة لأنها مرتبطة بأحد الأصناف.")
-            finally:
-                conn.close()
+                self.service.delete_master('categories', category_id)
+            except ServiceError as e:
+                messagebox.showerror("خطأ", str(e))
+                return
+            messagebox.showinfo("نجاح", "تم حذف الفئة بنجاح.")
 
     def refresh_categories_tree(self):
-        for i in self.categories_tree.get_children():
-            self.categories_tree.delete(i)
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, name FROM categories ORDER BY name")
-        for row in cursor.fetchall():
-            self.categories_tree.insert('', 'end', values=row)
-        conn.close()
-        # Update comboboxes and chart in other tabs
-        if hasattr(self, 'item_category_combobox'):
-            self.refresh_item_comboboxes()
-        if hasattr(self, 'chart_ax'):
-            self.update_overview_chart()
+        self.categories_sync.sync(self.db.query("SELECT id, name FROM categories ORDER BY name"))
 
     # --- Items Tab ---
     def create_items_tab(self):
@@ -560,97 +599,93 @@ class InventoryApp(tk.Tk):
         ttk.Label(form_frame, text="الوحدة:", font=self.medium_font).grid(row=4, column=0, padx=5, pady=5, sticky='w')
         self.item_unit_combobox = ttk.Combobox(form_frame, state="readonly", width=38, font=self.medium_font)
         self.item_unit_combobox.grid(row=4, column=1, padx=5, pady=5)
+
+        ttk.Label(form_frame, text="حد إعادة الطلب:", font=self.medium_font).grid(row=5, column=0, padx=5, pady=5, sticky='w')
+        self.item_reorder_entry = ttk.Entry(form_frame, width=40, font=self.medium_font)
+        self.item_reorder_entry.grid(row=5, column=1, padx=5, pady=5)
+
+        ttk.Label(form_frame, text="الحد الأعلى (اختياري):", font=self.medium_font).grid(row=6, column=0, padx=5, pady=5, sticky='w')
+        self.item_max_entry = ttk.Entry(form_frame, width=40, font=self.medium_font)
+        self.item_max_entry.grid(row=6, column=1, padx=5, pady=5)
         
         self.item_id_var = tk.StringVar()
 
         button_frame = ttk.Frame(form_frame)
-        button_frame.grid(row=5, column=0, columnspan=2, pady=10)
+        button_frame.grid(row=7, column=0, columnspan=2, pady=10)
 
         ttk.Button(button_frame, text="إضافة صنف", command=self.add_item).pack(side='left', padx=5)
         ttk.Button(button_frame, text="تعديل صنف", command=self.update_item).pack(side='left', padx=5)
         ttk.Button(button_frame, text="مسح الحقول", command=self.clear_item_form).pack(side='left', padx=5)
+        ttk.Button(button_frame, text="استيراد من ملف", command=lambda: self.import_file('items')).pack(side='left', padx=5)
+        ttk.Button(button_frame, text="تصدير...", command=lambda: self.open_export_dialog('items')).pack(side='left', padx=5)
+        ttk.Button(button_frame, text="الرصيد في تاريخ...", command=self.open_stock_as_of_dialog).pack(side='left', padx=5)
 
         tree_frame = ttk.LabelFrame(self.items_frame, text="قائمة الأصناف")
         tree_frame.pack(padx=10, pady=10, fill='both', expand=True)
 
-        self.items_tree = ttk.Treeview(tree_frame, columns=('ID', 'Name', 'Description', 'Quantity', 'Category', 'Unit'), show='headings')
+        self.items_tree = ttk.Treeview(tree_frame, columns=('ID', 'Name', 'Description', 'Quantity', 'Category', 'Unit', 'Reorder', 'Max'), show='headings')
         self.items_tree.heading('ID', text='الرقم', font=self.medium_font)
         self.items_tree.heading('Name', text='اسم الصنف', font=self.medium_font)
         self.items_tree.heading('Description', text='الوصف', font=self.medium_font)
         self.items_tree.heading('Quantity', text='الكمية', font=self.medium_font)
         self.items_tree.heading('Category', text='الفئة', font=self.medium_font)
         self.items_tree.heading('Unit', text='الوحدة', font=self.medium_font)
+        self.items_tree.heading('Reorder', text='حد إعادة الطلب', font=self.medium_font)
+        self.items_tree.heading('Max', text='الحد الأعلى', font=self.medium_font)
 
         self.items_tree.column('ID', width=40, anchor='center')
         self.items_tree.column('Quantity', width=80, anchor='center')
+        self.items_tree.column('Reorder', width=110, anchor='center')
+        self.items_tree.column('Max', width=90, anchor='center')
         
         self.items_tree.pack(fill='both', expand=True)
+        self.items_sync = TreeSync(self.items_tree, sort_key=lambda row: row[1],
+                                   format_row=lambda row: (*row[:7], '' if row[7] is None else row[7]))
         self.items_tree.bind('<Double-1>', self.load_item_data)
 
         ttk.Button(tree_frame, text="حذف المحدد", command=self.delete_item).pack(pady=5)
         
         self.refresh_item_comboboxes()
         self.refresh_items_tree()
+        self.bus.subscribe(('categories', 'units'), self.refresh_item_comboboxes)
+        self.bus.subscribe(('items', 'categories', 'units'), self.on_items_changed, incremental=True)
 
     def clear_item_form(self):
         self.item_name_entry.delete(0, tk.END)
         self.item_desc_entry.delete(0, tk.END)
+        self.item_qty_entry.state(['!disabled'])
         self.item_qty_entry.delete(0, tk.END)
         self.item_category_combobox.set('')
         self.item_unit_combobox.set('')
+        self.item_reorder_entry.delete(0, tk.END)
+        self.item_max_entry.delete(0, tk.END)
         self.item_id_var.set("")
 
     def refresh_item_comboboxes(self):
-        conn = self.get_connection()
-        cursor = conn.cursor()
         # Refresh Categories
-        cursor.execute("SELECT name FROM categories ORDER BY name")
-        categories = [row[0] for row in cursor.fetchall()]
-        self.item_category_combobox['values'] = categories
+        self.item_category_combobox['values'] = self.refdata.names('categories')
         # Refresh Units
-        cursor.execute("SELECT name FROM units ORDER BY name")
-        units = [row[0] for row in cursor.fetchall()]
-        self.item_unit_combobox['values'] = units
-        conn.close()
-        # Also refresh transaction combobox
-        if hasattr(self, 'trans_item_combobox'):
-            self.refresh_comboboxes()
+        self.item_unit_combobox['values'] = self.refdata.names('units')
 
     def add_item(self):
-        name = self.item_name_entry.get()
-        desc = self.item_desc_entry.get()
-        qty_str = self.item_qty_entry.get()
-        category_name = self.item_category_combobox.get()
-        unit_name = self.item_unit_combobox.get()
-
-        if not all([name, qty_str, category_name, unit_name]):
-            messagebox.showerror("خطأ", "جميع الحقول مطلوبة ما عدا الوصف.")
-            return
-
         try:
-            qty = int(qty_str)
-        except ValueError:
-            messagebox.showerror("خطأ", "الكمية يجب أن تكون رقماً.")
+            self.service.add_item(**self.read_item_form())
+        except ServiceError as e:
+            messagebox.showerror("خطأ", str(e))
             return
-
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        try:
-            cursor.execute("SELECT id FROM categories WHERE name=?", (category_name,))
-            category_id = cursor.fetchone()[0]
-            cursor.execute("SELECT id FROM units WHERE name=?", (unit_name,))
-            unit_id = cursor.fetchone()[0]
-
-            cursor.execute("INSERT INTO items (name, description, quantity, category_id, unit_id) VALUES (?, ?, ?, ?, ?)", 
-                           (name, desc, qty, category_id, unit_id))
-            conn.commit()
-            messagebox.showinfo("نجاح", "تمت إضافة الصنف بنجاح.")
-            self.clear_item_form()
-            self.refresh_items_tree()
-        except sqlite3.IntegrityError:
-            messagebox.showerror("خطأ", "هذا الصنف موجود بالفعل.")
-        finally:
-            conn.close()
+        messagebox.showinfo("نجاح", "تمت إضافة الصنف بنجاح.")
+        self.clear_item_form()
+
+    def read_item_form(self):
+        return {
+            'name': self.item_name_entry.get(),
+            'description': self.item_desc_entry.get(),
+            'quantity': self.item_qty_entry.get(),
+            'category': self.item_category_combobox.get(),
+            'unit': self.item_unit_combobox.get(),
+            'reorder_level': self.item_reorder_entry.get(),
+            'max_level': self.item_max_entry.get(),
+        }
 
     def load_item_data(self, event):
         selected_item = self.items_tree.focus()
@@ -664,50 +699,30 @@ class InventoryApp(tk.Tk):
         self.item_name_entry.insert(0, values[1])
         self.item_desc_entry.delete(0, tk.END)
         self.item_desc_entry.insert(0, values[2])
+        # The stock of an existing item only changes through postings
+        self.item_qty_entry.state(['!disabled'])
         self.item_qty_entry.delete(0, tk.END)
         self.item_qty_entry.insert(0, values[3])
+        self.item_qty_entry.state(['disabled'])
         self.item_category_combobox.set(values[4])
         self.item_unit_combobox.set(values[5])
+        self.item_reorder_entry.delete(0, tk.END)
+        self.item_reorder_entry.insert(0, values[6])
+        self.item_max_entry.delete(0, tk.END)
+        self.item_max_entry.insert(0, values[7])
 
     def update_item(self):
         item_id = self.item_id_var.get()
         if not item_id:
             messagebox.showerror("خطأ", "الرجاء اختيار صنف للتعديل.")
             return
-
-        name = self.item_name_entry.get()
-        desc = self.item_desc_entry.get()
-        qty_str = self.item_qty_entry.get()
-        category_name = self.item_category_combobox.get()
-        unit_name = self.item_unit_combobox.get()
-
-        if not all([name, qty_str, category_name, unit_name]):
-            messagebox.showerror("خطأ", "جميع الحقول مطلوبة ما عدا الوصف.")
-            return
         try:
-            qty = int(qty_str)
-        except ValueError:
-            messagebox.showerror("خطأ", "الكمية يجب أن تكون رقماً.")
+            self.service.update_item(item_id, **{**self.read_item_form(), 'quantity': None})
+        except ServiceError as e:
+            messagebox.showerror("خطأ", str(e))
             return
-
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        try:
-            cursor.execute("SELECT id FROM categories WHERE name=?", (category_name,))
-            category_id = cursor.fetchone()[0]
-            cursor.execute("SELECT id FROM units WHERE name=?", (unit_name,))
-            unit_id = cursor.fetchone()[0]
-
-            cursor.execute("UPDATE items SET name=?, description=?, quantity=?, category_id=?, unit_id=? WHERE id=?", 
-                           (name, desc, qty, category_id, unit_id, item_id))
-            conn.commit()
-            messagebox.showinfo("نجاح", "تم تعديل الصنف بنجاح.")
-            self.clear_item_form()
-            self.refresh_items_tree()
-        except sqlite3.IntegrityError:
-            messagebox.showerror("خطأ", "هذا الصنف موجود بالفعل.")
-        finally:
-            conn.close()
+        messagebox.showinfo("نجاح", "تم تعديل الصنف بنجاح.")
+        self.clear_item_form()
 
     def delete_item(self):
         selected_item = self.items_tree.focus()
@@ -717,40 +732,37 @@ class InventoryApp(tk.Tk):
         
         item_id = self.items_tree.item(selected_item)['values'][0]
         
-        if messagebox.askyesno("تأكيد الحذف", "هل أنت متأكد من حذف هذا الصنف؟ سيتم حذف جميع سجلاته المتعلقة بالحركات."):
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            cursor.execute("DELETE FROM transactions WHERE item_id=?", (item_id,))
-            cursor.execute("DELETE FROM items WHERE id=?", (item_id,))
-            conn.commit()
-            conn.close()
+        if messagebox.askyesno("تأكيد الحذف", "هل أنت متأكد من حذف هذا الصنف؟"):
+            try:
+                self.service.delete_item(item_id)
+            except ServiceError as e:
+                messagebox.showerror("خطأ", str(e))
+                return
             messagebox.showinfo("نجاح", "تم حذف الصنف بنجاح.")
-            self.refresh_items_tree()
 
-    def refresh_items_tree(self):
-        for i in self.items_tree.get_children():
-            self.items_tree.delete(i)
-        
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        query = '''
-        SELECT 
-            i.id, i.name, i.description, i.quantity, 
-            c.name AS category_name, u.name AS unit_name
-        FROM items i
-        LEFT JOIN categories c ON i.category_id = c.id
-        LEFT JOIN units u ON i.unit_id = u.id
-        ORDER BY i.name
-        '''
-        cursor.execute(query)
-        for row in cursor.fetchall():
-            self.items_tree.insert('', 'end', values=row)
-        conn.close()
-        # Update dashboard when items change
-        if hasattr(self, 'chart_ax'):
-            self.update_overview_chart()
-        if hasattr(self, 'trans_item_combobox'):
-            self.refresh_comboboxes()
+    def refresh_items_tree(self, item_ids=None):
+        """Re-reads every item, or only the rows of `item_ids` when given."""
+        if item_ids is None:
+            self.executor.submit('items', lambda db: db.query(ITEMS_LIST_SQL), self.items_sync.sync,
+                                 busy=self.items_tree)
+        else:
+            changed, deleted = [], []
+            for item_id in item_ids:
+                row = self.db.query_one(ITEM_ROW_SQL, (item_id,))
+                if row is None:
+                    deleted.append(item_id)
+                else:
+                    changed.append(row)
+            self.items_sync.apply(changed=changed, deleted=deleted)
+
+    def on_items_changed(self, changes):
+        # Category or unit renames show up in every row; item edits only in their own.
+        # A full reload still in flight predates this change, so it is re-run instead.
+        if ('categories' in changes or 'units' in changes or changes['items'] is None
+                or self.executor.is_pending('items')):
+            self.refresh_items_tree()
+        else:
+            self.refresh_items_tree(item_ids=changes['items'])
 
     # --- Suppliers Tab ---
     def create_suppliers_tab(self):
@@ -765,7 +777,8 @@ class InventoryApp(tk.Tk):
         self.supplier_contact_entry = ttk.Entry(form_frame, width=40, font=self.medium_font)
         self.supplier_contact_entry.grid(row=1, column=1, padx=5, pady=5)
 
-        ttk.Button(form_frame, text="إضافة مورد", command=self.add_supplier).grid(row=2, column=0, columnspan=2, pady=10)
+        ttk.Button(form_frame, text="إضافة مورد", command=self.add_supplier).grid(row=2, column=0, pady=10)
+        ttk.Button(form_frame, text="استيراد من ملف", command=lambda: self.import_file('suppliers')).grid(row=2, column=1, pady=10)
 
         tree_frame = ttk.LabelFrame(self.suppliers_frame, text="قائمة الموردين")
         tree_frame.pack(padx=10, pady=10, fill='both', expand=True)
@@ -776,42 +789,23 @@ class InventoryApp(tk.Tk):
         self.suppliers_tree.heading('Contact', text='معلومات الاتصال', font=self.medium_font)
         self.suppliers_tree.column('ID', width=50, anchor='center')
         self.suppliers_tree.pack(fill='both', expand=True)
+        self.suppliers_sync = TreeSync(self.suppliers_tree)
         
         self.refresh_suppliers_tree()
+        self.bus.subscribe(('suppliers',), self.refresh_suppliers_tree)
 
     def add_supplier(self):
-        name = self.supplier_name_entry.get()
-        contact = self.supplier_contact_entry.get()
-        if not name:
-            messagebox.showerror("خطأ", "اسم المورد مطلوب.")
-            return
-
-        conn = self.get_connection()
-        cursor = conn.cursor()
         try:
-            cursor.execute("INSERT INTO suppliers (name, contact_info) VALUES (?, ?)", (name, contact))
-            conn.commit()
-            messagebox.showinfo("نجاح", "تمت إضافة المورد بنجاح.")
-            self.supplier_name_entry.delete(0, tk.END)
-            self.supplier_contact_entry.delete(0, tk.END)
-            self.refresh_suppliers_tree()
-        except sqlite3.IntegrityError:
-            messagebox.showerror("خطأ", "هذا المورد موجود بالفعل.")
-        finally:
-            conn.close()
+            self.service.add_supplier(self.supplier_name_entry.get(), self.supplier_contact_entry.get())
+        except ServiceError as e:
+            messagebox.showerror("خطأ", str(e))
+            return
+        messagebox.showinfo("نجاح", "تمت إضافة المورد بنجاح.")
+        self.supplier_name_entry.delete(0, tk.END)
+        self.supplier_contact_entry.delete(0, tk.END)
 
     def refresh_suppliers_tree(self):
-        for i in self.suppliers_tree.get_children():
-            self.suppliers_tree.delete(i)
-        
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, name, contact_info FROM suppliers ORDER BY name")
-        for row in cursor.fetchall():
-            self.suppliers_tree.insert('', 'end', values=row)
-        conn.close()
-        if hasattr(self, 'trans_supplier_combobox'):
-            self.refresh_comboboxes()
+        self.suppliers_sync.sync(self.db.query("SELECT id, name, contact_info FROM suppliers ORDER BY name"))
 
     # --- Employees Tab ---
     def create_employees_tab(self):
@@ -826,7 +820,8 @@ class InventoryApp(tk.Tk):
         self.employee_position_entry = ttk.Entry(form_frame, width=40, font=self.medium_font)
         self.employee_position_entry.grid(row=1, column=1, padx=5, pady=5)
 
-        ttk.Button(form_frame, text="إضافة موظف", command=self.add_employee).grid(row=2, column=0, columnspan=2, pady=10)
+        ttk.Button(form_frame, text="إضافة موظف", command=self.add_employee).grid(row=2, column=0, pady=10)
+        ttk.Button(form_frame, text="استيراد من ملف", command=lambda: self.import_file('employees')).grid(row=2, column=1, pady=10)
 
         tree_frame = ttk.LabelFrame(self.employees_frame, text="قائمة الموظفين")
         tree_frame.pack(padx=10, pady=10, fill='both', expand=True)
@@ -837,42 +832,316 @@ class InventoryApp(tk.Tk):
         self.employees_tree.heading('Position', text='المنصب', font=self.medium_font)
         self.employees_tree.column('ID', width=50, anchor='center')
         self.employees_tree.pack(fill='both', expand=True)
+        self.employees_sync = TreeSync(self.employees_tree)
 
         self.refresh_employees_tree()
+        self.bus.subscribe(('employees',), self.refresh_employees_tree)
 
     def add_employee(self):
-        name = self.employee_name_entry.get()
-        position = self.employee_position_entry.get()
-        if not name:
-            messagebox.showerror("خطأ", "اسم الموظف مطلوب.")
+        try:
+            self.service.add_employee(self.employee_name_entry.get(), self.employee_position_entry.get())
+        except ServiceError as e:
+            messagebox.showerror("خطأ", str(e))
             return
+        messagebox.showinfo("نجاح", "تمت إضافة الموظف بنجاح.")
+        self.employee_name_entry.delete(0, tk.END)
+        self.employee_position_entry.delete(0, tk.END)
+
+    def refresh_employees_tree(self):
+        self.employees_sync.sync(self.db.query("SELECT id, name, position FROM employees ORDER BY name"))
 
-        conn = self.get_connection()
-        cursor = conn.cursor()
+    # --- Bulk Import ---
+    def import_file(self, kind):
+        path = filedialog.askopenfilename(title="استيراد من ملف",
+                                          filetypes=[("CSV / Excel", "*.csv *.xlsx"), ("كل الملفات", "*.*")])
+        if not path:
+            return
         try:
-            cursor.execute("INSERT INTO employees (name, position) VALUES (?, ?)", (name, position))
-            conn.commit()
-            messagebox.showinfo("نجاح", "تمت إضافة الموظف بنجاح.")
-            self.employee_name_entry.delete(0, tk.END)
-            self.employee_position_entry.delete(0, tk.END)
-            self.refresh_employees_tree()
-        except sqlite3.IntegrityError:
-            messagebox.showerror("خطأ", "هذا الموظف موجود بالفعل.")
-        finally:
-            conn.close()
+            source = RowSource(path)
+        except (OSError, ImportError) as e:
+            messagebox.showerror("خطأ", f"تعذر فتح الملف: {e}")
+            return
+        result, chunks = self.service.import_rows(kind, source)
+
+        window = tk.Toplevel(self)
+        window.title("استيراد من ملف")
+        progress = ttk.Progressbar(window, length=420, maximum=1.0)
+        progress.pack(padx=10, pady=10)
+        status = ttk.Label(window, text="", font=self.medium_font)
+        status.pack(padx=10)
+        errors_text = tk.Text(window, width=60, height=12, font=self.small_font)
+        errors_text.pack(padx=10, pady=10, fill='both', expand=True)
+        button = ttk.Button(window, text="إلغاء")
+        button.pack(pady=(0, 10))
+        shown_errors = [0]
+
+        def show_progress():
+            progress['value'] = source.fraction()
+            status.configure(text=f"جديد: {result.created}   محدّث: {result.updated}   أخطاء: {len(result.errors)}")
+            for number, message in result.errors[shown_errors[0]:]:
+                errors_text.insert(tk.END, f"السطر {number}: {message}\n")
+            shown_errors[0] = len(result.errors)
+
+        def finish():
+            chunks.close()
+            source.close()
+            show_progress()
+            if result.cancelled:
+                status.configure(text=status.cget('text') + "   (أُلغي)")
+            button.configure(text="إغلاق", command=window.destroy)
+            window.protocol("WM_DELETE_WINDOW", window.destroy)
+
+        def cancel():
+            result.cancelled = True
+
+        def step():
+            # One chunk per turn of the event loop keeps the window responsive
+            if result.cancelled:
+                finish()
+                return
+            try:
+                next(chunks)
+            except StopIteration:
+                finish()
+                return
+            except Exception as e:
+                # The chunks before this one are committed; say how far it got
+                finish()
+                status.configure(text=status.cget('text') + "   (توقف)")
+                messagebox.showerror("خطأ", f"توقف الاستيراد بسبب خطأ غير متوقع: {e}\n"
+                                     f"جديد: {result.created}   محدّث: {result.updated}   "
+                                     f"أخطاء: {len(result.errors)}", parent=window)
+                return
+            show_progress()
+            self.after(1, step)
+
+        button.configure(command=cancel)
+        window.protocol("WM_DELETE_WINDOW", cancel)
+        self.after(1, step)
+
+    # --- Export ---
+    def open_export_dialog(self, report='transactions'):
+        reports = {'transactions': "سجل الحركات", 'items': "قائمة الأصناف", 'stock': "أرصدة المخزون"}
+        types = {"": None, "استلام": 'RECEIVE', "تسليم": 'ISSUE'}
+
+        window = tk.Toplevel(self)
+        window.title("تصدير البيانات")
+        form = ttk.Frame(window, padding="10")
+        form.pack(fill='both', expand=True)
+
+        ttk.Label(form, text="التقرير:", font=self.medium_font).grid(row=0, column=0, padx=5, pady=5, sticky='w')
+        report_combobox = ttk.Combobox(form, state="readonly", values=list(reports.values()), font=self.medium_font)
+        report_combobox.set(reports[report])
+        report_combobox.grid(row=0, column=1, padx=5, pady=5)
+        ttk.Label(form, text="الصيغة:", font=self.medium_font).grid(row=1, column=0, padx=5, pady=5, sticky='w')
+        format_combobox = ttk.Combobox(form, state="readonly", values=FORMATS, font=self.medium_font)
+        format_combobox.set('csv')
+        format_combobox.grid(row=1, column=1, padx=5, pady=5)
+
+        # Filters apply to the transactions ledger
+        ttk.Label(form, text="من تاريخ (YYYY-MM-DD):", font=self.medium_font).grid(row=2, column=0, padx=5, pady=5, sticky='w')
+        from_entry = ttk.Entry(form, font=self.medium_font)
+        from_entry.grid(row=2, column=1, padx=5, pady=5)
+        ttk.Label(form, text="إلى تاريخ (YYYY-MM-DD):", font=self.medium_font).grid(row=3, column=0, padx=5, pady=5, sticky='w')
+        to_entry = ttk.Entry(form, font=self.medium_font)
+        to_entry.grid(row=3, column=1, padx=5, pady=5)
+        ttk.Label(form, text="المادة:", font=self.medium_font).grid(row=4, column=0, padx=5, pady=5, sticky='w')
+        item_combobox = ttk.Combobox(form, font=self.medium_font)
+        item_combobox.grid(row=4, column=1, padx=5, pady=5)
+        TypeAhead(item_combobox, self.refdata.search)
+        ttk.Label(form, text="النوع:", font=self.medium_font).grid(row=5, column=0, padx=5, pady=5, sticky='w')
+        type_combobox = ttk.Combobox(form, state="readonly", values=list(types), font=self.medium_font)
+        type_combobox.grid(row=5, column=1, padx=5, pady=5)
+
+        status = ttk.Label(form, text="", font=self.medium_font)
+        status.grid(row=6, column=0, columnspan=2, pady=5)
+        button_frame = ttk.Frame(form)
+        button_frame.grid(row=7, column=0, columnspan=2, pady=10)
+        export_button = ttk.Button(button_frame, text="تصدير")
+        export_button.pack(side='left', padx=5)
+        cancel_button = ttk.Button(button_frame, text="إلغاء", state='disabled')
+        cancel_button.pack(side='left', padx=5)
+
+        running = {}    # cancel event and row count of the export in progress
+
+        def start():
+            filters = {'date_from': from_entry.get().strip(), 'date_to': to_entry.get().strip(),
+                       'item': self.refdata.match(item_combobox.get().strip()) or item_combobox.get().strip(), 'type': types[type_combobox.get()]}
+            try:
+                for day in (filters['date_from'], filters['date_to']):
+                    if day:
+                        datetime.strptime(day, '%Y-%m-%d')
+            except ValueError:
+                messagebox.showerror("خطأ", "صيغة التاريخ يجب أن تكون YYYY-MM-DD.", parent=window)
+                return
+            chosen = next(key for key, title in reports.items() if title == report_combobox.get())
+            fmt = format_combobox.get()
+            path = filedialog.asksaveasfilename(parent=window, defaultextension='.' + fmt,
+                                                filetypes=[(fmt.upper(), '*.' + fmt)])
+            if not path:
+                return
 
-    def refresh_employees_tree(self):
-        for i in self.employees_tree.get_children():
-            self.employees_tree.delete(i)
-        
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, name, position FROM employees ORDER BY name")
-        for row in cursor.fetchall():
-            self.employees_tree.insert('', 'end', values=row)
-        conn.close()
-        if hasattr(self, 'trans_employee_combobox'):
-            self.refresh_comboboxes()
+            running.update(cancel=threading.Event(), rows=0)
+
+            def progress(rows):
+                running['rows'] = rows      # set on the reader thread, read by show_progress
+
+            # Runs on a background reader, so the window stays responsive
+            self.executor.submit('export', export, done, chosen, path, fmt, filters, progress, running['cancel'],
+                                 busy=window, errback=failed)
+            export_button.configure(state='disabled')
+            cancel_button.configure(state='normal')
+            show_progress()
+
+        def show_progress():
+            if self.executor.is_pending('export'):
+                status.configure(text=f"جارٍ التصدير... {running['rows']} سطر")
+                window.after(200, show_progress)
+
+        def stop(text):
+            status.configure(text=text)
+            export_button.configure(state='normal')
+            cancel_button.configure(state='disabled')
+
+        def done(rows):
+            stop(f"تم تصدير {rows} سطر.")
+
+        def failed(error):
+            stop("أُلغي التصدير." if isinstance(error, ExportCancelled) else f"فشل التصدير: {error}")
+
+        def cancel():
+            running['cancel'].set()
+            self.executor.cancel('export')
+            stop("أُلغي التصدير.")
+
+        def close():
+            if self.executor.is_pending('export'):
+                cancel()
+            window.destroy()
+
+        export_button.configure(command=start)
+        cancel_button.configure(command=cancel)
+        window.protocol("WM_DELETE_WINDOW", close)
+
+    # --- Stock As Of ---
+    def open_stock_as_of_dialog(self):
+        window = tk.Toplevel(self)
+        window.title("الرصيد في تاريخ")
+        window.geometry("700x500")
+        form = ttk.Frame(window, padding="10")
+        form.pack(fill='x')
+        ttk.Label(form, text="التاريخ (YYYY-MM-DD):", font=self.medium_font).pack(side='left', padx=5)
+        day_entry = ttk.Entry(form, width=15, font=self.medium_font)
+        day_entry.insert(0, datetime.now().strftime('%Y-%m-%d'))
+        day_entry.pack(side='left', padx=5)
+        show_button = ttk.Button(form, text="عرض")
+        show_button.pack(side='left', padx=5)
+        status = ttk.Label(window, text="", font=self.medium_font)
+        status.pack(padx=10, anchor='w')
+
+        tree_frame = ttk.Frame(window)
+        tree_frame.pack(padx=10, pady=10, fill='both', expand=True)
+        tree = ttk.Treeview(tree_frame, columns=('Name', 'Category', 'Unit', 'Quantity'), show='headings')
+        for column, title in zip(tree['columns'], ('اسم الصنف', 'الفئة', 'الوحدة', 'الرصيد')):
+            tree.heading(column, text=title, font=self.medium_font)
+        tree.column('Quantity', width=100, anchor='center')
+        scrollbar = ttk.Scrollbar(tree_frame, orient="vertical", command=tree.yview)
+        tree.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side='right', fill='y')
+        tree.pack(fill='both', expand=True)
+        sync = TreeSync(tree, format_row=lambda row: (row[1], row[2] or '-', row[3] or '-', row[4]))
+
+        def show():
+            day = day_entry.get().strip()
+            try:
+                datetime.strptime(day, '%Y-%m-%d')
+            except ValueError:
+                messagebox.showerror("خطأ", "صيغة التاريخ يجب أن تكون YYYY-MM-DD.", parent=window)
+                return
+            status.configure(text="جارٍ الحساب...")
+            # Nearest snapshot plus the movements since, on a background reader
+            self.executor.submit('stock_as_of', stock_as_of, lambda result: done(day, *result), day,
+                                 busy=window, errback=lambda error: status.configure(text=f"تعذر الحساب: {error}"))
+
+        def done(day, rows, base):
+            sync.sync(rows)
+            source = f"لقطة {base}" if base else "الرصيد الحالي"
+            status.configure(text=f"الرصيد في نهاية {day}: {len(rows)} صنف (محسوب من {source})")
+
+        def close():
+            self.executor.cancel('stock_as_of')
+            window.destroy()
+
+        show_button.configure(command=show)
+        day_entry.bind('<Return>', lambda event: show())
+        window.protocol("WM_DELETE_WINDOW", close)
+        show()
+
+    # --- Global Search ---
+    def run_search(self):
+        text = self.search_entry.get().strip()
+        if not text:
+            return
+        # Ranked on a background reader; a newer search replaces one still running
+        self.executor.submit('search', search, lambda hits: self.show_search_results(text, hits), text,
+                             busy=self.search_entry,
+                             errback=lambda error: messagebox.showerror("خطأ", f"تعذر البحث: {error}"))
+
+    def show_search_results(self, text, hits):
+        if self.search_window is None or not self.search_window.winfo_exists():
+            window = self.search_window = tk.Toplevel(self)
+            window.geometry("900x400")
+            tree = ttk.Treeview(window, columns=('Kind', 'Title', 'Snippet'), show='headings')
+            tree.heading('Kind', text='النوع', font=self.medium_font)
+            tree.heading('Title', text='السجل', font=self.medium_font)
+            tree.heading('Snippet', text='النص المطابق', font=self.medium_font)
+            tree.column('Kind', width=80, anchor='center')
+            tree.column('Title', width=350)
+            tree.column('Snippet', width=450)
+            scrollbar = ttk.Scrollbar(window, orient="vertical", command=tree.yview)
+            tree.configure(yscrollcommand=scrollbar.set)
+            scrollbar.pack(side='right', fill='y')
+            tree.pack(fill='both', expand=True)
+            tree.bind('<Double-1>', lambda event: self.open_search_hit(tree.focus()))
+            kinds = {'item': "صنف", 'transaction': "حركة"}
+            self.search_sync = TreeSync(tree, key=lambda hit: f"{hit.kind}:{hit.id}",
+                                        format_row=lambda hit: (kinds[hit.kind], hit.title, hit.snippet))
+        self.search_window.title(f"نتائج البحث عن: {text} ({len(hits)})")
+        self.search_sync.sync(hits)
+        self.search_window.lift()
+
+    def open_search_hit(self, iid):
+        # Shows the item in the items list, or the movement in the history.
+        # Tabs are built here and not left to <<NotebookTabChanged>>, which
+        # Tk delivers later; the row is selected once its rows have loaded.
+        kind, _, hit_id = iid.partition(':')
+        if kind == 'item':
+            self.build_tab(self.items_frame)
+            self.notebook.select(self.items_main_frame)
+            self.items_notebook.select(self.items_frame)
+            if self.items_tree.exists(hit_id) and not self.executor.is_pending('items'):
+                self.reveal_row(self.items_tree, hit_id)
+            else:
+                self.executor.submit('items', lambda db: db.query(ITEMS_LIST_SQL),
+                                     lambda rows: self.show_items_and_reveal(rows, hit_id), busy=self.items_tree)
+        elif kind == 'transaction':
+            self.build_tab(self.transactions_frame)
+            self.notebook.select(self.transactions_frame)
+            self.history_view.show_around(lambda db: history_row(db, int(hit_id)), self.reveal_transaction)
+
+    def reveal_transaction(self, row):
+        if row is not None:
+            self.reveal_row(self.transactions_tree, str(row[0]))
+
+    def show_items_and_reveal(self, rows, item_id):
+        self.items_sync.sync(rows)
+        self.reveal_row(self.items_tree, item_id)
+
+    def reveal_row(self, tree, iid):
+        if tree.exists(iid):
+            tree.selection_set(iid)
+            tree.focus(iid)
+            tree.see(iid)
 
     # --- Transactions Tab ---
     def create_transactions_tab(self):
@@ -888,8 +1157,9 @@ class InventoryApp(tk.Tk):
         form_frame.pack(padx=10, pady=10, fill='x')
 
         ttk.Label(form_frame, text="المادة:", font=self.medium_font).grid(row=0, column=0, padx=5, pady=5, sticky='w')
-        self.trans_item_combobox = ttk.Combobox(form_frame, state="readonly", width=37, font=self.medium_font)
+        self.trans_item_combobox = ttk.Combobox(form_frame, width=37, font=self.medium_font)
         self.trans_item_combobox.grid(row=0, column=1, padx=5, pady=5)
+        self.trans_item_picker = TypeAhead(self.trans_item_combobox, self.refdata.search)
         
         ttk.Label(form_frame, text="الكمية:", font=self.medium_font).grid(row=1, column=0, padx=5, pady=5, sticky='w')
         self.trans_qty_entry = ttk.Entry(form_frame, width=40, font=self.medium_font)
@@ -910,11 +1180,38 @@ class InventoryApp(tk.Tk):
         
         ttk.Button(form_frame, text="تسجيل الحركة", command=self.record_transaction).grid(row=5, column=0, columnspan=2, pady=10)
 
+        # Voucher mode: a whole delivery or issue request, posted at once under one voucher number.
+        # Type, employee, supplier and notes are taken from the form above.
+        voucher_frame = ttk.LabelFrame(self.transactions_frame, text="سند متعدد الأسطر")
+        voucher_frame.pack(padx=10, pady=10, fill='x')
+
+        ttk.Label(voucher_frame, text="المادة:", font=self.medium_font).grid(row=0, column=0, padx=5, pady=5, sticky='w')
+        self.voucher_item_combobox = ttk.Combobox(voucher_frame, width=30, font=self.medium_font)
+        self.voucher_item_combobox.grid(row=0, column=1, padx=5, pady=5)
+        self.voucher_item_picker = TypeAhead(self.voucher_item_combobox, self.refdata.search)
+        ttk.Label(voucher_frame, text="الكمية:", font=self.medium_font).grid(row=0, column=2, padx=5, pady=5, sticky='w')
+        self.voucher_qty_entry = ttk.Entry(voucher_frame, width=10, font=self.medium_font)
+        self.voucher_qty_entry.grid(row=0, column=3, padx=5, pady=5)
+        ttk.Button(voucher_frame, text="إضافة سطر", command=self.add_voucher_line).grid(row=0, column=4, padx=5, pady=5)
+        ttk.Button(voucher_frame, text="حذف السطر", command=self.remove_voucher_line).grid(row=0, column=5, padx=5, pady=5)
+
+        self.voucher_tree = ttk.Treeview(voucher_frame, columns=('Item', 'Qty'), show='headings', height=5)
+        self.voucher_tree.heading('Item', text='المادة', font=self.medium_font)
+        self.voucher_tree.heading('Qty', text='الكمية', font=self.medium_font)
+        self.voucher_tree.column('Qty', width=80, anchor='center')
+        self.voucher_tree.grid(row=1, column=0, columnspan=6, padx=5, pady=5, sticky='ew')
+        self.voucher_lines = {}     # item name -> quantity, in entry order
+        self.voucher_sync = TreeSync(self.voucher_tree)
+
+        ttk.Button(voucher_frame, text="ترحيل السند", command=self.post_voucher).grid(row=2, column=0, columnspan=3, pady=10)
+        ttk.Button(voucher_frame, text="مسح السند", command=self.clear_voucher).grid(row=2, column=3, columnspan=3, pady=10)
+
         history_frame = ttk.LabelFrame(self.transactions_frame, text="سجل الحركات")
         history_frame.pack(padx=10, pady=10, fill='both', expand=True)
 
-        self.transactions_tree = ttk.Treeview(history_frame, columns=('ID', 'Date', 'Type', 'Item', 'Qty', 'Employee', 'Supplier', 'Notes'), show='headings')
+        self.transactions_tree = ttk.Treeview(history_frame, columns=('ID', 'Voucher', 'Date', 'Type', 'Item', 'Qty', 'Employee', 'Supplier', 'Notes'), show='headings')
         self.transactions_tree.heading('ID', text='الرقم', font=self.medium_font)
+        self.transactions_tree.heading('Voucher', text='رقم السند', font=self.medium_font)
         self.transactions_tree.heading('Date', text='التاريخ', font=self.medium_font)
         self.transactions_tree.heading('Type', text='النوع', font=self.medium_font)
         self.transactions_tree.heading('Item', text='المادة', font=self.medium_font)
@@ -924,11 +1221,34 @@ class InventoryApp(tk.Tk):
         self.transactions_tree.heading('Notes', text='ملاحظات', font=self.medium_font)
 
         self.transactions_tree.column('ID', width=40, anchor='center')
+        self.transactions_tree.column('Voucher', width=70, anchor='center')
         self.transactions_tree.column('Qty', width=60, anchor='center')
+        ttk.Button(history_frame, text="تصدير...", command=lambda: self.open_export_dialog('transactions')).pack(side='bottom', anchor='e', padx=5, pady=5)
+        history_scrollbar = ttk.Scrollbar(history_frame, orient='vertical')
+        history_scrollbar.pack(side='right', fill='y')
         self.transactions_tree.pack(fill='both', expand=True)
+
+        # Only a window of the ledger is kept in the tree; more is fetched on
+        # scroll, from the archived years once the live ones run out
+        self.history_view = PagedTreeview(
+            self.transactions_tree,
+            self.executor,
+            fetch_first=history_first_page,
+            fetch_older=history_older_page,
+            fetch_newer=history_newer_page,
+            fetch_rows=history_rows,
+            row_key=lambda row: (row[1], row[0]),
+            format_row=self.format_transaction_row,
+            scrollbar=history_scrollbar,
+        )
         
         self.refresh_comboboxes()
         self.refresh_transactions_tree()
+        self.bus.subscribe(('items', 'employees', 'suppliers'), self.refresh_comboboxes)
+        # New movements start the window again from the top; renamed items and
+        # people only change the names on the rows already shown
+        self.bus.subscribe(('transactions',), self.refresh_transactions_tree)
+        self.bus.subscribe(('items', 'employees', 'suppliers'), self.history_view.refresh_rows)
 
     def toggle_supplier_field(self):
         if self.transaction_type_var.get() == "RECEIVE":
@@ -939,116 +1259,129 @@ class InventoryApp(tk.Tk):
             self.trans_supplier_combobox.grid_remove()
 
     def refresh_comboboxes(self):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        # Refresh Items
-        cursor.execute("SELECT name FROM items ORDER BY name")
-        items = [row[0] for row in cursor.fetchall()]
-        self.trans_item_combobox['values'] = items
+        # Refresh Items: the pickers only hold the matches for what was typed
+        self.trans_item_picker.refresh()
+        self.voucher_item_picker.refresh()
         # Refresh Employees
-        cursor.execute("SELECT name FROM employees ORDER BY name")
-        employees = [row[0] for row in cursor.fetchall()]
-        self.trans_employee_combobox['values'] = employees
+        self.trans_employee_combobox['values'] = self.refdata.names('employees')
         # Refresh Suppliers
-        cursor.execute("SELECT name FROM suppliers ORDER BY name")
-        suppliers = [row[0] for row in cursor.fetchall()]
-        self.trans_supplier_combobox['values'] = suppliers
-        conn.close()
+        self.trans_supplier_combobox['values'] = self.refdata.names('suppliers')
 
     def record_transaction(self):
-        item_name = self.trans_item_combobox.get()
-        qty_str = self.trans_qty_entry.get()
-        employee_name = self.trans_employee_combobox.get()
-        supplier_name = self.trans_supplier_combobox.get() if self.transaction_type_var.get() == "RECEIVE" else None
-        notes = self.trans_notes_entry.get()
-
-        if not all([item_name, qty_str, employee_name]):
-            messagebox.showerror("خطأ", "حقول المادة، الكمية، والموظف مطلوبة.")
-            return
-        
-        if self.transaction_type_var.get() == "RECEIVE" and not supplier_name:
-            messagebox.showerror("خطأ", "حقل المورد مطلوب لحركة الاستلام.")
+        # Stock is checked and changed in one statement, so a posting from
+        # another workstation can never be lost or overdraw the stock
+        try:
+            self.service.record_movement(self.transaction_type_var.get(), self.trans_item_combobox.get(),
+                                         self.trans_qty_entry.get(), self.trans_employee_combobox.get(),
+                                         self.trans_supplier_combobox.get(), self.trans_notes_entry.get())
+        except ServiceError as e:
+            messagebox.showerror("خطأ", str(e))
             return
 
+        messagebox.showinfo("نجاح", "تم تسجيل الحركة بنجاح.")
+        self.trans_qty_entry.delete(0, tk.END)
+        self.trans_notes_entry.delete(0, tk.END)
+
+    def add_voucher_line(self):
+        item_name = self.refdata.match(self.voucher_item_combobox.get())
         try:
-            qty = int(qty_str)
-            if qty <= 0:
-                raise ValueError("الكمية يجب أن تكون رقماً موجباً.")
+            qty = int(self.voucher_qty_entry.get())
+            if not item_name or qty <= 0:
+                raise ValueError
         except ValueError:
-            messagebox.showerror("خطأ", "الكمية يجب أن تكون رقماً صحيحاً موجباً.")
+            messagebox.showerror("خطأ", "اختر المادة وأدخل كمية صحيحة موجبة.")
             return
+        # A second line for the same item adds to the first
+        self.voucher_lines[item_name] = self.voucher_lines.get(item_name, 0) + qty
+        self.voucher_sync.sync(self.voucher_lines.items())
+        self.voucher_qty_entry.delete(0, tk.END)
 
-        conn = self.get_connection()
-        cursor = conn.cursor()
-
-        cursor.execute("SELECT id FROM items WHERE name=?", (item_name,))
-        item_id = cursor.fetchone()[0]
-        cursor.execute("SELECT id FROM employees WHERE name=?", (employee_name,))
-        employee_id = cursor.fetchone()[0]
-        
-        supplier_id = None
-        if supplier_name:
-            cursor.execute("SELECT id FROM suppliers WHERE name=?", (supplier_name,))
-            supplier_id = cursor.fetchone()[0]
-
-        cursor.execute("SELECT quantity FROM items WHERE id=?", (item_id,))
-        current_qty = cursor.fetchone()[0]
+    def remove_voucher_line(self):
+        for item_name in self.voucher_tree.selection():
+            self.voucher_lines.pop(item_name, None)
+        self.voucher_sync.sync(self.voucher_lines.items())
 
-        if self.transaction_type_var.get() == "RECEIVE":
-            new_qty = current_qty + qty
-        else: # ISSUE
-            if qty > current_qty:
-                messagebox.showerror("خطأ", f"الكمية المطلوبة غير متوفرة. المتوفر: {current_qty}")
-                conn.close()
-                return
-            new_qty = current_qty - qty
-        
-        cursor.execute("UPDATE items SET quantity=? WHERE id=?", (new_qty, item_id))
+    def clear_voucher(self):
+        self.voucher_lines.clear()
+        self.voucher_sync.sync(())
 
-        transaction_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        cursor.execute('''
-            INSERT INTO transactions (item_id, quantity, transaction_type, transaction_date, employee_id, supplier_id, notes)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (item_id, qty, self.transaction_type_var.get(), transaction_date, employee_id, supplier_id, notes))
-        
-        conn.commit()
-        conn.close()
+    def post_voucher(self):
+        try:
+            voucher_no = self.service.post_voucher(self.transaction_type_var.get(), self.voucher_lines.items(),
+                                                   self.trans_employee_combobox.get(),
+                                                   self.trans_supplier_combobox.get(), self.trans_notes_entry.get())
+        except ServiceError as e:
+            messagebox.showerror("خطأ", str(e))
+            return
 
-        messagebox.showinfo("نجاح", "تم تسجيل الحركة بنجاح.")
-        self.trans_qty_entry.delete(0, tk.END)
+        messagebox.showinfo("نجاح", f"تم ترحيل السند رقم {voucher_no} ({len(self.voucher_lines)} سطر).")
+        self.clear_voucher()
         self.trans_notes_entry.delete(0, tk.END)
-        self.refresh_items_tree()
-        self.refresh_transactions_tree()
-        if hasattr(self, 'activity_tree'):
-            self.update_recent_activity()
 
     def refresh_transactions_tree(self):
-        for i in self.transactions_tree.get_children():
-            self.transactions_tree.delete(i)
-        
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        query = '''
-        SELECT 
-            t.id, t.transaction_date, t.transaction_type, 
-            i.name AS item_name, t.quantity,
-            e.name AS employee_name,
-            s.name AS supplier_name,
-            t.notes
-        FROM transactions t
-        JOIN items i ON t.item_id = i.id
-        JOIN employees e ON t.employee_id = e.id
-        LEFT JOIN suppliers s ON t.supplier_id = s.id
-        ORDER BY t.transaction_date DESC
-        '''
-        cursor.execute(query)
-        for row in cursor.fetchall():
-            type_ar = "استلام" if row[2] == 'RECEIVE' else "تسليم"
-            self.transactions_tree.insert('', 'end', values=(row[0], row[1], type_ar, row[3], row[4], row[5], row[6] or '-', row[7] or '-'))
-        conn.close()
+        self.history_view.reload()
+
+    def format_transaction_row(self, row):
+        type_ar = "استلام" if row[2] == 'RECEIVE' else "تسليم"
+        if row[9] is not None:
+            type_ar = "رصيد افتتاحي"
+        return (row[0], row[8] or '-', row[1], type_ar, row[3], row[4], row[5], row[6] or '-', row[7] or '-')
+
+    # --- Diagnostics ---
+    def show_diagnostics(self):
+        if diagnostics.recorder is None:
+            messagebox.showinfo("التشخيص", "التشخيص غير مفعل. شغّل البرنامج مع الخيار --diagnostics.")
+            return
+        if self.diagnostics_window is None or not self.diagnostics_window.winfo_exists():
+            window = self.diagnostics_window = tk.Toplevel(self)
+            window.title("التشخيص: أبطأ العمليات في هذه الجلسة")
+            window.geometry("1100x450")
+            buttons = ttk.Frame(window)
+            buttons.pack(fill='x', padx=10, pady=5)
+            ttk.Button(buttons, text="تحديث", command=self.refresh_diagnostics).pack(side='left', padx=5)
+            ttk.Button(buttons, text="تصفير", command=self.reset_diagnostics).pack(side='left', padx=5)
+            ttk.Label(buttons, text=f"سجل العمليات البطيئة: {diagnostics.recorder.log_path}").pack(side='right', padx=5)
+            columns = ('Kind', 'Name', 'Count', 'P50', 'P95', 'Max', 'Rows', 'Total')
+            titles = ('النوع', 'العملية', 'المرات', 'p50 (ms)', 'p95 (ms)', 'الأقصى (ms)', 'الصفوف', 'المجموع (ms)')
+            tree = ttk.Treeview(window, columns=columns, show='headings')
+            for column, title in zip(columns, titles):
+                tree.heading(column, text=title, font=self.medium_font)
+                tree.column(column, width=90, anchor='center')
+            tree.column('Name', width=500, anchor='w')
+            scrollbar = ttk.Scrollbar(window, orient="vertical", command=tree.yview)
+            tree.configure(yscrollcommand=scrollbar.set)
+            scrollbar.pack(side='right', fill='y')
+            tree.pack(fill='both', expand=True, padx=10, pady=(0, 10))
+            self.diagnostics_sync = TreeSync(tree, key=lambda o: f"{o['kind']}:{o['name']}", format_row=lambda o: (
+                o['kind'], o['name'], o['count'], o['p50_ms'], o['p95_ms'], o['max_ms'], o['rows'], o['total_ms']))
+        self.refresh_diagnostics()
+        self.diagnostics_window.lift()
+
+    def refresh_diagnostics(self):
+        self.diagnostics_sync.sync(diagnostics.recorder.top())
+
+    def reset_diagnostics(self):
+        diagnostics.recorder.reset()
+        self.refresh_diagnostics()
+
+def enable_diagnostics(log_path=diagnostics.SLOW_LOG):
+    """Times every query and the window's refreshes; must run before the window is made."""
+    diagnostics.enable(log_path)
+    # The edit handlers wait on message boxes; their statements are timed anyway
+    diagnostics.instrument(InventoryApp, skip=('update_item', 'update_unit', 'update_category',
+                                               'refresh_diagnostics'))
 
 # --- Main Execution ---
 if __name__ == "__main__":
-    setup_database()
-    app = InventoryApp()
+    # --startup-report prints how long each startup phase took;
+    # --server URL runs as a client of server.py, sending its token from INVENTORY_TOKEN;
+    # --diagnostics times every query and refresh (Ctrl+Shift+D shows them)
+    startup = StartupTimer()
+    if '--diagnostics' in sys.argv:
+        enable_diagnostics()
+    server = sys.argv[sys.argv.index('--server') + 1] if '--server' in sys.argv else None
+    if server is None:
+        setup_database()
+    startup.mark('database')
+    app = InventoryApp(startup=startup, startup_report='--startup-report' in sys.argv, server=server)
     app.mainloop()
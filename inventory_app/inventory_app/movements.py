@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+"""Stock movements: atomic posting of receipts and issues, safe across workstations."""
+import random
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from database import Database, in_source, setup_database, transaction_sources
+
+POST_RETRIES = 5            # attempts when another workstation holds the write lock
+RETRY_DELAY = 0.05          # seconds before the first retry; doubles each time
+# The stock a new item starts with is received from this employee, made when first needed
+OPENING_STOCK_EMPLOYEE = ("رصيد افتتاحي", "قيد آلي عند إضافة صنف")
+OPENING_STOCK_NOTES = "رصيد افتتاحي"
+# Matches the receipts post_opening_stock() writes
+OPENING_STOCK_WHERE = (f"notes = '{OPENING_STOCK_NOTES}' AND employee_id IN "
+                       f"(SELECT id FROM employees WHERE name = '{OPENING_STOCK_EMPLOYEE[0]}')")
+
+# Each statement checks and changes stock in one step, so two workstations
+# can never both pass the check against the same stock.
+RECEIVE_SQL = "UPDATE items SET quantity = quantity + :qty WHERE id = :item_id"
+ISSUE_SQL = "UPDATE items SET quantity = quantity - :qty WHERE id = :item_id AND quantity >= :qty"
+INSERT_MOVEMENT_SQL = '''
+INSERT INTO transactions (item_id, quantity, transaction_type, transaction_date, employee_id, supplier_id, notes, voucher_no)
+VALUES (:item_id, :qty, :type, :date, :employee_id, :supplier_id, :notes, :voucher_no)
+'''
+# Run against every source: archived years keep their voucher numbers, and
+# a late posting dated into an old year may hold the highest one
+LAST_VOUCHER_SQL = '''
+SELECT voucher_no FROM transactions WHERE voucher_no IS NOT NULL
+ORDER BY voucher_no DESC LIMIT 1
+'''
+
+
+class MovementError(Exception):
+    """A movement that cannot be posted."""
+
+
+class UnknownItem(MovementError):
+    def __init__(self, item_id):
+        super().__init__(f"item {item_id} does not exist")
+        self.item_id = item_id
+
+
+class InsufficientStock(MovementError):
+    def __init__(self, item_id, requested, available):
+        super().__init__(f"item {item_id}: requested {requested}, available {available}")
+        self.item_id = item_id
+        self.requested = requested
+        self.available = available
+
+
+class VoucherError(MovementError):
+    """A voucher with lines that cannot be posted; nothing of it was written.
+
+    `problems` lists (line number, item id, reason, available) for every
+    bad line, so the whole voucher can be corrected in one go.
+    """
+
+    def __init__(self, problems):
+        super().__init__(f"{len(problems)} voucher line(s) cannot be posted")
+        self.problems = problems
+
+
+def _with_retries(db, post):
+    # Re-runs the whole posting if the write lock stays taken past the busy timeout
+    for attempt in range(POST_RETRIES):
+        try:
+            return post()
+        except sqlite3.OperationalError as e:
+            locked = 'locked' in str(e) or 'busy' in str(e)
+            if not locked or attempt == POST_RETRIES - 1 or db.conn.in_transaction:
+                raise
+            time.sleep(RETRY_DELAY * 2 ** attempt)
+
+
+def post_movement(db, item_id, qty, transaction_type, employee_id, supplier_id=None, notes=None, when=None):
+    """Posts one receipt or issue and returns the new transaction id.
+
+    The stock update and the movement row are written in one immediate
+    transaction. An issue only goes through if enough stock is left at the
+    moment it is written; otherwise InsufficientStock is raised and nothing
+    is written. If the database stays locked past the busy timeout, the
+    whole posting is retried a few times before the error is raised.
+    """
+    params = {
+        'item_id': item_id, 'qty': qty, 'type': transaction_type,
+        'date': (when or datetime.now()).strftime("%Y-%m-%d %H:%M:%S"),
+        'employee_id': employee_id, 'supplier_id': supplier_id, 'notes': notes, 'voucher_no': None,
+    }
+    update_sql = RECEIVE_SQL if transaction_type == 'RECEIVE' else ISSUE_SQL
+
+    def post():
+        with db.transaction(immediate=True):
+            if db.execute(update_sql, params).rowcount != 1:
+                available = db.scalar("SELECT quantity FROM items WHERE id = ?", (item_id,))
+                if available is None:
+                    raise UnknownItem(item_id)
+                raise InsufficientStock(item_id, qty, available)
+            return db.execute(INSERT_MOVEMENT_SQL, params).lastrowid
+
+    return _with_retries(db, post)
+
+
+def post_voucher(db, transaction_type, lines, employee_id, supplier_id=None, notes=None, when=None):
+    """Posts a multi-line receipt or issue voucher and returns its voucher number.
+
+    `lines` is a sequence of (item_id, qty). The lines are checked first;
+    then every stock change and every movement row is written with
+    executemany in one immediate transaction, under one new voucher number.
+    If any line is bad, VoucherError lists all of them and nothing is posted.
+    """
+    lines = list(lines)
+    problems = [(n, item_id, 'quantity', None) for n, (item_id, qty) in enumerate(lines, 1)
+                if not isinstance(qty, int) or qty <= 0]
+    if not lines or problems:
+        raise VoucherError(problems)
+
+    # Several lines for one item change its stock once, by their total
+    per_item = {}
+    for item_id, qty in lines:
+        per_item[item_id] = per_item.get(item_id, 0) + qty
+    date = (when or datetime.now()).strftime("%Y-%m-%d %H:%M:%S")
+    update_sql = RECEIVE_SQL if transaction_type == 'RECEIVE' else ISSUE_SQL
+
+    def post():
+        with db.transaction(immediate=True):
+            stock = dict(db.query(f"SELECT id, quantity FROM items WHERE id IN ({','.join('?' * len(per_item))})",
+                                  list(per_item)))
+            problems = []
+            for n, (item_id, qty) in enumerate(lines, 1):
+                if item_id not in stock:
+                    problems.append((n, item_id, 'item', None))
+                elif transaction_type == 'ISSUE' and per_item[item_id] > stock[item_id]:
+                    problems.append((n, item_id, 'stock', stock[item_id]))
+            if problems:
+                raise VoucherError(problems)
+
+            voucher_no = max(db.scalar(in_source(LAST_VOUCHER_SQL, schema), default=0)
+                             for schema in transaction_sources(db)) + 1
+            db.executemany(update_sql, [{'item_id': item_id, 'qty': qty} for item_id, qty in per_item.items()])
+            db.executemany(INSERT_MOVEMENT_SQL, [
+                {'item_id': item_id, 'qty': qty, 'type': transaction_type, 'date': date,
+                 'employee_id': employee_id, 'supplier_id': supplier_id, 'notes': notes, 'voucher_no': voucher_no}
+                for item_id, qty in lines
+            ])
+            return voucher_no
+
+    return _with_retries(db, post)
+
+
+def post_opening_stock(db, lines, when=None):
+    """Receives the stock of new items, given as (item id, quantity), at 0 until now.
+
+    Runs in the caller's transaction, which must be the one the items were
+    created in, so an item never exists with stock its movements do not
+    account for. Lines of quantity 0 are skipped.
+    """
+    lines = [(item_id, qty) for item_id, qty in lines if qty]
+    if not lines:
+        return
+    name, position = OPENING_STOCK_EMPLOYEE
+    db.execute("INSERT OR IGNORE INTO employees (name, position) VALUES (?, ?)", (name, position))
+    employee_id = db.scalar("SELECT id FROM employees WHERE name = ?", (name,))
+    date = (when or datetime.now()).strftime("%Y-%m-%d %H:%M:%S")
+    db.executemany(RECEIVE_SQL, [{'item_id': item_id, 'qty': qty} for item_id, qty in lines])
+    db.executemany(INSERT_MOVEMENT_SQL, [
+        {'item_id': item_id, 'qty': qty, 'type': 'RECEIVE', 'date': date, 'employee_id': employee_id,
+         'supplier_id': None, 'notes': OPENING_STOCK_NOTES, 'voucher_no': None}
+        for item_id, qty in lines
+    ])
+
+
+# --- Concurrency Stress Check ---
+# Many processes post random receipts, issues and vouchers against one database file.
+# Afterwards the stock must equal what was received minus what was issued,
+# must never be negative, and must match the movement rows.
+
+def _stress_worker(path, item_ids, employee_id, posts, seed):
+    rng = random.Random(seed)
+    db = Database(path)
+    totals = {'RECEIVE': 0, 'ISSUE': 0, 'posted': 0, 'refused': 0}
+    try:
+        for _ in range(posts):
+            transaction_type = 'ISSUE' if rng.random() < 0.6 else 'RECEIVE'
+            lines = [(rng.choice(item_ids), rng.randint(1, 5)) for _ in range(rng.choice((1, 1, 1, 3)))]
+            try:
+                if len(lines) == 1:
+                    post_movement(db, lines[0][0], lines[0][1], transaction_type, employee_id, notes='stress')
+                else:
+                    post_voucher(db, transaction_type, lines, employee_id, notes='stress')
+            except (InsufficientStock, VoucherError):
+                totals['refused'] += 1
+            else:
+                totals[transaction_type] += sum(qty for _, qty in lines)
+                totals['posted'] += len(lines)
+    finally:
+        db.close()
+    return totals
+
+
+def stress_test(path, processes=8, posts=200, items=3, opening=20):
+    """Runs the stress check on a fresh database at `path`; returns a list of problems."""
+    setup_database(path)
+    db = Database(path)
+    with db.transaction():
+        employee_id = db.execute("INSERT INTO employees (name) VALUES ('stress')").lastrowid
+        item_ids = [db.execute("INSERT INTO items (name, quantity) VALUES (?, ?)",
+                               (f'stress item {n}', opening)).lastrowid for n in range(items)]
+
+    with ProcessPoolExecutor(processes) as pool:
+        results = list(pool.map(_stress_worker, [path] * processes, [item_ids] * processes,
+                                [employee_id] * processes, [posts] * processes, range(processes)))
+
+    problems = []
+    received = sum(r['RECEIVE'] for r in results)
+    issued = sum(r['ISSUE'] for r in results)
+    stock = db.scalar("SELECT SUM(quantity) FROM items")
+    expected = opening * items + received - issued
+    if stock != expected:
+        problems.append(f"stock is {stock}, expected {expected}: updates were lost")
+    if db.scalar("SELECT COUNT(*) FROM items WHERE quantity < 0"):
+        problems.append("stock went negative")
+    rows = db.scalar("SELECT COUNT(*) FROM transactions")
+    if rows != sum(r['posted'] for r in results):
+        problems.append(f"{rows} movement rows for {sum(r['posted'] for r in results)} postings")
+    net = db.scalar("SELECT SUM(CASE transaction_type WHEN 'RECEIVE' THEN quantity ELSE -quantity END) FROM transactions")
+    if opening * items + (net or 0) != stock:
+        problems.append("movement rows do not add up to the stock")
+    db.close()
+    print(f"{processes} processes, {sum(r['posted'] for r in results)} posted, "
+          f"{sum(r['refused'] for r in results)} refused for lack of stock, final stock {stock}")
+    return problems
+
+
+if __name__ == "__main__":
+    # Concurrency check against a throwaway database: exits non-zero on any lost or overdrawn stock.
+    import os
+    import sys
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as folder:
+        problems = stress_test(os.path.join(folder, 'stress.db'), processes=int(sys.argv[1]) if len(sys.argv) > 1 else 8)
+    for problem in problems:
+        print(problem)
+    raise SystemExit(1 if problems else 0)
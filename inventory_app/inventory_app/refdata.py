@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""In-memory name <-> id lookups for the reference tables behind the comboboxes."""
+import bisect
+
+from arabic import search_key
+
+LOOKUP_TABLES = ('categories', 'units', 'items', 'employees', 'suppliers')
+MATCH_LIMIT = 30        # names offered by a type-ahead picker at a time
+
+
+class Lookup:
+    """Both directions of one table's name/id mapping, plus its names in order."""
+
+    def __init__(self, rows):
+        self.ids = dict(rows)                                   # name -> id
+        self.names = {id_: name for name, id_ in self.ids.items()}
+        self.sorted_names = sorted(self.ids)
+
+    def update(self, ids, rows):
+        """Replaces the rows with the given ids by `rows` (missing ones were deleted)."""
+        for id_ in ids:
+            name = self.names.pop(id_, None)
+            if name is not None:
+                del self.ids[name]
+                index = bisect.bisect_left(self.sorted_names, name)
+                del self.sorted_names[index]
+        for name, id_ in rows:
+            self.ids[name] = id_
+            self.names[id_] = name
+            bisect.insort(self.sorted_names, name)
+
+
+class PrefixIndex:
+    """Item names sorted by their stored search key, for type-ahead lookups.
+
+    Entries are (key, name, id); a prefix search is one bisect into the
+    list followed by at most `limit` steps along it.
+    """
+
+    def __init__(self, rows):
+        self.entries = sorted(rows)
+        self.by_id = {entry[2]: entry for entry in self.entries}
+
+    def update(self, ids, rows):
+        for id_ in ids:
+            entry = self.by_id.pop(id_, None)
+            if entry is not None:
+                del self.entries[bisect.bisect_left(self.entries, entry)]
+        for entry in rows:
+            self.by_id[entry[2]] = entry
+            bisect.insort(self.entries, entry)
+
+    def search(self, text, limit=MATCH_LIMIT):
+        key = search_key(text)
+        start = bisect.bisect_left(self.entries, (key,))
+        names = []
+        for entry_key, name, _ in self.entries[start:start + limit]:
+            if not entry_key.startswith(key):
+                break
+            names.append(name)
+        return names
+
+
+class ReferenceCache:
+    """Name/id lookups for LOOKUP_TABLES, loaded on first use and kept in step.
+
+    The cache watches the invalidation bus, so it is corrected as soon as a
+    change is published and before any view refreshes from it. A change to
+    known rows is patched in; a change to a whole table drops it until next
+    use. A name that is not found is looked up once more in the database, in
+    case another workstation added it.
+    """
+
+    def __init__(self, db, bus=None):
+        self.db = db
+        self._lookups = {}
+        self._prefix = None
+        if bus is not None:
+            bus.watch(LOOKUP_TABLES, self.changed)
+
+    def lookup(self, table):
+        lookup = self._lookups.get(table)
+        if lookup is None:
+            lookup = self._lookups[table] = Lookup(self.db.query(f"SELECT name, id FROM {table}"))
+        return lookup
+
+    def id(self, table, name):
+        """The id of `name` in `table`, or None if there is no such row."""
+        id_ = self.lookup(table).ids.get(name)
+        if id_ is None and name:
+            id_ = self.db.scalar(f"SELECT id FROM {table} WHERE name = ?", (name,))
+            if id_ is not None:
+                self.changed(table)
+        return id_
+
+    def name(self, table, id_):
+        return self.lookup(table).names.get(id_)
+
+    def names(self, table):
+        """The names in `table`, sorted; the list must not be changed."""
+        return self.lookup(table).sorted_names
+
+    def search(self, text, limit=MATCH_LIMIT):
+        """Item names whose search key starts with that of `text`, in key order."""
+        if self._prefix is None:
+            self._prefix = PrefixIndex(self.db.query("SELECT name_key, name, id FROM items"))
+        return self._prefix.search(text, limit)
+
+    def match(self, text):
+        """The item `text` names: itself if it is an item, else the one item
+        whose search key is equal to its key. None if there is none or several.
+        """
+        if text in self.lookup('items').ids:
+            return text
+        key = search_key(text)
+        names = [name for name in self.search(text, 2) if search_key(name) == key]
+        return names[0] if len(names) == 1 else None
+
+    def changed(self, table, ids=None):
+        if table == 'items' and self._prefix is not None:
+            self._prefix = self._patch(self._prefix, "SELECT name_key, name, id FROM items", ids)
+        lookup = self._lookups.get(table)
+        if lookup is not None:
+            self._lookups[table] = self._patch(lookup, f"SELECT name, id FROM {table}", ids)
+
+    def _patch(self, index, select, ids):
+        # A whole-table change drops the index; it is rebuilt on next use
+        if ids is None:
+            return None
+        ids = list(ids)
+        if ids:
+            index.update(ids, self.db.query(f"{select} WHERE id IN ({','.join('?' * len(ids))})", ids))
+        return index
+
+    def clear(self):
+        self._lookups.clear()
+        self._prefix = None
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""Full-text search over item names and descriptions and movement notes."""
+import heapq
+from collections import namedtuple
+
+from arabic import search_key, without_article
+
+SEARCH_LIMIT = 100      # hits shown for one search
+RANK_WINDOW = 20000     # most matches ranked per index; beyond it only the newest are
+
+# Each index is ranked on its own (bm25, a name hit counting double) and cut
+# to the limit before the snippets are made; the two lists are merged after.
+# bm25 costs time per match, so a word found in most of a large ledger is
+# only ranked among its newest RANK_WINDOW matches (rowid > :floor).
+ITEM_HITS_SQL = '''
+SELECT i.id, i.name, i.quantity, snippet(items_fts, -1, '[', ']', '…', 12), rank
+FROM items_fts
+JOIN items i ON i.id = items_fts.rowid
+WHERE items_fts MATCH :query AND rank MATCH 'bm25(2.0, 1.0)' AND items_fts.rowid > :floor
+ORDER BY rank
+LIMIT :limit
+'''
+
+TRANSACTION_HITS_SQL = '''
+SELECT t.id, t.transaction_date, t.transaction_type, i.name, t.quantity, e.name,
+    snippet(transactions_fts, 0, '[', ']', '…', 12), rank
+FROM transactions_fts
+JOIN transactions t ON t.id = transactions_fts.rowid
+JOIN items i ON t.item_id = i.id
+JOIN employees e ON t.employee_id = e.id
+WHERE transactions_fts MATCH :query AND transactions_fts.rowid > :floor
+ORDER BY rank
+LIMIT :limit
+'''
+
+
+class SearchHit(namedtuple('SearchHit', 'kind id title snippet score')):
+    """One result: kind is 'item' or 'transaction'; a lower score ranks higher."""
+    __slots__ = ()
+
+
+def match_expression(text):
+    """Turns what the user typed into an FTS5 query: every word, as a prefix.
+
+    Words are normalized like the indexed text and quoted, so FTS5 operators
+    and punctuation in the input are taken literally; a word with an article
+    also matches without it. Returns None when nothing is left to search for.
+    """
+    terms = []
+    for word in search_key(text).split():
+        stem = without_article(word)
+        terms.append(f"({_prefix(word)} OR {_prefix(stem)})" if stem else _prefix(word))
+    return ' '.join(terms) or None
+
+
+def _prefix(word):
+    return '"{}"*'.format(word.replace('"', '""'))
+
+
+def search(db, text, limit=SEARCH_LIMIT):
+    """The best `limit` hits for `text` across items and movements, best first."""
+    query = match_expression(text)
+    if query is None:
+        return []
+    params = {'query': query, 'limit': limit, 'floor': _rank_floor(db, 'items_fts', query)}
+    items = [SearchHit('item', item_id, f"{name} (الكمية: {quantity})", snippet, score)
+             for item_id, name, quantity, snippet, score in db.query(ITEM_HITS_SQL, params)]
+    params['floor'] = _rank_floor(db, 'transactions_fts', query)
+    types = {'RECEIVE': 'استلام', 'ISSUE': 'تسليم'}
+    movements = [SearchHit('transaction', tx_id, f"{date} {types.get(kind, kind)} {qty} {item} - {employee}",
+                           snippet, score)
+                 for tx_id, date, kind, item, qty, employee, snippet, score
+                 in db.query(TRANSACTION_HITS_SQL, params)]
+    return list(heapq.merge(items, movements, key=lambda hit: hit.score))[:limit]
+
+
+def _rank_floor(db, table, query):
+    # Walking matches in rowid order is cheap; only scoring them is not
+    return db.scalar(f"SELECT rowid FROM {table} WHERE {table} MATCH ? ORDER BY rowid DESC LIMIT 1 OFFSET ?",
+                     (query, RANK_WINDOW), default=0)
+
+
+def rebuild_search_index(db):
+    """Re-indexes every item and movement from scratch.
+
+    FTS5's own 'rebuild' would index the raw text rather than its
+    arabic_text() form, so the indexes are emptied and refilled here.
+    """
+    with db.transaction(immediate=True):
+        db.execute("INSERT INTO items_fts (items_fts) VALUES ('delete-all')")
+        db.execute("INSERT INTO transactions_fts (transactions_fts) VALUES ('delete-all')")
+        db.execute('''
+            INSERT INTO items_fts (rowid, name, description)
+            SELECT id, arabic_text(name), arabic_text(description) FROM items
+        ''')
+        db.execute('''
+            INSERT INTO transactions_fts (rowid, notes)
+            SELECT id, arabic_text(notes) FROM transactions WHERE notes <> ''
+        ''')
+        db.execute("INSERT INTO items_fts (items_fts) VALUES ('optimize')")
+        db.execute("INSERT INTO transactions_fts (transactions_fts) VALUES ('optimize')")
+
+
+if __name__ == "__main__":
+    # python search.py <words...> [--db path] [--rebuild]
+    import argparse
+    import time
+    from database import DB_NAME, Database, setup_database
+
+    parser = argparse.ArgumentParser(description="Search items and movement notes")
+    parser.add_argument('words', nargs='*')
+    parser.add_argument('--db', default=DB_NAME)
+    parser.add_argument('--rebuild', action='store_true', help="rebuild the search indexes first")
+    args = parser.parse_args()
+
+    setup_database(args.db)
+    db = Database(args.db)
+    try:
+        if args.rebuild:
+            rebuild_search_index(db)
+        started = time.perf_counter()
+        hits = search(db, ' '.join(args.words))
+        elapsed = time.perf_counter() - started
+    finally:
+        db.close()
+    for hit in hits:
+        print(f"{hit.score:8.3f}  {hit.kind:<11} {hit.title}  |  {hit.snippet}")
+    print(f"{len(hits)} hits in {elapsed * 1000:.1f} ms")
@@ -0,0 +1,464 @@
+# -*- coding: utf-8 -*-
+"""Optional inventory server: one process owns the database, workstations talk HTTP/JSON to it.
+
+    python server.py [--db path] [--host 127.0.0.1] [--port 8765] [--readers 4] [--token secret]
+    python server.py --load-test 16 [--seconds 10]
+
+Reads run concurrently on a pool of read-only connections. Writes are
+queued and run one group at a time on the single writer connection: every
+write waiting when the writer comes free is run inside one transaction,
+each under its own savepoint, and committed together. A write that fails
+only undoes itself.
+
+Every request must carry the server's shared token in an X-Inventory-Token
+header, or it is answered 401 before anything is run: /query runs the SQL
+it is sent. The token is taken from --token or the INVENTORY_TOKEN
+environment variable, which clients read too; without either, one is made
+up and printed at startup.
+
+Endpoints (JSON in and out):
+    GET  /version   {"version": n}, which moves after every committed group
+    POST /query     {"sql", "params"} -> {"rows"}; read-only
+    POST /call      {"method", "args", "kwargs"} -> {"result", "changes",
+                    "version"}; an InventoryService write, or 409 {"error",
+                    "version"} with the message for the user. "version" is
+                    the one the write committed as when its group held
+                    nothing else, so the client knows it has seen all of it
+    GET  /stats     request and group-commit counters
+"""
+import asyncio
+import hmac
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from client import TOKEN_ENV, TOKEN_HEADER
+from database import DB_NAME, Database, setup_database
+from importer import Importer
+from service import InventoryService, ServiceError
+
+HOST = '127.0.0.1'          # localhost only unless asked otherwise
+PORT = 8765
+READERS = 4                 # read-only connections serving /query
+GROUP_MAX = 256             # writes committed together at most
+IMPORT_SESSIONS = 8         # imports under way kept at once; the least recently used goes first
+MAX_BODY = 64 * 1024 * 1024
+
+# InventoryService methods a client may call
+SERVICE_CALLS = {
+    'add_master', 'rename_master', 'delete_master', 'add_category', 'add_unit', 'add_supplier', 'add_employee',
+    'add_item', 'update_item', 'delete_item', 'record_movement', 'post_voucher', 'import_chunk', 'close_periods',
+}
+
+STATUS_TEXT = {200: 'OK', 400: 'Bad Request', 401: 'Unauthorized', 404: 'Not Found', 409: 'Conflict',
+               413: 'Payload Too Large', 500: 'Internal Server Error'}
+
+
+class _Write:
+    __slots__ = ('method', 'args', 'kwargs', 'future', 'outcome')
+
+    def __init__(self, method, args, kwargs, future):
+        self.method = method
+        self.args = args
+        self.kwargs = kwargs
+        self.future = future
+        self.outcome = None     # (status, body) once run
+
+
+class InventoryServer:
+    """Serves one database file over HTTP on an asyncio event loop.
+
+    The event loop only parses requests and queues work: reads go to the
+    reader threads, writes to the one writer thread, so a slow query never
+    holds up other clients' requests.
+    """
+
+    def __init__(self, path=DB_NAME, host=HOST, port=PORT, readers=READERS, token=None):
+        self.path = path
+        self.host = host
+        self.port = port
+        self.token = token or os.environ.get(TOKEN_ENV) or secrets.token_urlsafe(24)
+        self.version = 0
+        self.stats = {'reads': 0, 'writes': 0, 'groups': 0, 'largest_group': 0, 'refused': 0}
+        self._local = threading.local()
+        self.readers = readers
+        self._readers = ThreadPoolExecutor(readers, 'reader', initializer=self._open_reader)
+        self._writer = ThreadPoolExecutor(1, 'writer', initializer=self._open_writer)
+        self._server = None
+        self._loop = None
+        self._thread = None
+        self._connections = set()   # handler tasks, one per open client connection
+
+    # --- Connections ---
+    def _open_reader(self):
+        db = Database(self.path, readonly=True)
+        # Clients send SQL; they get to read this database and nothing else
+        db.conn.set_authorizer(lambda action, *_: sqlite3.SQLITE_DENY
+                               if action in (sqlite3.SQLITE_ATTACH, sqlite3.SQLITE_DETACH) else sqlite3.SQLITE_OK)
+        self._local.db = db
+
+    def _open_writer(self):
+        self._local.db = Database(self.path)
+        self._local.service = InventoryService(self._local.db, publish=self._record_change)
+        self._local.imports = {}    # import session token: its Importer
+
+    def _record_change(self, table, ids=None):
+        self._local.service.refdata.changed(table, ids)
+        self._local.changes.append((table, None if ids is None else list(ids)))
+
+    # --- Serving ---
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._writes = asyncio.Queue()
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._start_writer()
+
+    def _start_writer(self):
+        self._write_task = asyncio.create_task(self._write_loop())
+        self._write_task.add_done_callback(self._writer_stopped)
+
+    def _writer_stopped(self, task):
+        # Only close() may stop the writer; if anything else ends it, it is started again
+        if not task.cancelled():
+            self._start_writer()
+
+    async def serve(self):
+        await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    def start_in_thread(self):
+        """Serves from a background thread; returns the server's URL once it listens."""
+        started = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            self._loop.run_until_complete(self.start())
+            started.set()
+            self._loop.run_forever()
+            self._loop.close()
+
+        self._thread = threading.Thread(target=run, name='inventory-server', daemon=True)
+        self._thread.start()
+        started.wait()
+        return self.url
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def close(self):
+        if self._thread is not None:
+            async def stop():
+                self._server.close()
+                for task in (self._write_task, *self._connections):
+                    task.cancel()
+                await asyncio.gather(self._write_task, *self._connections, return_exceptions=True)
+            asyncio.run_coroutine_threadsafe(stop(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+        # A connection is closed by the thread that opened it; the barrier
+        # makes every reader thread take one of the closing tasks
+        barrier = threading.Barrier(self.readers)
+
+        def close_reader():
+            barrier.wait()
+            self._local.db.close()
+
+        for future in [self._readers.submit(close_reader) for _ in range(self.readers)]:
+            future.result()
+        self._readers.shutdown()
+        self._writer.submit(lambda: self._local.db.close()).result()
+        self._writer.shutdown()
+
+    async def _handle(self, reader, writer):
+        task = asyncio.current_task()
+        self._connections.add(task)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, version = request_line.decode('latin-1').split()
+                headers = {}
+                while True:
+                    line = (await reader.readline()).decode('latin-1').strip()
+                    if not line:
+                        break
+                    name, _, value = line.partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get('content-length', 0))
+                keep_alive = headers.get('connection', '').lower() != 'close' and version == 'HTTP/1.1'
+                if not hmac.compare_digest(headers.get(TOKEN_HEADER.lower(), '').encode('utf-8'),
+                                           self.token.encode('utf-8')):
+                    # Refused unread, like an oversized body
+                    status, answer, keep_alive = 401, {'error': "missing or wrong token"}, False
+                elif length > MAX_BODY:
+                    # The body is not read, so the connection cannot be kept
+                    status, answer, keep_alive = 413, {'error': f"request body over {MAX_BODY} bytes"}, False
+                else:
+                    body = await reader.readexactly(length) if length else b''
+                    status, answer = await self._route(method, path, body)
+                payload = json.dumps(answer, ensure_ascii=False).encode('utf-8')
+                writer.write(f"HTTP/1.1 {status} {STATUS_TEXT[status]}\r\nContent-Type: application/json\r\n"
+                             f"Content-Length: {len(payload)}\r\n"
+                             f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode('latin-1')
+                             + payload)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ValueError, ConnectionError, asyncio.IncompleteReadError):
+            pass    # a malformed request or a client that went away
+        except asyncio.CancelledError:
+            pass    # the server is closing; ends the task quietly
+        finally:
+            self._connections.discard(task)
+            writer.close()
+
+    async def _route(self, method, path, body):
+        try:
+            request = json.loads(body) if body else {}
+            if method == 'GET' and path == '/version':
+                return 200, {'version': self.version}
+            if method == 'GET' and path == '/stats':
+                return 200, self.stats
+            if method == 'POST' and path == '/query':
+                self.stats['reads'] += 1
+                rows = await self._loop.run_in_executor(self._readers, self._read,
+                                                        request['sql'], request.get('params', ()))
+                return 200, {'rows': rows}
+            if method == 'POST' and path == '/call':
+                if request.get('method') not in SERVICE_CALLS:
+                    return 404, {'error': f"unknown call: {request.get('method')}"}
+                write = _Write(request['method'], request.get('args', []), request.get('kwargs', {}),
+                               self._loop.create_future())
+                await self._writes.put(write)
+                return await write.future
+            return 404, {'error': f"no such endpoint: {method} {path}"}
+        except (ValueError, KeyError, TypeError) as e:
+            return 400, {'error': str(e)}
+        except sqlite3.Error as e:
+            return 500, {'error': str(e)}
+
+    def _read(self, sql, params):
+        return self._local.db.query(sql, params)
+
+    # --- Writer ---
+    async def _write_loop(self):
+        # Must outlive any write: every /call waits on a future only this loop resolves
+        while True:
+            group = [await self._writes.get()]
+            while len(group) < GROUP_MAX and not self._writes.empty():
+                group.append(self._writes.get_nowait())
+            try:
+                await self._loop.run_in_executor(self._writer, self._commit_group, group)
+            except Exception as e:
+                for write in group:
+                    write.outcome = 500, {'error': str(e)}
+            finally:
+                for write in group:
+                    if not write.future.done():
+                        write.future.set_result(write.outcome or (500, {'error': "the write was not run"}))
+
+    def _commit_group(self, group):
+        db, service = self._local.db, self._local.service
+        try:
+            with db.transaction(immediate=True):
+                for write in group:
+                    self._local.changes = []
+                    try:
+                        with db.transaction():
+                            result = self._call(service, write)
+                    except ServiceError as e:
+                        write.outcome = 409, {'error': str(e)}
+                    except Exception as e:
+                        # A bad call (wrong arguments, unknown table...) only undoes itself
+                        write.outcome = 500, {'error': f"{type(e).__name__}: {e}"}
+                    else:
+                        write.outcome = 200, {'result': result, 'changes': self._local.changes}
+        except Exception as e:
+            # The commit itself failed: nothing in the group was written
+            service.refdata.clear()
+            self._local.imports.clear()
+            for write in group:
+                write.outcome = 500, {'error': str(e)}
+            return
+        self.version += 1
+        # Only a write committed alone leaves its client knowing all of a version
+        for write in group:
+            write.outcome[1]['version'] = self.version if len(group) == 1 else self.version - 1
+        self.stats['writes'] += len(group)
+        self.stats['groups'] += 1
+        self.stats['largest_group'] = max(self.stats['largest_group'], len(group))
+        self.stats['refused'] += sum(1 for write in group if write.outcome[0] != 200)
+
+    def _call(self, service, write):
+        if write.method == 'import_chunk':
+            return self._import_chunk(service, *write.args)
+        return getattr(service, write.method)(*write.args, **write.kwargs)
+
+    def _import_chunk(self, service, kind, rows, session, last=False):
+        # rows: [[row number, {column: value}], ...]. The chunks of one import
+        # share an Importer, so the names in the table are read once, not per
+        # chunk; it is dropped when a chunk fails, since its maps may then
+        # hold rows that were undone. Answers the counts so far and the new errors.
+        imports = self._local.imports
+        importer = imports.pop(session, None)
+        if importer is None or importer.kind != kind:
+            importer = Importer(service.db, kind)
+        known_errors = len(importer.result.errors)
+        result, chunks = service.import_rows(kind, [(number, row) for number, row in rows], importer)
+        for _ in chunks:
+            pass
+        if not last:
+            imports[session] = importer
+            while len(imports) > IMPORT_SESSIONS:
+                del imports[next(iter(imports))]
+        return dict(vars(result), errors=result.errors[known_errors:])
+
+
+# --- Load Test ---
+# N client processes hit one server over localhost with a mix of reads and
+# postings. Afterwards the stock must match what the clients were told was
+# posted, and every posting must have its movement row.
+
+LOAD_READ_SHARE = 0.7       # share of client requests that are reads
+
+
+def _load_worker(url, token, items, seconds, seed):
+    import random
+    from client import RemoteDatabase, RemoteService
+    from database import ITEM_ROW_SQL, RECENT_ACTIVITY_SQL
+
+    rng = random.Random(seed)
+    db = RemoteDatabase(url, token)
+    service = RemoteService(url, token=token)
+    totals = {'reads': 0, 'RECEIVE': 0, 'ISSUE': 0, 'posted': 0, 'refused': 0, 'read_ms': [], 'write_ms': []}
+    deadline = time.perf_counter() + seconds
+    try:
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            if rng.random() < LOAD_READ_SHARE:
+                if rng.random() < 0.5:
+                    db.query(RECENT_ACTIVITY_SQL)
+                else:
+                    db.query_one(ITEM_ROW_SQL, (rng.randint(1, len(items)),))
+                totals['reads'] += 1
+                totals['read_ms'].append((time.perf_counter() - started) * 1000)
+                continue
+            transaction_type = 'ISSUE' if rng.random() < 0.6 else 'RECEIVE'
+            qty = rng.randint(1, 5)
+            try:
+                service.record_movement(transaction_type, rng.choice(items), qty, 'load test',
+                                        'load test' if transaction_type == 'RECEIVE' else None, 'load')
+            except ServiceError:
+                totals['refused'] += 1
+            else:
+                totals[transaction_type] += qty
+                totals['posted'] += 1
+            totals['write_ms'].append((time.perf_counter() - started) * 1000)
+    finally:
+        db.close()
+        service.close()
+    return totals
+
+
+def _percentile(values, share):
+    values = sorted(values)
+    return values[min(int(len(values) * share), len(values) - 1)] if values else 0.0
+
+
+def load_test(path, clients=8, seconds=10.0, items=50, opening=100):
+    """Runs the load test against a fresh database at `path`; returns a list of problems."""
+    from concurrent.futures import ProcessPoolExecutor
+
+    setup_database(path)
+    db = Database(path)
+    service = InventoryService(db)
+    service.add_employee('load test')
+    service.add_supplier('load test')
+    service.add_category('load test')
+    service.add_unit('load test')
+    names = [f"load item {n}" for n in range(items)]
+    for name in names:
+        service.add_item(name, opening, 'load test', 'load test')
+    db.close()
+
+    server = InventoryServer(path, port=0)
+    url = server.start_in_thread()
+    try:
+        started = time.perf_counter()
+        with ProcessPoolExecutor(clients) as pool:
+            results = list(pool.map(_load_worker, [url] * clients, [server.token] * clients, [names] * clients,
+                                    [seconds] * clients, range(clients)))
+        elapsed = time.perf_counter() - started
+        stats = dict(server.stats)
+    finally:
+        server.close()
+
+    reads = sum(r['reads'] for r in results)
+    writes = sum(r['posted'] + r['refused'] for r in results)
+    read_ms = [ms for r in results for ms in r['read_ms']]
+    write_ms = [ms for r in results for ms in r['write_ms']]
+    print(f"{clients} clients, {elapsed:.1f} s: {reads / elapsed:.0f} reads/s, {writes / elapsed:.0f} writes/s")
+    print(f"read latency p50 {_percentile(read_ms, 0.5):.1f} ms, p95 {_percentile(read_ms, 0.95):.1f} ms; "
+          f"write latency p50 {_percentile(write_ms, 0.5):.1f} ms, p95 {_percentile(write_ms, 0.95):.1f} ms")
+    print(f"{stats['writes']} writes in {stats['groups']} commits "
+          f"(mean group {stats['writes'] / max(stats['groups'], 1):.1f}, largest {stats['largest_group']}), "
+          f"{sum(r['refused'] for r in results)} refused for lack of stock")
+
+    problems = []
+    db = Database(path, readonly=True)
+    try:
+        stock = db.scalar("SELECT SUM(quantity) FROM items")
+        expected = opening * items + sum(r['RECEIVE'] for r in results) - sum(r['ISSUE'] for r in results)
+        if stock != expected:
+            problems.append(f"stock is {stock}, expected {expected}")
+        # The items' opening stock was received by one movement each
+        rows = db.scalar("SELECT COUNT(*) FROM transactions") - items
+        if rows != sum(r['posted'] for r in results):
+            problems.append(f"{rows} movement rows for {sum(r['posted'] for r in results)} postings")
+        if db.scalar("SELECT COUNT(*) FROM items WHERE quantity < 0"):
+            problems.append("stock went negative")
+    finally:
+        db.close()
+    return problems
+
+
+if __name__ == "__main__":
+    import argparse
+    import os
+    import tempfile
+
+    parser = argparse.ArgumentParser(description="Serve the inventory database to GUI clients over HTTP")
+    parser.add_argument('--db', default=DB_NAME)
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--readers', type=int, default=READERS)
+    parser.add_argument('--token', help=f"shared token clients must send; defaults to ${TOKEN_ENV}")
+    parser.add_argument('--load-test', type=int, metavar='CLIENTS',
+                        help="measure throughput with this many clients against a throwaway database")
+    parser.add_argument('--seconds', type=float, default=10.0)
+    args = parser.parse_args()
+
+    if args.load_test:
+        with tempfile.TemporaryDirectory() as folder:
+            problems = load_test(os.path.join(folder, 'load.db'), args.load_test, args.seconds)
+        for problem in problems:
+            print(problem)
+        raise SystemExit(1 if problems else 0)
+
+    setup_database(args.db)
+    server = InventoryServer(args.db, args.host, args.port, args.readers, args.token)
+    print(f"serving {args.db} on http://{args.host}:{args.port}")
+    if not (args.token or os.environ.get(TOKEN_ENV)):
+        print(f"clients need {TOKEN_ENV}={server.token}")
+    try:
+        asyncio.run(server.serve())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,429 @@
+# -*- coding: utf-8 -*-
+"""The inventory's operations without a user interface, shared by the GUI and the command line."""
+import sqlite3
+from contextlib import contextmanager
+from datetime import date, datetime
+
+from archive import archive_closed_years, missing_archives
+from dashboard import load_dashboard_stats
+from database import (
+    DEFAULT_REORDER_LEVEL, ITEMS_LIST_SQL, LOW_STOCK_SQL, check_query_plans, in_source, live_start, transaction_sources,
+)
+from exporter import export
+from importer import TOUCHED_TABLES, Importer, RowSource
+from movements import (
+    OPENING_STOCK_WHERE, InsufficientStock, UnknownItem, VoucherError, post_movement, post_opening_stock, post_voucher,
+)
+from refdata import ReferenceCache
+from search import rebuild_search_index, search
+from snapshots import SNAPSHOT_PERIOD, stock_as_of, take_snapshots
+
+TRANSACTION_TYPES = ('RECEIVE', 'ISSUE')
+
+BUSY = "قاعدة البيانات مشغولة من جهاز آخر، حاول مرة أخرى."
+
+# table -> (name required, name taken, still in use by an item)
+MASTER_MESSAGES = {
+    'categories': ("اسم الفئة مطلوب.", "هذه الفئة موجودة بالفعل.", "لا يمكن حذف هذه الفئة لأنها مرتبطة بأحد الأصناف."),
+    'units': ("اسم الوحدة مطلوب.", "هذه الوحدة موجودة بالفعل.", "لا يمكن حذف هذه الوحدة لأنها مرتبطة بأحد الأصناف."),
+    'suppliers': ("اسم المورد مطلوب.", "هذا المورد موجود بالفعل.", None),
+    'employees': ("اسم الموظف مطلوب.", "هذا الموظف موجود بالفعل.", None),
+}
+
+# table -> the columns besides the name that add_master may set
+MASTER_DETAILS = {'categories': (), 'units': (), 'suppliers': ('contact_info',), 'employees': ('position',)}
+
+VOUCHER_REASONS = {'quantity': "كمية غير صحيحة", 'item': "المادة غير موجودة", 'stock': "الكمية غير متوفرة"}
+
+
+class ServiceError(Exception):
+    """An operation that was refused; the message is meant for the user as it is."""
+
+
+class InventoryService:
+    """Items, master data, movements, reports and maintenance over one writer connection.
+
+    Every write validates its input and raises ServiceError with a message
+    for the user instead of showing anything itself. The tables (and row
+    ids) a write changed are passed to `publish`: the GUI's invalidation
+    bus, or by default the reference cache, so that names stay resolvable
+    in a long batch run.
+    """
+
+    def __init__(self, db, refdata=None, publish=None):
+        self.db = db
+        self.refdata = refdata or ReferenceCache(db)
+        self.publish = publish or self.refdata.changed
+
+    @contextmanager
+    def _writing(self, integrity=None):
+        # Turns the database's refusals into messages for the user
+        try:
+            yield
+        except sqlite3.IntegrityError:
+            if integrity is None:
+                raise
+            raise ServiceError(integrity) from None
+        except sqlite3.OperationalError as e:
+            if 'locked' not in str(e) and 'busy' not in str(e):
+                raise
+            raise ServiceError(BUSY) from None
+
+    # --- Master Data ---
+    def add_master(self, table, name, **details):
+        """Adds a category, unit, supplier or employee; returns its id.
+
+        `details` are the supplier's contact_info or the employee's position.
+        """
+        required, taken, _ = _master_messages(table)
+        name = _required(name, required)
+        unknown = set(details) - set(MASTER_DETAILS[table])
+        if unknown:
+            raise ServiceError("حقول غير معروفة: " + "، ".join(sorted(unknown)))
+        columns = ['name', *details]
+        with self._writing(taken):
+            row_id = self.db.execute(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                                     (name, *details.values())).lastrowid
+        self.publish(table, ids=[row_id])
+        return row_id
+
+    def rename_master(self, table, row_id, name):
+        required, taken, _ = _master_messages(table)
+        name = _required(name, required)
+        with self._writing(taken):
+            self.db.execute(f"UPDATE {table} SET name = ? WHERE id = ?", (name, row_id))
+        # Items show category and unit names, so the whole table counts as changed
+        self.publish(table)
+
+    def delete_master(self, table, row_id):
+        with self._writing(_master_messages(table)[2]):
+            self.db.execute(f"DELETE FROM {table} WHERE id = ?", (row_id,))
+        self.publish(table)
+
+    def add_category(self, name):
+        return self.add_master('categories', name)
+
+    def add_unit(self, name):
+        return self.add_master('units', name)
+
+    def add_supplier(self, name, contact_info=''):
+        return self.add_master('suppliers', name, contact_info=contact_info)
+
+    def add_employee(self, name, position=''):
+        return self.add_master('employees', name, position=position)
+
+    # --- Items ---
+    def add_item(self, name, quantity, category, unit, description='', reorder_level=None, max_level=None):
+        """Adds an item; category and unit are given by name. Returns its id.
+
+        The item is made with no stock and `quantity` received into it as its
+        opening stock, in the same transaction.
+        """
+        name, description, quantity, *ids = self._item_values(name, quantity, category, unit, description,
+                                                               reorder_level, max_level)
+        with self._writing("هذا الصنف موجود بالفعل."):
+            with self.db.transaction(immediate=True):
+                item_id = self.db.execute('''
+                    INSERT INTO items (name, description, quantity, category_id, unit_id, reorder_level, max_level)
+                    VALUES (?, ?, 0, ?, ?, ?, ?)
+                ''', (name, description, *ids)).lastrowid
+                post_opening_stock(self.db, [(item_id, quantity)])
+        self.publish('items', ids=[item_id])
+        if quantity:
+            self.publish('employees')
+            self.publish('transactions')
+        return item_id
+
+    def update_item(self, item_id, name, quantity, category, unit, description='', reorder_level=None, max_level=None):
+        """Edits an item's details. The stock only moves through postings.
+
+        `quantity` may be None; anything other than the item's current stock
+        is refused, since the stock as of past dates is worked out from the
+        movements and an edit would leave no trace in them.
+        """
+        item_id = int(item_id)
+        current = self.db.scalar("SELECT quantity FROM items WHERE id = ?", (item_id,))
+        if quantity is None:
+            quantity = current
+        values = self._item_values(name, quantity, category, unit, description, reorder_level, max_level)
+        if values[2] != current:
+            raise ServiceError("لا يمكن تعديل الكمية مباشرة، سجّل حركة استلام أو تسليم لتغييرها.")
+        name, description, _, category_id, unit_id, reorder_level, max_level = values
+        with self._writing("هذا الصنف موجود بالفعل."):
+            self.db.execute('''
+                UPDATE items SET name = ?, description = ?, category_id = ?, unit_id = ?,
+                    reorder_level = ?, max_level = ?
+                WHERE id = ?
+            ''', (name, description, category_id, unit_id, reorder_level, max_level, item_id))
+        self.publish('items', ids=[item_id])
+
+    def delete_item(self, item_id):
+        """Deletes an item that has never moved; the history of the others is kept.
+
+        The receipt of its opening stock does not count as a move, and goes with it.
+        """
+        item_id = int(item_id)
+        used = "لا يمكن حذف صنف له حركات مسجلة."
+        # The live table's foreign key guards it too, but not the archived years
+        for schema in transaction_sources(self.db):
+            sql = "SELECT 1 FROM transactions WHERE item_id = ?"
+            if schema == 'main':
+                sql += f" AND NOT ({OPENING_STOCK_WHERE})"
+            if self.db.scalar(in_source(sql + " LIMIT 1", schema), (item_id,)):
+                raise ServiceError(used)
+        with self._writing(used):
+            with self.db.transaction(immediate=True):
+                opening = self.db.execute(f"DELETE FROM transactions WHERE item_id = ? AND {OPENING_STOCK_WHERE}",
+                                          (item_id,)).rowcount
+                self.db.execute("DELETE FROM items WHERE id = ?", (item_id,))
+        self.publish('items', ids=[item_id])
+        if opening:
+            self.publish('transactions')
+
+    def _item_values(self, name, quantity, category, unit, description, reorder_level, max_level):
+        if not all([_text(name), _text(quantity), _text(category), _text(unit)]):
+            raise ServiceError("جميع الحقول مطلوبة ما عدا الوصف.")
+        try:
+            quantity = int(quantity)
+        except ValueError:
+            raise ServiceError("الكمية يجب أن تكون رقماً.") from None
+        if quantity < 0:
+            raise ServiceError("الكمية لا يمكن أن تكون سالبة.")
+        levels = "حد إعادة الطلب يجب أن يكون رقماً موجباً، والحد الأعلى لا يقل عنه."
+        try:
+            reorder_level = int(reorder_level) if _text(reorder_level) else DEFAULT_REORDER_LEVEL
+            max_level = int(max_level) if _text(max_level) else None
+        except ValueError:
+            raise ServiceError(levels) from None
+        if reorder_level < 0 or (max_level is not None and max_level < reorder_level):
+            raise ServiceError(levels)
+        category_id = self._master_id('categories', category, "الفئة المحددة غير موجودة.")
+        unit_id = self._master_id('units', unit, "الوحدة المحددة غير موجودة.")
+        return _text(name), _text(description), quantity, category_id, unit_id, reorder_level, max_level
+
+    def _master_id(self, table, name, missing):
+        row_id = self.refdata.id(table, _text(name))
+        if row_id is None:
+            raise ServiceError(missing)
+        return row_id
+
+    # --- Movements ---
+    def record_movement(self, transaction_type, item, quantity, employee, supplier=None, notes=None, when=None):
+        """Posts one receipt or issue; item, employee and supplier are given by name.
+
+        The item name may be typed loosely, as in the type-ahead picker.
+        Returns the new transaction id.
+        """
+        supplier = self._movement_parties(transaction_type, employee, supplier)
+        if not all([_text(item), _text(quantity), _text(employee)]):
+            raise ServiceError("حقول المادة، الكمية، والموظف مطلوبة.")
+        qty = _positive(quantity, "الكمية يجب أن تكون رقماً صحيحاً موجباً.")
+        item_id = self.refdata.id('items', self.refdata.match(_text(item)))
+        if item_id is None:
+            raise ServiceError("المادة المحددة غير موجودة.")
+        employee_id, supplier_id = self._party_ids(employee, supplier)
+        when = _moment(when)
+        self._check_open(when)
+
+        try:
+            with self._writing():
+                transaction_id = post_movement(self.db, item_id, qty, transaction_type, employee_id, supplier_id,
+                                               notes, when)
+        except InsufficientStock as e:
+            raise ServiceError(f"الكمية المطلوبة غير متوفرة. المتوفر: {e.available}") from None
+        except UnknownItem:
+            raise ServiceError("المادة المحددة غير موجودة.") from None
+        self.publish('items', ids=[item_id])
+        self.publish('transactions', ids=[transaction_id])
+        return transaction_id
+
+    def post_voucher(self, transaction_type, lines, employee, supplier=None, notes=None, when=None):
+        """Posts (item name, quantity) lines as one voucher; returns the voucher number.
+
+        Nothing is posted if any line is bad; the error lists every one of them.
+        """
+        supplier = self._movement_parties(transaction_type, employee, supplier)
+        lines = list(lines)
+        if not lines or not _text(employee):
+            raise ServiceError("أضف سطراً واحداً على الأقل واختر الموظف.")
+        names = [_text(name) for name, _ in lines]
+        item_ids = {name: self.refdata.id('items', self.refdata.match(name)) for name in names}
+        missing = [name for name, item_id in item_ids.items() if item_id is None]
+        if missing:
+            raise ServiceError("مواد غير موجودة: " + "، ".join(missing))
+        employee_id, supplier_id = self._party_ids(employee, supplier)
+        posted = [(item_ids[name], _integer(qty)) for name, (_, qty) in zip(names, lines)]
+        when = _moment(when)
+        self._check_open(when)
+
+        try:
+            with self._writing():
+                voucher_no = post_voucher(self.db, transaction_type, posted, employee_id, supplier_id, notes, when)
+        except VoucherError as e:
+            details = []
+            for line, _, reason, available in e.problems:
+                text = f"{names[line - 1]}: {VOUCHER_REASONS[reason]}"
+                if available is not None:
+                    text += f" (المتوفر: {available})"
+                details.append(text)
+            raise ServiceError("لم يتم ترحيل السند:\n" + "\n".join(details)) from None
+        # One refresh for the whole voucher
+        self.publish('items', ids=[item_id for item_id, _ in posted])
+        self.publish('transactions')
+        return voucher_no
+
+    def _movement_parties(self, transaction_type, employee, supplier):
+        # Returns the supplier that counts: receipts need one, issues have none
+        if transaction_type not in TRANSACTION_TYPES:
+            raise ServiceError("نوع الحركة غير صحيح.")
+        if transaction_type == 'ISSUE':
+            return None
+        if not _text(supplier):
+            raise ServiceError("حقل المورد مطلوب لحركة الاستلام.")
+        return supplier
+
+    def _check_open(self, when):
+        # Archived years are closed: their movements are fixed in the opening balances
+        start = live_start(self.db)
+        if when is not None and start is not None and when.strftime("%Y-%m-%d") < start:
+            raise ServiceError(f"لا يمكن الترحيل في سنة مالية مؤرشفة. أول تاريخ مفتوح: {start}")
+
+    def _party_ids(self, employee, supplier):
+        employee_id = self._master_id('employees', employee, "الموظف المحدد غير موجود.")
+        supplier_id = self._master_id('suppliers', supplier, "المورد المحدد غير موجود.") if supplier else None
+        return employee_id, supplier_id
+
+    # --- Imports ---
+    def import_rows(self, kind, rows, importer=None):
+        """Starts an import of `rows` (from a RowSource); returns (result, chunks).
+
+        Each step through `chunks` imports and commits one chunk, so a caller
+        can show progress or stop early. The touched tables are published
+        once the import ends or `chunks` is closed. An `importer` of the same
+        kind carries on an import begun earlier, with its name maps and result.
+        """
+        importer = importer or Importer(self.db, kind)
+        return importer.result, self._publishing(importer.chunks(rows), TOUCHED_TABLES[kind])
+
+    def _publishing(self, chunks, tables):
+        try:
+            yield from chunks
+        finally:
+            for table in tables:
+                self.publish(table)
+
+    def import_file(self, kind, path):
+        """Imports a whole CSV or XLSX file; returns the ImportResult."""
+        source = RowSource(path)
+        try:
+            result, chunks = self.import_rows(kind, source)
+            with self._writing():
+                for _ in chunks:
+                    pass
+        finally:
+            source.close()
+        return result
+
+    # --- Queries ---
+    def items(self):
+        return self.db.query(ITEMS_LIST_SQL)
+
+    def low_stock(self):
+        return self.db.query(LOW_STOCK_SQL)
+
+    def dashboard(self, day=None):
+        return load_dashboard_stats(self.db, day)
+
+    def stock_as_of(self, day):
+        try:
+            date.fromisoformat(day)
+        except ValueError:
+            raise ServiceError("التاريخ يجب أن يكون بالصيغة YYYY-MM-DD.") from None
+        return stock_as_of(self.db, day)
+
+    def search(self, text):
+        return search(self.db, text)
+
+    def export(self, report, path, fmt, filters=None, progress=None, cancel=None):
+        """Writes a report (see exporter.REPORTS) and returns the number of rows."""
+        return export(self.db, report, path, fmt, filters, progress, cancel)
+
+    # --- Maintenance ---
+    def close_periods(self, period=SNAPSHOT_PERIOD, max_periods=None, since=None):
+        """Writes the stock snapshots of the closed periods; returns how many."""
+        with self._writing():
+            return take_snapshots(self.db, period, max_periods, since)
+
+    def archive_years(self, today=None, progress=None):
+        """Moves the closed fiscal years into their archive files; returns [(year, movements moved)]."""
+        with self._writing():
+            moved = archive_closed_years(self.db, today, progress)
+        if moved:
+            self.publish('transactions')
+            self.publish('employees')
+        return moved
+
+    def rebuild_search_index(self):
+        with self._writing():
+            rebuild_search_index(self.db)
+
+    def optimize(self):
+        """Refreshes the planner statistics and folds the write-ahead log back into the file."""
+        with self._writing():
+            self.db.execute("PRAGMA optimize")
+            self.db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def check(self):
+        """Problems found by SQLite's integrity check and the query-plan check, as text."""
+        problems = [row[0] for row in self.db.query("PRAGMA integrity_check") if row[0] != 'ok']
+        problems += [f"{name}: {detail}" for name, detail in check_query_plans(self.db.conn)]
+        problems += [f"archive {year}: {file} is missing" for year, file in missing_archives(self.db)]
+        return problems
+
+
+def _master_messages(table):
+    # The table name goes into the SQL, so only the known ones pass
+    if table not in MASTER_MESSAGES:
+        raise ServiceError("جدول غير معروف.")
+    return MASTER_MESSAGES[table]
+
+
+def _text(value):
+    return '' if value is None else str(value).strip()
+
+
+def _required(value, message):
+    value = _text(value)
+    if not value:
+        raise ServiceError(message)
+    return value
+
+
+def _integer(value):
+    # Left for post_voucher to report when it is not a whole number
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return value
+
+
+def _moment(value):
+    # A posting time; RemoteService sends dates and times as ISO text
+    if value is None or isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day)
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise ServiceError("التاريخ يجب أن يكون بالصيغة YYYY-MM-DD.") from None
+
+
+def _positive(value, message):
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        raise ServiceError(message) from None
+    if value <= 0:
+        raise ServiceError(message)
+    return value
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""Period-end stock snapshots and the stock on hand as of any past date."""
+from datetime import date, timedelta
+
+from database import in_source, transaction_sources
+
+SNAPSHOT_PERIOD = 'monthly'     # or 'daily'
+SNAPSHOT_CATCHUP = 3            # periods the app closes by itself at startup
+
+# Net stock change per item over [:start, :end), walked along idx_transactions_date.
+# Opening balances left by archive.py are not movements and are skipped.
+NET_MOVEMENTS_SQL = '''
+SELECT item_id, SUM(CASE transaction_type WHEN 'RECEIVE' THEN quantity ELSE -quantity END)
+FROM transactions
+WHERE transaction_date >= :start AND transaction_date < :end AND opening_year IS NULL
+GROUP BY item_id
+'''
+
+# The same for one item, along idx_transactions_item_date
+ITEM_NET_MOVEMENTS_SQL = '''
+SELECT SUM(CASE transaction_type WHEN 'RECEIVE' THEN quantity ELSE -quantity END)
+FROM transactions
+WHERE item_id = :item_id AND transaction_date >= :start AND transaction_date < :end AND opening_year IS NULL
+'''
+
+ITEMS_AS_OF_SQL = '''
+SELECT i.id, i.name, c.name, u.name
+FROM items i
+LEFT JOIN categories c ON i.category_id = c.id
+LEFT JOIN units u ON i.unit_id = u.id
+ORDER BY i.name
+'''
+
+_END_OF_TIME = '9999-12-31'
+
+
+def period_ends(first, last, period=SNAPSHOT_PERIOD):
+    """The last day of every period that ends between `first` and `last` (dates)."""
+    ends = []
+    day = first
+    while day <= last:
+        if period == 'daily':
+            end = day
+        else:
+            end = (day.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+        if end <= last:
+            ends.append(end)
+        day = end + timedelta(days=1)
+    return ends
+
+
+def _net(db, start, end=_END_OF_TIME):
+    # Summed over the live table and any archived year the range reaches into
+    net = {}
+    for schema in transaction_sources(db, start, end):
+        for item_id, change in db.query(in_source(NET_MOVEMENTS_SQL, schema), {'start': start, 'end': end}):
+            net[item_id] = net.get(item_id, 0) + change
+    return net
+
+
+def _item_net(db, item_id, start, end=_END_OF_TIME):
+    params = {'item_id': item_id, 'start': start, 'end': end}
+    return sum(db.scalar(in_source(ITEM_NET_MOVEMENTS_SQL, schema), params) or 0
+               for schema in transaction_sources(db, start, end))
+
+
+def first_movement_day(db):
+    """The day of the earliest movement, archived or live, or None for an empty ledger."""
+    for schema in transaction_sources(db):
+        first = db.scalar(in_source("SELECT MIN(transaction_date) FROM transactions", schema))
+        if first is not None:
+            return date.fromisoformat(first[:10])
+    return None
+
+
+def _next_day(day):
+    return (day + timedelta(days=1)).isoformat()
+
+
+def take_snapshots(db, period=SNAPSHOT_PERIOD, max_periods=None, since=None, today=None):
+    """Writes the closing balances of the periods closed since the last snapshot.
+
+    Balances are worked out backwards from items.quantity, one period's
+    movements at a time, so each period costs what was posted in it.
+    `max_periods` keeps only the most recent ones; `since` (a date) starts
+    from there instead of the last snapshot, to backfill history. Returns
+    the number of periods written.
+    """
+    today = today or date.today()
+    if since is None:
+        last = db.scalar("SELECT MAX(period_end) FROM stock_snapshots")
+        if last is not None:
+            since = date.fromisoformat(last) + timedelta(days=1)
+        else:
+            since = first_movement_day(db)
+            if since is None:
+                return 0
+    ends = period_ends(since, today - timedelta(days=1), period)
+    if max_periods is not None:
+        ends = ends[-max_periods:]
+    if not ends:
+        return 0
+
+    with db.transaction(immediate=True):
+        balances = dict(db.query("SELECT id, quantity FROM items"))
+        upper = _END_OF_TIME
+        for end in reversed(ends):
+            start = _next_day(end)
+            for item_id, net in _net(db, start, upper).items():
+                if item_id in balances:
+                    balances[item_id] -= net
+            db.executemany("INSERT OR REPLACE INTO stock_snapshots (period_end, item_id, quantity) VALUES (?, ?, ?)",
+                           [(end.isoformat(), item_id, quantity) for item_id, quantity in balances.items()])
+            upper = start
+    return len(ends)
+
+
+def stock_as_of(db, day, today=None):
+    """Every item's stock at the end of `day` ('YYYY-MM-DD').
+
+    Starts from whichever is nearest to `day`: the snapshot before it, the
+    snapshot after it, or today's stock, and applies only the movements in
+    between. Returns (rows, base) where rows are (id, name, category, unit,
+    quantity) by name and base is the snapshot day used, or None for today's
+    stock. Items with no row in that snapshot are worked out from today's.
+    """
+    target = date.fromisoformat(day)
+    today = today or date.today()
+    end = _next_day(target)
+    before = db.scalar("SELECT MAX(period_end) FROM stock_snapshots WHERE period_end <= ?", (day,))
+    after = db.scalar("SELECT MIN(period_end) FROM stock_snapshots WHERE period_end > ?", (day,))
+    candidates = [(abs((today - target).days), None)]
+    for snapshot in (before, after):
+        if snapshot is not None:
+            candidates.append((abs((date.fromisoformat(snapshot) - target).days), snapshot))
+    base = min(candidates, key=lambda candidate: candidate[0])[1]
+
+    live = dict(db.query("SELECT id, quantity FROM items"))
+    if base is None:
+        balances = live
+        for item_id, net in _net(db, end).items():
+            if item_id in balances:
+                balances[item_id] -= net
+    else:
+        balances = dict(db.query("SELECT item_id, quantity FROM stock_snapshots WHERE period_end = ?", (base,)))
+        base_end = _next_day(date.fromisoformat(base))
+        if base <= day:
+            delta, sign = _net(db, base_end, end), 1
+        else:
+            delta, sign = _net(db, end, base_end), -1
+        for item_id, net in delta.items():
+            if item_id in balances:
+                balances[item_id] += sign * net
+        for item_id in live.keys() - balances.keys():
+            balances[item_id] = live[item_id] - _item_net(db, item_id, end)
+
+    rows = [(item_id, name, category, unit, balances.get(item_id, 0))
+            for item_id, name, category, unit in db.query(ITEMS_AS_OF_SQL)]
+    return rows, base
+
+
+if __name__ == "__main__":
+    # python snapshots.py [--daily] [--backfill] [--as-of YYYY-MM-DD] [--db path]
+    import argparse
+    import time
+    from database import DB_NAME, Database, setup_database
+
+    parser = argparse.ArgumentParser(description="Write stock snapshots or show stock as of a date")
+    parser.add_argument('--db', default=DB_NAME)
+    parser.add_argument('--daily', action='store_true', help="snapshot every day instead of every month")
+    parser.add_argument('--backfill', action='store_true', help="cover the whole ledger, not just new periods")
+    parser.add_argument('--as-of', help="print the stock at the end of this day")
+    args = parser.parse_args()
+
+    setup_database(args.db)
+    db = Database(args.db)
+    try:
+        started = time.perf_counter()
+        since = first_movement_day(db) if args.backfill else None
+        written = take_snapshots(db, 'daily' if args.daily else 'monthly', since=since)
+        print(f"{written} periods written in {time.perf_counter() - started:.2f} s")
+        if args.as_of:
+            started = time.perf_counter()
+            rows, base = stock_as_of(db, args.as_of)
+            for item_id, name, category, unit, quantity in rows:
+                print(f"{item_id}\t{name}\t{quantity}")
+            print(f"{len(rows)} items from {base or 'current stock'} in {time.perf_counter() - started:.3f} s")
+    finally:
+        db.close()
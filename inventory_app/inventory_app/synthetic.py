@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""Synthetic inventory databases of any size, built through the real schema, for benchmarks.
+
+    python synthetic.py out.db [--size small|medium|large] [--items N] [--transactions N] ...
+
+Everything is written by the app's own schema and triggers, so the summary
+tables, search indexes and snapshots come out as the app would have made
+them. Stock never goes negative: an issue that the item cannot cover is
+posted as a restocking receipt instead, and each item's final quantity is
+the sum of its movements.
+"""
+import itertools
+import os
+import random
+import time
+from datetime import date, datetime, timedelta
+
+from database import Database, setup_database
+from snapshots import take_snapshots
+
+# Named sizes; 'large' is the scale the app is expected to stay usable at
+SIZES = {
+    'small': {'items': 2000, 'categories': 50, 'transactions': 100_000},
+    'medium': {'items': 10_000, 'categories': 200, 'transactions': 1_000_000},
+    'large': {'items': 50_000, 'categories': 500, 'transactions': 5_000_000},
+}
+INSERT_BATCH = 20_000       # movement rows per transaction
+NOTES_SHARE = 0.1           # movements that carry a note
+POPULARITY = 1.0            # Zipf exponent: a few items move far more often than the rest
+
+NOUNS = ('قفازات', 'أنابيب اختبار', 'دورق', 'كأس زجاجي', 'ماصة', 'سحاحة', 'ورق ترشيح', 'قمع',
+         'كحول إيثيلي', 'حمض الهيدروكلوريك', 'هيدروكسيد الصوديوم', 'كبريتات النحاس', 'نترات الفضة',
+         'شرائح مجهر', 'أغطية شرائح', 'مقياس حرارة', 'ميزان رقمي', 'مصباح بنزن', 'حامل أنابيب',
+         'ملقط', 'مشرط', 'كمامات', 'نظارات واقية', 'معطف مختبر', 'ورق عباد الشمس', 'محلول منظم',
+         'أسلاك توصيل', 'مقاومات', 'بطاريات', 'مكثفات', 'لوحة تجارب', 'أقلام سبورة', 'ورق طباعة',
+         'حبر طابعة', 'دفاتر', 'ملفات', 'مشابك ورق', 'منظف زجاج', 'مناديل ورقية', 'أكياس نفايات')
+QUALIFIERS = ('زجاجي', 'بلاستيك', 'صغير', 'كبير', 'متوسط', 'معقم', 'مقاوم للحرارة', 'مدرج',
+              'نقي', 'تجاري', 'أزرق', 'أبيض', 'شفاف', 'مستورد', 'محلي', 'عالي الدقة')
+SIZES_TEXT = ('10 مل', '50 مل', '100 مل', '250 مل', '500 مل', '1 لتر', '5 لتر', '100 غرام',
+              '500 غرام', '1 كغ', 'عبوة 10', 'عبوة 50', 'عبوة 100', 'مقاس M', 'مقاس L')
+DEPARTMENTS = ('الكيمياء', 'الفيزياء', 'الأحياء', 'الحاسوب', 'الرياضيات', 'الجيولوجيا', 'الإلكترونيات',
+               'الميكانيك', 'الصيدلة', 'المختبرات الطبية', 'البيئة', 'الكهرباء', 'الشبكات', 'الإدارة',
+               'المكتبة', 'الصيانة', 'النظافة', 'السلامة', 'التصوير', 'الطباعة', 'الرياضة', 'المطبخ',
+               'السكن', 'النقل', 'الاستقبال')
+KINDS = ('مستهلكات', 'أدوات', 'أجهزة', 'مواد كيميائية', 'زجاجيات', 'قرطاسية', 'قطع غيار', 'معدات وقاية',
+         'منظفات', 'أثاث', 'كتب', 'برمجيات', 'عينات', 'محاليل', 'كابلات', 'عدد يدوية', 'أوعية',
+         'أغذية', 'ملابس', 'متفرقات')
+UNITS = ('قطعة', 'علبة', 'كرتون', 'عبوة', 'لتر', 'مل', 'كغ', 'غرام', 'رزمة', 'زوج', 'متر', 'لفة')
+FIRST_NAMES = ('أحمد', 'محمد', 'علي', 'عمر', 'خالد', 'سارة', 'فاطمة', 'مريم', 'يوسف', 'ليلى',
+               'حسن', 'نور', 'سلمى', 'إبراهيم', 'هدى', 'طارق', 'رنا', 'سامي', 'دينا', 'ماجد')
+LAST_NAMES = ('العلي', 'الحسن', 'السعدي', 'النجار', 'الخطيب', 'الحداد', 'المصري', 'الشامي',
+              'البكري', 'العمري', 'الزين', 'القاسم', 'الرفاعي', 'التميمي', 'الجبوري')
+POSITIONS = ('أمين مخزن', 'فني مختبر', 'محاضر', 'مشرف', 'موظف إداري')
+NOTES = ('صرف لمختبر {dept}', 'استلام حسب أمر الشراء رقم {n}', 'تحويل إلى قسم {dept}',
+         'عهدة للمحاضرة العملية', 'تالف أثناء التجربة', 'طلب عاجل من رئيس قسم {dept}',
+         'جرد دوري', 'مرتجع من قسم {dept}', 'دفعة مشروع تخرج رقم {n}')
+
+
+def _names(count, make):
+    # The first `count` distinct names from make(n), n = 0, 1, ...
+    names, seen = [], set()
+    for n in itertools.count():
+        if len(names) == count:
+            return names
+        name = make(n)
+        if name not in seen:
+            seen.add(name)
+            names.append(name)
+
+
+def _numbered(words, n):
+    # words[n], then the same words again with a number once they run out
+    cycle = n // len(words)
+    return words[n % len(words)] + (f" {cycle + 1}" if cycle else '')
+
+
+def _pair(first, second, n):
+    # Every combination of first x second, numbered once they run out
+    cycle = n // (len(first) * len(second))
+    return f"{first[n % len(first)]} {second[n // len(first) % len(second)]}" + (f" {cycle + 1}" if cycle else '')
+
+
+def _item_name(n, rng):
+    # Catalogue-style names; the number keeps them unique at any size
+    return f"{rng.choice(NOUNS)} {rng.choice(QUALIFIERS)} {rng.choice(SIZES_TEXT)} - {n + 1:05d}"
+
+
+def generate(path, items=2000, categories=50, transactions=100_000, units=len(UNITS), suppliers=200,
+             employees=100, years=3, seed=1, snapshots=True, progress=print):
+    """Builds a new database at `path`; returns a dict of row counts and timings.
+
+    Movements are spread over the last `years` years up to yesterday, in date
+    order, on working days between 08:00 and 15:00.
+    """
+    if os.path.exists(path):
+        raise FileExistsError(path)
+    rng = random.Random(seed)
+    started = time.perf_counter()
+    timings = {}
+    setup_database(path)
+    db = Database(path)
+    try:
+        with db.transaction(immediate=True):
+            db.executemany("INSERT INTO categories (name) VALUES (?)",
+                           [(name,) for name in _names(categories, lambda n: _pair(KINDS, DEPARTMENTS, n))])
+            db.executemany("INSERT INTO units (name) VALUES (?)",
+                           [(name,) for name in _names(units, lambda n: _numbered(UNITS, n))])
+            db.executemany("INSERT INTO suppliers (name, contact_info) VALUES (?, ?)",
+                           [(name, f"07{rng.randrange(10 ** 8):08d}") for name in _names(
+                               suppliers, lambda n: f"شركة {rng.choice(LAST_NAMES)[2:]} للتجهيزات {n + 1}")])
+            db.executemany("INSERT INTO employees (name, position) VALUES (?, ?)",
+                           [(name, rng.choice(POSITIONS)) for name in _names(
+                               employees, lambda n: _pair(FIRST_NAMES, LAST_NAMES, n))])
+            category_ids = [row[0] for row in db.query("SELECT id FROM categories")]
+            unit_ids = [row[0] for row in db.query("SELECT id FROM units")]
+            supplier_ids = [row[0] for row in db.query("SELECT id FROM suppliers")]
+            employee_ids = [row[0] for row in db.query("SELECT id FROM employees")]
+
+            item_rows = []
+            for n in range(items):
+                reorder_level = rng.choice((5, 10, 10, 20, 25, 50))
+                max_level = reorder_level * rng.choice((3, 4, 5)) if rng.random() < 0.7 else None
+                item_rows.append((_item_name(n, rng), f"{rng.choice(KINDS)} - {rng.choice(DEPARTMENTS)}",
+                                  rng.choice(category_ids), rng.choice(unit_ids), reorder_level, max_level))
+            db.executemany('''
+                INSERT INTO items (name, description, quantity, category_id, unit_id, reorder_level, max_level)
+                VALUES (?, ?, 0, ?, ?, ?, ?)
+            ''', item_rows)
+            items_info = db.query("SELECT id, reorder_level, COALESCE(max_level, reorder_level * 4) FROM items")
+        timings['masters_s'] = time.perf_counter() - started
+
+        written = _write_movements(db, rng, transactions, years, items_info, supplier_ids, employee_ids, progress)
+        timings['movements_s'] = time.perf_counter() - started - timings['masters_s']
+
+        if snapshots and transactions:
+            mark = time.perf_counter()
+            first = db.scalar("SELECT MIN(transaction_date) FROM transactions")
+            take_snapshots(db, since=date.fromisoformat(first[:10]))
+            timings['snapshots_s'] = time.perf_counter() - mark
+        db.execute("ANALYZE")
+    finally:
+        db.close()
+    timings['total_s'] = time.perf_counter() - started
+    return {'items': items, 'categories': categories, 'transactions': written, **timings}
+
+
+def _write_movements(db, rng, count, years, items_info, supplier_ids, employee_ids, progress):
+    item_ids = [item_id for item_id, _, _ in items_info]
+    restock = {item_id: max_level for item_id, _, max_level in items_info}
+    rng.shuffle(item_ids)
+    weights = list(itertools.accumulate(1 / (rank ** POPULARITY) for rank in range(1, len(item_ids) + 1)))
+    balance = dict.fromkeys(item_ids, 0)
+
+    today = date.today()
+    days = [day for day in (today - timedelta(days=n) for n in range(years * 365, 0, -1))
+            if day.weekday() not in (4, 5)]     # Friday and Saturday off
+    per_day = count / len(days) if days else 0
+    carry = 0.0
+    batch, written = [], 0
+    sql = '''
+        INSERT INTO transactions (item_id, quantity, transaction_type, transaction_date, employee_id, supplier_id, notes)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    '''
+    for day in days:
+        carry += per_day
+        today_count = int(carry) if day != days[-1] else count - written - len(batch)
+        carry -= today_count
+        opening = datetime(day.year, day.month, day.day, 8)
+        seconds = sorted(rng.randrange(7 * 3600) for _ in range(today_count))
+        for item_id, second in zip(rng.choices(item_ids, cum_weights=weights, k=today_count), seconds):
+            stamp = (opening + timedelta(seconds=second)).strftime("%Y-%m-%d %H:%M:%S")
+            qty = rng.randint(1, 10)
+            if balance[item_id] >= qty and rng.random() < 0.85:
+                kind, supplier_id = 'ISSUE', None
+                balance[item_id] -= qty
+            else:
+                kind, supplier_id = 'RECEIVE', rng.choice(supplier_ids)
+                qty = max(restock[item_id] - balance[item_id], qty)
+                balance[item_id] += qty
+            notes = None
+            if rng.random() < NOTES_SHARE:
+                notes = rng.choice(NOTES).format(dept=rng.choice(DEPARTMENTS), n=rng.randint(100, 9999))
+            batch.append((item_id, qty, kind, stamp, rng.choice(employee_ids), supplier_id, notes))
+            if len(batch) == INSERT_BATCH:
+                with db.transaction(immediate=True):
+                    db.executemany(sql, batch)
+                written += len(batch)
+                batch = []
+                if progress is not None:
+                    progress(f"{written} / {count} movements")
+    if batch:
+        with db.transaction(immediate=True):
+            db.executemany(sql, batch)
+        written += len(batch)
+    with db.transaction(immediate=True):
+        db.executemany("UPDATE items SET quantity = ? WHERE id = ?",
+                       [(quantity, item_id) for item_id, quantity in balance.items()])
+    return written
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Build a synthetic inventory database")
+    parser.add_argument('path')
+    parser.add_argument('--size', choices=sorted(SIZES), default='small')
+    parser.add_argument('--items', type=int)
+    parser.add_argument('--categories', type=int)
+    parser.add_argument('--transactions', type=int)
+    parser.add_argument('--years', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--no-snapshots', action='store_true')
+    args = parser.parse_args()
+
+    size = dict(SIZES[args.size])
+    size.update({key: getattr(args, key) for key in size if getattr(args, key) is not None})
+    summary = generate(args.path, years=args.years, seed=args.seed, snapshots=not args.no_snapshots,
+                       progress=lambda text: print(text, end='\r', flush=True), **size)
+    print(json.dumps(summary, indent=2))
@@ -0,0 +1,6 @@
+# -*- coding: utf-8 -*-
+"""The app's modules import each other by name; the tests import them the same way."""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+"""Concurrent postings from several processes neither lose stock nor overdraw it."""
+from database import Database
+from movements import stress_test
+
+
+def test_concurrent_postings_keep_stock_exact(tmp_path):
+    path = str(tmp_path / 'stress.db')
+    # Few items and little stock, so issues race each other for the last units
+    assert stress_test(path, processes=3, posts=40, items=2, opening=5) == []
+    db = Database(path)
+    try:
+        assert db.scalar("SELECT COUNT(*) FROM items WHERE quantity < 0") == 0
+    finally:
+        db.close()
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+"""The hot queries keep to their indexes on a freshly migrated database."""
+import re
+
+import pytest
+
+from database import HOT_QUERIES, _table_aliases, check_query_plans, connect, setup_database
+
+
+@pytest.fixture
+def conn(tmp_path):
+    path = str(tmp_path / 'plans.db')
+    setup_database(path)
+    conn = connect(path)
+    yield conn
+    conn.close()
+
+
+def test_check_query_plans_finds_nothing(conn):
+    assert check_query_plans(conn) == []
+
+
+@pytest.mark.parametrize('name', sorted(HOT_QUERIES))
+def test_no_hot_query_scans_transactions(conn, name):
+    # Walking an index in order is fine; reading the whole table is not
+    sql, params = HOT_QUERIES[name]
+    aliases = _table_aliases(sql)
+    scans = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params)
+             if (scan := re.match(r'SCAN (?:TABLE )?(\w+)(?: AS (\w+))?$', row[3]))
+             and aliases.get(scan.group(2) or scan.group(1), scan.group(1)) == 'transactions']
+    assert scans == []
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+"""The server under load from several client processes, and its token check."""
+import pytest
+
+from client import RemoteDatabase, RemoteError
+from database import setup_database
+from server import InventoryServer, load_test
+
+
+def test_load_test_finds_no_problems(tmp_path):
+    assert load_test(str(tmp_path / 'load.db'), clients=2, seconds=1.0, items=5, opening=20) == []
+
+
+def test_requests_without_the_token_are_refused(tmp_path):
+    path = str(tmp_path / 'server.db')
+    setup_database(path)
+    server = InventoryServer(path, port=0, readers=1, token='secret')
+    url = server.start_in_thread()
+    try:
+        for token in ('', 'wrong'):
+            db = RemoteDatabase(url, token)
+            with pytest.raises(RemoteError):
+                db.query("SELECT 1")
+            db.close()
+        db = RemoteDatabase(url, 'secret')
+        assert db.query("SELECT 1") == [(1,)]
+        db.close()
+    finally:
+        server.close()
@@ -0,0 +1,349 @@
+# -*- coding: utf-8 -*-
+"""Reusable Treeview and Combobox helpers shared by the app's tabs."""
+from bisect import bisect_right
+from collections import deque
+
+
+class TreeSync:
+    """Keeps a flat Treeview in step with keyed rows by applying only the differences.
+
+    Each row is shown under the iid str(key(row)), so selection, focus and
+    scroll position survive a refresh. sync() takes a complete, ordered
+    query result; apply() takes just the rows that changed and places them
+    by sort_key.
+    """
+
+    def __init__(self, tree, key=lambda row: row[0], format_row=tuple, sort_key=None):
+        self.tree = tree
+        self.key = key
+        self.format_row = format_row
+        self.sort_key = sort_key
+        self._values = {}
+        self._sort_keys = {}
+        self._order = []
+        self._sorted = None     # sort keys in the order of _order, built for apply() and kept in step
+
+    def __len__(self):
+        return len(self._order)
+
+    def clear(self):
+        if self._order:
+            self.tree.delete(*self._order)
+        self._values.clear()
+        self._sort_keys.clear()
+        self._order = []
+        self._sorted = None
+
+    def sync(self, rows):
+        """Makes the tree show exactly `rows`, in their order."""
+        tree = self.tree
+        rows = list(rows)
+        new_order = [str(self.key(row)) for row in rows]
+        self._sorted = None
+
+        wanted = set(new_order)
+        stale = [iid for iid in self._order if iid not in wanted]
+        if stale:
+            tree.delete(*stale)
+            for iid in stale:
+                del self._values[iid]
+                self._sort_keys.pop(iid, None)
+            self._order = [iid for iid in self._order if iid in wanted]
+
+        kept = [iid for iid in new_order if iid in self._values]
+        if self._order != kept:
+            self._reorder(kept)
+
+        # The rows already shown are now in order; slot the new ones in between.
+        for index, (iid, row) in enumerate(zip(new_order, rows)):
+            values = tuple(self.format_row(row))
+            old = self._values.get(iid)
+            if old is None:
+                tree.insert('', index, iid=iid, values=values)
+                self._order.insert(index, iid)
+            elif old != values:
+                tree.item(iid, values=values)
+            self._values[iid] = values
+            if self.sort_key is not None:
+                self._sort_keys[iid] = self.sort_key(row)
+
+    def apply(self, changed=(), deleted=()):
+        """Inserts or updates the `changed` rows and removes the `deleted` keys."""
+        tree = self.tree
+        for key in deleted:
+            iid = str(key)
+            if iid in self._values:
+                tree.delete(iid)
+                del self._values[iid]
+                self._sort_keys.pop(iid, None)
+                self._remove(iid)
+        for row in changed:
+            iid = str(self.key(row))
+            values = tuple(self.format_row(row))
+            sort_key = self.sort_key(row) if self.sort_key is not None else None
+            old = self._values.get(iid)
+            if old is not None and (self.sort_key is None or self._sort_keys[iid] == sort_key):
+                if old != values:
+                    tree.item(iid, values=values)
+                self._values[iid] = values
+                continue
+            if old is not None:
+                self._remove(iid)
+            if self.sort_key is None:
+                index = len(self._order)
+            else:
+                if self._sorted is None:
+                    self._sorted = [self._sort_keys[i] for i in self._order]
+                index = bisect_right(self._sorted, sort_key)
+                self._sorted.insert(index, sort_key)
+                self._sort_keys[iid] = sort_key
+            if old is None:
+                tree.insert('', index, iid=iid, values=values)
+            else:
+                if old != values:
+                    tree.item(iid, values=values)
+                tree.move(iid, '', index)
+            self._order.insert(index, iid)
+            self._values[iid] = values
+
+    def _remove(self, iid):
+        index = self._order.index(iid)
+        del self._order[index]
+        if self._sorted is not None:
+            del self._sorted[index]
+
+    def _reorder(self, new_order):
+        # Rows on the longest run already in the right relative order stay
+        # put; every other row is moved once, right after its new predecessor.
+        position = {iid: i for i, iid in enumerate(self._order)}
+        keep = _longest_increasing_run([position[iid] for iid in new_order])
+        order = list(self._order)
+        for i, iid in enumerate(new_order):
+            if i in keep:
+                continue
+            order.remove(iid)
+            index = order.index(new_order[i - 1]) + 1 if i else 0
+            order.insert(index, iid)
+            self.tree.move(iid, '', index)
+        self._order = order
+        self._sorted = None
+
+
+def _longest_increasing_run(seq):
+    """Returns the indexes of one longest strictly increasing subsequence."""
+    tails = []      # tails[k]: index in seq of the smallest tail of a run of length k+1
+    previous = [-1] * len(seq)
+    for i, value in enumerate(seq):
+        lo, hi = 0, len(tails)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if seq[tails[mid]] < value:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo:
+            previous[i] = tails[lo - 1]
+        if lo == len(tails):
+            tails.append(i)
+        else:
+            tails[lo] = i
+    keep = set()
+    i = tails[-1] if tails else -1
+    while i != -1:
+        keep.add(i)
+        i = previous[i]
+    return keep
+
+
+class PagedTreeview:
+    """Shows a sliding window over a long, keyset-ordered result in a Treeview.
+
+    Only `max_rows` rows are ever held in the tree. Scrolling near the bottom
+    fetches the next page of older rows and drops rows from the top;
+    scrolling back to the top fetches newer rows again and drops rows from
+    the bottom. Pages are fetched by key, so the cost of a page does not
+    depend on how far into the result it is. The tree is updated through a
+    TreeSync, so a reload only touches rows that actually changed.
+
+    Pages are read on the QueryExecutor's workers; a reload supersedes any
+    page still being fetched.
+
+    fetch_first(db, limit)       -> first page of rows
+    fetch_older(db, key, limit)  -> rows after `key`, in display order
+    fetch_newer(db, key, limit)  -> rows before `key`, nearest first
+    fetch_rows(db, keys)         -> the rows with these keys, in any order;
+                                    only needed for refresh_rows()
+    row_key(row)                 -> the keyset key of a row
+    format_row(row)              -> the values shown for a row
+    """
+
+    def __init__(self, tree, executor, fetch_first, fetch_older, fetch_newer, row_key, format_row,
+                 key=lambda row: row[0], page_size=100, max_rows=300, scrollbar=None, fetch_rows=None):
+        self.tree = tree
+        self.executor = executor
+        self.fetch_first = fetch_first
+        self.fetch_older = fetch_older
+        self.fetch_newer = fetch_newer
+        self.fetch_rows = fetch_rows
+        self.row_key = row_key
+        self.page_size = page_size
+        self.max_rows = max(max_rows, 2 * page_size)
+        self.scrollbar = scrollbar
+        self.has_older = False
+        self.has_newer = False
+        self.sync = TreeSync(tree, key=key, format_row=format_row)
+        self._rows = deque()
+        self._pending = None
+        tree.configure(yscrollcommand=self._on_scroll)
+        if scrollbar is not None:
+            scrollbar.configure(command=tree.yview)
+
+    def reload(self):
+        """Shows the first page again, keeping rows that are still on it."""
+        self._cancel_pending()
+        self._fetch(self.fetch_first, self._show_first, self.page_size)
+
+    def refresh_rows(self):
+        """Re-reads the rows in the window where they are, for a change that moves none of them.
+
+        A page already being fetched reads the change itself, so nothing
+        more is asked for then.
+        """
+        if not self._rows or self.executor.is_pending(self):
+            return
+        keys = [self.sync.key(row) for row in self._rows]
+        self.executor.submit(self, self.fetch_rows, self._show_refreshed, keys, busy=self.tree)
+
+    def _show_refreshed(self, rows):
+        fresh = {self.sync.key(row): row for row in rows}
+        self._rows = deque(fresh[key] for key in map(self.sync.key, self._rows) if key in fresh)
+        self.sync.sync(self._rows)
+
+    def show_around(self, fetch_row, on_shown):
+        """Shows the row fetch_row(db) returns, with half a page of newer rows above it.
+
+        on_shown(row) is called once the rows are in the tree, with None if
+        there was no such row. Like a reload, it supersedes pages in flight.
+        """
+        self._cancel_pending()
+        self.executor.submit(self, lambda db: self._read_around(db, fetch_row),
+                             lambda found: self._show_around(found, on_shown), busy=self.tree)
+
+    def _cancel_pending(self):
+        if self._pending:
+            self.tree.after_cancel(self._pending)
+            self._pending = None
+
+    def _read_around(self, db, fetch_row):
+        row = fetch_row(db)
+        if row is None:
+            return None, [], []
+        key = self.row_key(row)
+        return row, self.fetch_newer(db, key, self.page_size // 2), self.fetch_older(db, key, self.page_size)
+
+    def _show_around(self, found, on_shown):
+        row, newer, older = found
+        if row is not None:
+            self._rows = deque([*reversed(newer), row, *older])
+            self.has_newer = len(newer) == self.page_size // 2
+            self.has_older = len(older) == self.page_size
+            self.sync.sync(self._rows)
+        on_shown(row)
+
+    def _show_first(self, rows):
+        scrolled = self.has_newer
+        self._rows = deque(rows)
+        self.has_older = len(self._rows) == self.page_size
+        self.has_newer = False
+        self.sync.sync(self._rows)
+        if scrolled:
+            self.tree.yview_moveto(0)
+
+    def load_older(self):
+        self._pending = None
+        if not self.has_older or not self._rows:
+            return
+        self._fetch(self.fetch_older, self._show_older, self.row_key(self._rows[-1]), self.page_size)
+
+    def _show_older(self, rows):
+        self.has_older = len(rows) == self.page_size
+        self._rows.extend(rows)
+        excess = len(self._rows) - self.max_rows
+        first = self.tree.yview()[0]
+        total = len(self.sync)
+        if excess > 0:
+            for _ in range(excess):
+                self._rows.popleft()
+            self.has_newer = True
+        self.sync.sync(self._rows)
+        if excess > 0:
+            self.tree.yview_moveto(max(0.0, (first * total - excess) / len(self._rows)))
+
+    def load_newer(self):
+        self._pending = None
+        if not self.has_newer or not self._rows:
+            return
+        self._fetch(self.fetch_newer, self._show_newer, self.row_key(self._rows[0]), self.page_size)
+
+    def _show_newer(self, rows):
+        self.has_newer = len(rows) == self.page_size
+        first = self.tree.yview()[0]
+        total = len(self.sync)
+        self._rows.extendleft(rows)
+        excess = len(self._rows) - self.max_rows
+        if excess > 0:
+            for _ in range(excess):
+                self._rows.pop()
+            self.has_older = True
+        self.sync.sync(self._rows)
+        if rows:
+            self.tree.yview_moveto((first * total + len(rows)) / len(self._rows))
+
+    def _fetch(self, fetch, show, *args):
+        self.executor.submit(self, fetch, show, *args, busy=self.tree)
+
+    def _on_scroll(self, first, last):
+        if self.scrollbar is not None:
+            self.scrollbar.set(first, last)
+        if self._pending or self.executor.is_pending(self):
+            return
+        if float(last) >= 0.95 and self.has_older:
+            self._pending = self.tree.after_idle(self.load_older)
+        elif float(first) <= 0.05 and self.has_newer:
+            self._pending = self.tree.after_idle(self.load_newer)
+
+
+# Keys that move through the text or the drop-down without changing what was typed
+_NAVIGATION_KEYS = {'Up', 'Down', 'Left', 'Right', 'Home', 'End', 'Prior', 'Next', 'Tab', 'Escape',
+                    'Return', 'KP_Enter', 'Shift_L', 'Shift_R', 'Control_L', 'Control_R', 'Alt_L', 'Alt_R'}
+
+
+class TypeAhead:
+    """Turns a ttk.Combobox into a search-as-you-type picker.
+
+    The drop-down never holds the whole table, only what search(text)
+    returns for the text typed so far; Return completes to the first match.
+    The caller still checks that the final text names a real row.
+    """
+
+    def __init__(self, combobox, search):
+        self.combobox = combobox
+        self.search = search
+        self._text = None
+        combobox.configure(state='normal', postcommand=self.refresh)
+        combobox.bind('<KeyRelease>', self._on_key, add='+')
+        combobox.bind('<Return>', self._complete, add='+')
+
+    def refresh(self):
+        self._text = self.combobox.get()
+        self.combobox['values'] = self.search(self._text)
+
+    def _on_key(self, event):
+        if event.keysym not in _NAVIGATION_KEYS and self.combobox.get() != self._text:
+            self.refresh()
+
+    def _complete(self, event):
+        matches = self.search(self.combobox.get(), 1)
+        if matches:
+            self.combobox.set(matches[0])
+            self.combobox.icursor('end')